@@ -0,0 +1,86 @@
+# bench-lmc.py - Speed measurements for the LMC back-end.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+
+# Allow importing modules from the source directory
+here = os.path.dirname (os.path.abspath (__file__))
+sys.path.insert (0, os.path.join (here, '..'))
+
+from little_village import batch
+from little_village import compiler
+
+programs = os.path.join (here, '..', 'programs')
+
+# Each job is a program and the inputs it's run with.  The square program takes
+# about 9 instructions per unit of input.
+jobs = [ ('square', [999, 0]),
+         ('countdown', [999]) ]
+
+class Counting_Client (batch.Batch_Client):
+    '''A client that counts the instructions executed.'''
+    def __init__ (self):
+        batch.Batch_Client.__init__ (self)
+        self.steps = 0
+
+    def notify_step (self):
+        self.steps += 1
+        return True
+
+def count_steps (program, inputs):
+    client = Counting_Client ()
+    client.run (program, list (inputs))
+    return client.steps
+
+def time_run (client, program, inputs, fast, repeat):
+    '''Return the best time for running the program.'''
+    best = None
+    for i in range (repeat):
+        client.inputs = list (inputs)
+        client.outputs = []
+        client.computer.load (program)
+        start = time.perf_counter ()
+        client.computer.run (fast)
+        elapsed = time.perf_counter () - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main (repeat = 5):
+    # speedup compares fast to resume, and compiled compares the compiled
+    # engine to fast.
+    print ('%-12s %10s %14s %14s %14s %14s %8s %8s'
+           % ('program', 'steps', 'hooked/s', 'resume/s', 'fast/s',
+              'compiled/s', 'speedup', 'compiled'))
+    for (name, inputs) in jobs:
+        program = os.path.join (programs, name)
+        steps = count_steps (program, inputs)
+        hooked = time_run (Counting_Client (), program, inputs, None, repeat)
+        slow = time_run (batch.Batch_Client (), program, inputs, False, repeat)
+        fast = time_run (batch.Batch_Client (), program, inputs, True, repeat)
+        compiled = time_run (batch.Batch_Client (
+            computer_type = compiler.Compiled_LMC), program, inputs, True, repeat)
+        print ('%-12s %10d %14.0f %14.0f %14.0f %14.0f %7.1fx %7.1fx'
+               % (name, steps, steps / hooked, steps / slow, steps / fast,
+                  steps / compiled, slow / fast, fast / compiled))
+
+if __name__ == '__main__':
+    main ()
@@ -0,0 +1,128 @@
+# bench-opcodes.py - Time LMC.step() for each type of instruction.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+
+# Allow importing modules from the source directory
+here = os.path.dirname (os.path.abspath (__file__))
+sys.path.insert (0, os.path.join (here, '..'))
+
+from little_village import lmc
+
+class Chain_LMC (lmc.LMC):
+    '''An LMC that dispatches through an if/elif chain for comparison.
+
+    step() is LMC.step() with the handler table replaced by the chain, so that
+    both do the same checks for limits, profiling, tracing, history, and
+    breakpoints.  Keep it in step with LMC.step().
+    '''
+    def step (self):
+        if not self._can_do_step (): return False
+
+        if (self.counter in self.breakpoints and self.steps != self._break_step
+            and not self._break (lmc.LMC.BREAKPOINT, self.counter)):
+            self._break_step = self.steps
+            return False
+        if self.history:
+            self.history.rewind (self)
+        if self.steps >= self._next_check:
+            self._next_check = self._check_steps ()
+        self.steps += 1
+        address = self.counter
+        op, arg = self._decoded [address]
+        if self.profile:
+            self._profile_step (op, arg)
+        self.counter += 1
+        go_on = True
+        if op == lmc.LMC.HLT:
+            go_on = self._do_halt (arg)
+        elif op == lmc.LMC.ADD:
+            self._set_accumulator (self.accumulator + self.memory [arg])
+        elif op == lmc.LMC.SUB:
+            self._set_accumulator (self.accumulator - self.memory [arg])
+        elif op == lmc.LMC.STA:
+            self._store (arg, self.accumulator)
+        elif op == lmc.LMC.LDA:
+            self._set_accumulator (self.memory [arg])
+        elif op == lmc.LMC.BRA:
+            self.counter = arg
+        elif op == lmc.LMC.BRZ:
+            if self.accumulator == 0:
+                self.counter = arg
+        elif op == lmc.LMC.BRP:
+            if not self.negative:
+                self.counter = arg
+        elif op == lmc.LMC.IO:
+            go_on = self._do_io (arg)
+        if self.trace or self.history:
+            written = arg if op == lmc.LMC.STA else None
+            if self.trace:
+                self.trace.write (address, op, self.accumulator,
+                                  self.overflow, self.negative, written)
+            if self.history:
+                self.history.write (address, op, self.accumulator,
+                                    self.overflow, self.negative, written)
+        if go_on and (self.watched_cells or self.watched_values):
+            if op == lmc.LMC.STA and arg in self.watched_cells:
+                go_on = self._break (lmc.LMC.WATCH_CELL, arg)
+            elif (self.accumulator in self.watched_values
+                  and self._sets_accumulator (op, arg)):
+                go_on = self._break (lmc.LMC.WATCH_ACCUMULATOR,
+                                     self.accumulator)
+        return go_on
+
+# The instruction to fill memory with for each test.  Branches go to the next
+# cell.  STA writes to the data cell at 98.
+instructions = [ ('HLT', lambda i: 0),
+                 ('ADD', lambda i: 198),
+                 ('SUB', lambda i: 298),
+                 ('STA', lambda i: 398),
+                 ('LDA', lambda i: 598),
+                 ('BRA', lambda i: 600 + i + 1),
+                 ('BRZ', lambda i: 700 + i + 1),
+                 ('BRP', lambda i: 800 + i + 1),
+                 ('INP', lambda i: 901),
+                 ('OUT', lambda i: 902) ]
+
+def time_steps (computer_type, make_instruction, steps):
+    '''Return the time per step when memory is filled with an instruction.'''
+    computer = computer_type ()
+    for i in range (98):
+        computer.memory [i] = make_instruction (i)
+    computer.memory [98] = 0
+    computer.memory [99] = 600
+    computer.decode ()
+    step = computer.step
+    start = time.perf_counter ()
+    for i in range (steps):
+        step ()
+    return (time.perf_counter () - start) / steps
+
+def main (steps = 200000):
+    print ('%-6s %12s %12s %8s' % ('op', 'chain ns', 'table ns', 'speedup'))
+    for (name, make_instruction) in instructions:
+        chain = time_steps (Chain_LMC, make_instruction, steps)
+        table = time_steps (lmc.LMC, make_instruction, steps)
+        print ('%-6s %12.1f %12.1f %7.2fx'
+               % (name, chain*1e9, table*1e9, chain/table))
+
+if __name__ == '__main__':
+    main ()
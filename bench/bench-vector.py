@@ -0,0 +1,70 @@
+# bench-vector.py - Compare lockstep execution with one client per input.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import random
+import sys
+import time
+
+# Allow importing modules from the source directory
+here = os.path.dirname (os.path.abspath (__file__))
+sys.path.insert (0, os.path.join (here, '..'))
+
+from little_village import batch
+from little_village import vector
+
+programs = os.path.join (here, '..', 'programs')
+
+def run_clients (program, inputs):
+    '''Run the program once for each input list with a Batch_Client.'''
+    results = []
+    client = batch.Batch_Client ()
+    for lane in inputs:
+        client.outputs = []
+        try:
+            client.run (program, list (lane))
+        except Exception as error:
+            results.append ((client.outputs, error))
+        else:
+            results.append ((client.outputs, None))
+    return results
+
+def main (lanes = 10000):
+    random.seed (1)
+    program = os.path.join (programs, 'square')
+    inputs = [[random.randint (1, 99), 0] for lane in range (lanes)]
+
+    start = time.perf_counter ()
+    expected = run_clients (program, inputs)
+    clients = time.perf_counter () - start
+
+    computer = vector.Vector_LMC ()
+    computer.load (program)
+    start = time.perf_counter ()
+    results = computer.run (inputs)
+    lockstep = time.perf_counter () - start
+
+    same = [r [0] for r in results] == [e [0] for e in expected]
+    print ('%d lanes of square' % lanes)
+    print ('  clients:  %8.3f s' % clients)
+    print ('  lockstep: %8.3f s  (%.1fx, outputs %s)'
+           % (lockstep, clients / lockstep, 'match' if same else 'DIFFER'))
+
+if __name__ == '__main__':
+    main ()
@@ -0,0 +1,96 @@
+# aio.py - Run Little Man Computer programs as asyncio tasks.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+from . import lmc
+
+class Async_Client (lmc.LMC_Client):
+    '''An LMC client that runs its program as an asyncio coroutine.
+
+    Input is awaited from inputs and output is put on outputs.  By default both
+    are asyncio.Queue objects.  inputs may also be a coroutine function that's
+    called with no arguments for each input.  outputs may be anything with a
+    coroutine put() method.  Execution goes back to the event loop after every
+    slice instructions, so many computers can share one loop without threads
+    and all of them make progress.
+    '''
+    def __init__ (self, base = 10, memory = 100, computer_type = None,
+                  inputs = None, outputs = None, slice = 1000):
+        lmc.LMC_Client.__init__ (self, base, memory, computer_type)
+        self.inputs = asyncio.Queue () if inputs is None else inputs
+        self.outputs = asyncio.Queue () if outputs is None else outputs
+        self.slice = slice
+        # Why the computer last paused.
+        self._needs_input = False
+        self._output = None
+        self._halted = False
+
+    def notify_input (self):
+        self._needs_input = True
+        return False
+
+    def notify_output (self, output):
+        put = getattr (self.outputs, 'put_nowait', None)
+        if put:
+            try:
+                put (output)
+                return True
+            except asyncio.QueueFull:
+                pass
+        # Pause so the output can be awaited.
+        self._output = output
+        return False
+
+    def notify_halt (self):
+        self._halted = True
+
+    async def run (self, program = None):
+        '''Run the program from the beginning until it halts.
+
+        If program is given, it's loaded first.  Return early if execution is
+        paused by a breakpoint or watchpoint.  Exceptions from the computer are
+        raised here.
+        '''
+        if program is not None:
+            self.computer.load (program)
+        start = self.computer.run
+        while True:
+            self._needs_input = False
+            self._output = None
+            self._halted = False
+            sliced = start (steps = self.slice)
+            start = self.computer.resume
+            if self._halted:
+                return
+            if sliced:
+                # Let the other tasks run.
+                await asyncio.sleep (0)
+            elif self._needs_input:
+                self.computer.set_input (int (await self._get_input ()))
+            elif self._output is not None:
+                await self.outputs.put (self._output)
+            else:
+                return
+
+    async def _get_input (self):
+        '''Internal: Wait for the next input.'''
+        if callable (self.inputs):
+            return await self.inputs ()
+        return await self.inputs.get ()
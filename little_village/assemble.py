@@ -19,18 +19,29 @@
 # You should have received a copy of the GNU General Public License along with
 # Little Village.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import json
+import multiprocessing
 import os
 import sys
 
+from . import cache
+from . import image
+from . import lmc
+
+# Change this when the assembler makes different code or messages from the
+# same source so that cached results aren't used.  See assemble_files().
+version = 1
+
 # Errors:
 #  * Unknown mnemonic
 #   Wrong number of arguments for instruction
 #   Argument out of range
-#   Undefined label
+#  * Undefined label
 #  * Too long
 #  * Label matches mnemonic
 #  * Too many errors
-#   Duplicate label
+#  * Duplicate label (between modules)
 #
 # Warnings:
 #  * Unused label
@@ -39,6 +50,20 @@ import sys
 #   Branch to data
 #   Unlabeled data
 
+def _is_number (argument):
+    '''Return True if an argument is empty or a number, so it can't be an
+    undefined label.'''
+    try:
+        int (argument or 0)
+        return True
+    except ValueError:
+        return False
+
+def _write_code (stream, code, width):
+    '''Write words to a stream, one to a line, with leading zeros.'''
+    for word in code:
+        stream.write ('%0*d\n' % (width, word))
+
 def _count (n, word):
     '''A helper to format a count of things.
 We assume the word is made plural by adding "s".'''
@@ -95,9 +120,11 @@ A program label and associated information.
 '''
 
 class Label_Entry:
-    def __init__ (self, value, line_number):
+    def __init__ (self, value, line_number, line = ''):
         self.value = value
         self.line_number = line_number
+        # The source line where it's defined
+        self.line = line
         self.references = 0
 
     def get (self):
@@ -112,8 +139,8 @@ class Lookup:
     def __init__ (self):
         self.table = {}
 
-    def set (self, name, value, line_number):
-        self.table [name] = Label_Entry (value, line_number)
+    def set (self, name, value, line_number, line = ''):
+        self.table [name] = Label_Entry (value, line_number, line)
 
     def get (self, name):
         # The empty name has a value of zero.
@@ -141,27 +168,51 @@ class Assembler:
     # Ignore everything from this string to the end of the line in input files.
     comment = ';'
 
-    # Mnemonic/opcode associations.  For convenience 'DAT' is treated as opcode 0.
+    # Mnemonic/opcode associations for a computer with 100 memory cells.  For
+    # convenience 'DAT' is treated as opcode 0.  The opcodes for other memory
+    # sizes are made from these.
     opcodes = { 'DAT':(000, 0, 1), 'HLT':(000, 0, 0), 
                 'ADD':(100, 1, 0), 'SUB':(200, 1, 0), 
                 'STA':(300, 1, 0), 'LDA':(500, 1, 0), 
                 'BRA':(600, 1, 0), 'BRZ':(700, 1, 0), 'BRP':(800, 1, 0),
                 'INP':(901, 0, 0), 'OUT':(902, 0, 0) }
 
-    def __init__ (self):
+    def __init__ (self, base = 10, memory_size = 100):
+        '''Make an assembler for a computer with the given base and memory
+        size.  See lmc.LMC.'''
+        self.base = base
+        self.memory_size = memory_size
+        # The number of decimal digits in the largest word
+        self.word_digits = len (str (lmc.word_max (base, memory_size)))
+        self.opcodes = dict ([(mnemonic, ((op // 100)*memory_size + op % 100,
+                                          n_required, n_optional))
+                              for (mnemonic, (op, n_required, n_optional))
+                              in Assembler.opcodes.items ()])
         # Make a lookup table for the labels.
         self.labels = Lookup ()
         self.code = []
+        # The source line number of each word of code.
+        self.lines = []
+        # The source lines of the instructions whose arguments may be labels,
+        # by address, for messages about undefined labels.
+        self.sources = {}
         self.has_halt = False
         self.messages = Message_Queue (10)
 
     def interpret_mnemonics (self, program):
+        '''Make a list of (opcode, argument) instructions from the source.
+
+        program may be any iterable of lines, such as an open file.  The lines
+        are read one at a time and not kept.
+        '''
         code = []
+        self.lines = []
+        self.sources = {}
         line_number = 0
-        for line in program:
+        for text in program:
             line_number += 1
             # Remove comments.
-            line = line.split (self.comment)[0]
+            line = text.split (self.comment)[0]
             # Split the line into tokens.
             tokens = line.split ()
             # Ignore empty lines.
@@ -171,12 +222,16 @@ class Assembler:
             if mnemonic == '':
                 continue
             if label != '':
-                self.labels.set (label, len (code), line_number)
+                self.labels.set (label, len (code), line_number, text)
             # Interpret the instruction.
-            code.append (self.translate (mnemonic, arguments, line_number, line))
-            # Fail if the program won't fit into the 100 words of memory.  Note
-            # that we count code lines and not source lines.
-            if len (code) > 100:
+            instruction = self.translate (mnemonic, arguments, line_number, line)
+            if not _is_number (instruction [1]):
+                self.sources [len (code)] = line
+            code.append (instruction)
+            self.lines.append (line_number)
+            # Fail if the program won't fit into memory.  Note that we count
+            # code lines and not source lines.
+            if len (code) > self.memory_size:
                 self.messages.add (True, 'Program too long', line_number, line)
                 raise Abort
         return code
@@ -217,7 +272,7 @@ class Assembler:
         # Use the empty string if there's no argument.
         arg = ''
         n_args = len (argument)
-        if n_args != n_required:
+        if n_args < n_required or n_args > n_required + n_optional:
             self.messages.add (True, 
                                ('%s requires %s, %d given'
                                 % (mnemonic, _count (n_required, 'argument'), n_args)),
@@ -227,7 +282,29 @@ class Assembler:
             arg = argument[0]
         return (op, arg)
 
+    def resolve (self, code, labels):
+        '''Return the words for a list of instructions from
+        interpret_mnemonics() with the labels looked up in labels.'''
+        words = []
+        for (op, label) in code:
+            try:
+                words.append (op + labels.get (label))
+            except ValueError:
+                address = len (words)
+                self.messages.add (True, 'Undefined label',
+                                   self.lines [address], self.sources [address])
+                words.append (op)
+        return words
+
+    def check_labels (self):
+        '''Add warnings for the labels that weren't used.'''
+        for entry in self.labels.unused ():
+            self.messages.add (False, 'Unused label', entry.line_number,
+                               entry.line)
+
     def assemble (self, program):
+        '''Assemble the source lines in program, which may be any iterable of
+        lines.  Return True if there were no errors.'''
         self.has_halt = False
         try:
             # The first pass turns the program into an array of tuples.  The 1st
@@ -238,62 +315,510 @@ class Assembler:
 
             # Fill in the address digits of the opcodes with the address that
             # the labels stand for.
-            self.code = [ op + self.labels.get (label) for (op, label) in code ]
+            self.code = self.resolve (code, self.labels)
         except Abort:
             pass
         else:
-            for entry in self.labels.unused ():
-                line = entry.line_number
-                self.messages.add (False, 'Unused label', line, program [line - 1])
+            self.check_labels ()
+            if not self.has_halt:
+                self.messages.add (False, 'No HLT instruction in input')
+
+        return not self.messages.has_error ()
+
+    def write_program (self, stream = sys.stdin):
+        _write_code (stream, self.code, self.word_digits)
+
+    def write_image (self, file):
+        '''Write the code to file as a binary image.  See image.write_image().'''
+        image.write_image (file, self.code, self.base, self.memory_size)
+
+class Incremental_Assembler (Assembler):
+    '''An assembler that reuses its work from the last program it assembled.
+
+    This is for editors that reassemble after every change.  The parse of each
+    line is remembered by its text, so only new and changed lines are parsed.
+    The addresses of the labels and the instructions that refer to each label
+    are remembered too.  Only the words whose instructions changed or whose
+    labels moved are resolved again.  The messages are rebuilt from the
+    remembered ones each time, so they're always the messages for the last
+    program.  The results are the same as a new Assembler's.
+    '''
+    def __init__ (self, base = 10, memory_size = 100):
+        Assembler.__init__ (self, base, memory_size)
+        # The parse of each line by text.  Each entry is the label, the
+        # (opcode, argument) instruction or None, whether the line has HLT,
+        # and the messages as (fatal, message, line) tuples.
+        self._parsed = {}
+        # The instructions, their words, the label addresses, and the
+        # addresses of undefined labels from the last program.
+        self._instructions = []
+        self._words = []
+        self._addresses = {}
+        self._undefined = set ()
+        # For each argument, the addresses of the instructions that use it.
+        self.references = {}
+
+    def _parse_line (self, text):
+        '''Internal: Parse a line of source.  Return an entry for _parsed.'''
+        messages = self.messages
+        has_halt = self.has_halt
+        # Collect the messages without a limit on errors.
+        self.messages = Message_Queue (None)
+        self.has_halt = False
+        try:
+            line = text.split (self.comment)[0]
+            tokens = line.split ()
+            if tokens == []:
+                return ('', None, False, [])
+            (label, mnemonic, arguments) = self.parse (tokens, 0, line)
+            instruction = None
+            if mnemonic != '':
+                instruction = self.translate (mnemonic, arguments, 0, line)
+            return (label, instruction, self.has_halt,
+                    [(severity == 'Error', message, line)
+                     for (severity, message, n, line) in self.messages.messages])
+        finally:
+            self.messages = messages
+            self.has_halt = has_halt
+
+    def assemble (self, program):
+        self.messages = Message_Queue (self.messages.max_errors)
+        self.has_halt = False
+        self.labels = Lookup ()
+        self.lines = []
+        self.sources = {}
+        parsed = {}
+        instructions = []
+        try:
+            line_number = 0
+            for text in program:
+                line_number += 1
+                entry = self._parsed.get (text)
+                if entry is None:
+                    entry = self._parse_line (text)
+                parsed [text] = entry
+                (label, instruction, has_halt, messages) = entry
+                for (fatal, message, line) in messages:
+                    self.messages.add (fatal, message, line_number, line)
+                self.has_halt = self.has_halt or has_halt
+                if instruction is None:
+                    continue
+                if label != '':
+                    self.labels.set (label, len (instructions), line_number,
+                                     text)
+                if not _is_number (instruction [1]):
+                    self.sources [len (instructions)] = (
+                        text.split (self.comment)[0])
+                instructions.append (instruction)
+                self.lines.append (line_number)
+                if len (instructions) > self.memory_size:
+                    self.messages.add (True, 'Program too long', line_number,
+                                       text.split (self.comment)[0])
+                    raise Abort
+        except Abort:
+            return False
+        finally:
+            # Forget the lines that are gone.
+            self._parsed = parsed
 
+        self._resolve (instructions)
+        try:
+            for address in sorted (self._undefined):
+                self.messages.add (True, 'Undefined label',
+                                   self.lines [address], self.sources [address])
+            self.code = list (self._words)
+        except Abort:
+            pass
+        else:
+            self.check_labels ()
             if not self.has_halt:
                 self.messages.add (False, 'No HLT instruction in input')
 
         return not self.messages.has_error ()
 
+    def _resolve (self, instructions):
+        '''Internal: Update the words for a new list of instructions.'''
+        addresses = dict ([(name, entry.value) for (name, entry)
+                           in self.labels.table.items ()])
+        moved = set ([name for name in set (addresses) | set (self._addresses)
+                      if addresses.get (name) != self._addresses.get (name)])
+        references = {}
+        for address in range (len (instructions)):
+            references.setdefault (instructions [address][1], []).append (address)
+        # The instructions that changed and the ones that use moved labels.
+        dirty = set ([address for address in range (len (instructions))
+                      if address >= len (self._instructions)
+                      or instructions [address] != self._instructions [address]])
+        for name in moved:
+            dirty.update (references.get (name, []))
+
+        words = self._words [:len (instructions)]
+        words += (len (instructions) - len (words))*[0]
+        undefined = set ([address for address in self._undefined
+                          if address < len (instructions)])
+        for address in dirty:
+            (op, name) = instructions [address]
+            undefined.discard (address)
+            if name in addresses:
+                words [address] = op + addresses [name]
+            else:
+                try:
+                    words [address] = op + self.labels.get (name)
+                except ValueError:
+                    words [address] = op
+                    undefined.add (address)
+        # Count the references as Lookup.get() would for the unused label
+        # warnings.
+        for (name, entry) in self.labels.table.items ():
+            entry.references = len (references.get (name, []))
+
+        self._instructions = instructions
+        self._words = words
+        self._addresses = addresses
+        self._undefined = undefined
+        self.references = references
+
+class Linker:
+    '''Assemble a program from several source files.
+
+    Each module is read as a stream of lines by its own Assembler with add()
+    or add_file().  link() places the modules in memory one after the other in
+    the order they were added, and makes one symbol table of the labels
+    defined in all of them.  A label may be used in any module, but it must be
+    defined in only one.  Messages about a module go to its Assembler's
+    messages.  Messages about the whole program go to messages.
+    '''
+    def __init__ (self, base = 10, memory_size = 100):
+        self.base = base
+        self.memory_size = memory_size
+        self.word_digits = len (str (lmc.word_max (base, memory_size)))
+        # (name, assembler, instructions) for each module.  The instructions
+        # are None if the module couldn't be read.
+        self.modules = []
+        # The labels of all modules by name, with their addresses in the
+        # whole program, and the Assembler of the module that defines each.
+        self.symbols = Lookup ()
+        self._owners = {}
+        self.code = []
+        # (module name, line number) for each word of code
+        self.lines = []
+        self.messages = Message_Queue (10)
+
+    def add (self, name, program):
+        '''Read a module from an iterable of source lines.  Return True if
+        there were no errors.'''
+        asm = Assembler (self.base, self.memory_size)
+        try:
+            code = asm.interpret_mnemonics (program)
+        except Abort:
+            code = None
+        self.modules.append ((name, asm, code))
+        return not asm.messages.has_error ()
+
+    def add_file (self, file):
+        '''Read a module from a source file.  The file name is the module
+        name.'''
+        with open (file) as f:
+            return self.add (file, f)
+
+    def link (self):
+        '''Resolve the labels and make the code.  Return True if there were
+        no errors in any module.'''
+        self.symbols = Lookup ()
+        self._owners = {}
+        self.code = []
+        self.lines = []
+        ok = all ([code is not None for (name, asm, code) in self.modules])
+        offset = 0
+        for (name, asm, code) in self.modules:
+            if code is None:
+                continue
+            try:
+                for (label, entry) in asm.labels.table.items ():
+                    if label in self.symbols.table:
+                        asm.messages.add (True, 'Duplicate label',
+                                          entry.line_number, entry.line)
+                    else:
+                        self.symbols.set (label, entry.value + offset,
+                                          entry.line_number, entry.line)
+                        self._owners [label] = asm
+            except Abort:
+                ok = False
+            offset += len (code)
+        if offset > self.memory_size:
+            self.messages.add (True, 'Program too long')
+            ok = False
+        if not ok:
+            return False
+
+        for (name, asm, code) in self.modules:
+            try:
+                self.code += asm.resolve (code, self.symbols)
+            except Abort:
+                return False
+            self.lines += [(name, line) for line in asm.lines]
+        for (label, entry) in self.symbols.table.items ():
+            if entry.references == 0:
+                self._owners [label].messages.add (
+                    False, 'Unused label', entry.line_number, entry.line)
+        if not any ([asm.has_halt for (name, asm, code) in self.modules]):
+            self.messages.add (False, 'No HLT instruction in input')
+        return not self.has_error ()
+
+    def has_error (self):
+        return (self.messages.has_error ()
+                or any ([asm.messages.has_error ()
+                         for (name, asm, code) in self.modules]))
+
+    def write_messages (self, stream = sys.stderr):
+        '''Write the messages for each module under its name, then the
+        messages for the whole program.'''
+        for (name, asm, code) in self.modules:
+            if len (asm.messages.messages) > 0:
+                stream.write ('%s:\n' % name)
+                asm.messages.write (stream)
+        self.messages.write (stream)
+
     def write_program (self, stream = sys.stdin):
-        for line in self.code:
-            stream.write ('%03d\n' % line)
+        _write_code (stream, self.code, self.word_digits)
+
+    def write_image (self, file):
+        '''Write the code to file as a binary image.  See image.write_image().'''
+        image.write_image (file, self.code, self.base, self.memory_size)
+
+def find_sources (paths):
+    '''Return the source files named by a list of paths.
+
+    A directory stands for all of the '.asm' files in it and in the
+    directories below it, in sorted order.  Other paths are used as they are.
+    '''
+    sources = []
+    for path in paths:
+        if not os.path.isdir (path):
+            sources.append (path)
+            continue
+        for (directory, subdirectories, files) in os.walk (path):
+            subdirectories.sort ()
+            sources += [os.path.join (directory, f) for f in sorted (files)
+                        if f.endswith ('.asm')]
+    return sources
+
+# The cache used by assemble_job().  Each worker process makes its own.
+_worker_cache = None
+
+def _start_worker (cache_directory = None):
+    global _worker_cache
+    _worker_cache = None
+    if cache_directory is not None:
+        _worker_cache = cache.Result_Cache (directory = cache_directory)
+
+def _summary (source, output, cached, messages):
+    '''Internal: Return the summary of assembling a file.'''
+    return { 'file': source,
+             'output': output,
+             'cached': cached,
+             'errors': len ([m for m in messages if m [0] == 'Error']),
+             'warnings': len ([m for m in messages if m [0] == 'Warning']),
+             'messages': [{ 'severity': severity,
+                            'message': message,
+                            'line': line_number if line_number >= 0 else None,
+                            'text': text.rstrip ('\n') }
+                          for (severity, message, line_number, text)
+                          in messages] }
+
+def assemble_job (job):
+    '''Assemble one (source, base, memory_size, binary) job.
+
+    The machine code is written next to the source without the extension,
+    as a binary image if binary is True.  If the worker has a cache, the
+    code and messages are looked up by a hash of the assembler version, the
+    geometry and the contents of the source, so an unchanged source isn't
+    assembled again.  Return a summary of the messages that can be written as
+    JSON.  output is None if nothing was written.
+    '''
+    (source, base, memory_size, binary) = job
+    output = os.path.splitext (source)[0]
+    try:
+        if output == source:
+            raise ValueError ('Output file has the same name as the source')
+        with open (source, 'rb') as f:
+            text = f.read ()
+    except (OSError, ValueError) as error:
+        return _summary (source, None, False, [('Error', str (error), -1, '')])
+    h = hashlib.sha256 ()
+    h.update (repr ((version, base, memory_size)).encode ())
+    h.update (text)
+    key = h.hexdigest ()
+    result = None
+    if _worker_cache is not None:
+        result = _worker_cache.get (key)
+    cached = result is not None
+    if not cached:
+        asm = Assembler (base, memory_size)
+        ok = asm.assemble (text.decode (errors = 'replace').splitlines (True))
+        result = (asm.code if ok else None, asm.messages.messages)
+        if _worker_cache is not None:
+            _worker_cache.put (key, result)
+    (code, messages) = result
+    if code is None:
+        output = None
+    elif binary:
+        image.write_image (output, code, base, memory_size)
+    else:
+        with open (output, 'w') as f:
+            _write_code (f, code, len (str (lmc.word_max (base, memory_size))))
+    return _summary (source, output, cached, messages)
+
+def assemble_files (sources, processes = None, base = 10, memory_size = 100,
+                    binary = False, cache_directory = None):
+    '''Assemble many source files in a pool of processes.
+
+    processes defaults to the number of CPUs.  Yield the summary from
+    assemble_job() for each source, in the same order as the sources.  If
+    cache_directory is given, the workers share a cache.Result_Cache of
+    assembled code stored there.
+    '''
+    jobs = [(source, base, memory_size, binary) for source in sources]
+    if processes is None:
+        processes = os.cpu_count () or 1
+    if processes < 2 or len (jobs) < 2:
+        _start_worker (cache_directory)
+        for job in jobs:
+            yield assemble_job (job)
+        return
+    # Send the jobs in chunks to cut down on communication.
+    chunk = max (1, len (jobs) // (processes*16))
+    with multiprocessing.Pool (processes, _start_worker,
+                               (cache_directory,)) as pool:
+        for summary in pool.imap (assemble_job, jobs, chunk):
+            yield summary
 
 def print_help (app):
     print (
 '''Convert a Little Man Computer assembly program to machine code
 
-Usage: %s <input-file> [<output-file>]
+Usage: %s [--image] [--base <base>] [--memory <size>]
+           <input-file> [<output-file>]
+       %s [--image] [--base <base>] [--memory <size>]
+           --link <output-file> <input-file>...
+       %s [--image] [--base <base>] [--memory <size>]
+           [--cache <directory>] [--processes <n>] --bulk <path>...
 
 where <input-file> is an LMC assembly language file and the machine
 code is written to <output-file>.  If <output-file> is not given then
 the output file name is constructed by removing the extension from
 <input-file>.  An error is signaled and nothing is written if
 <output-file> is the same as <input-file>.
-''' % app)
 
-def run (args):
-    n_args = len (sys.argv)
-    if n_args < 2 or n_args > 3:
-        print_help (args [0])
+With --image, the machine code is written as a binary image, which
+loads faster than text.
+
+With --base and --memory, the code is made for a computer with that
+base and number of memory cells.  The defaults are 10 and 100.
+
+With --link, the input files are modules of one program.  They're
+placed in memory in the order given, and a label defined in any of
+them may be used in all of them.
+
+With --bulk, each source file is assembled on its own, and the code
+is written next to it without the extension.  A <path> that's a
+directory stands for all of the .asm files under it.  The files are
+assembled on <n> processes, one per CPU by default.  A summary of the
+messages for each file is printed as a line of JSON.  With --cache,
+the code is saved in <directory>, and a file that was assembled
+before is not assembled again.
+''' % (app, app, app))
+
+def run (program, args):
+    binary = False
+    base = 10
+    memory_size = 100
+    link = None
+    bulk = False
+    cache_directory = None
+    processes = None
+    while len (args) > 0 and args [0].startswith ('--') and not bulk:
+        option = args [0]
+        if option in ('--image', '--bulk'):
+            binary = binary or option == '--image'
+            bulk = bulk or option == '--bulk'
+            args = args [1:]
+        elif (option in ('--base', '--memory', '--link', '--cache',
+                         '--processes')
+              and len (args) > 1):
+            value = args [1]
+            args = args [2:]
+            try:
+                if option == '--base':
+                    base = int (value)
+                elif option == '--memory':
+                    memory_size = int (value)
+                elif option == '--processes':
+                    processes = int (value)
+                elif option == '--cache':
+                    cache_directory = value
+                else:
+                    link = value
+            except ValueError:
+                print_help (program)
+                sys.exit (1)
+        else:
+            print_help (program)
+            sys.exit (1)
+
+    if bulk:
+        if len (args) < 1:
+            print_help (program)
+            sys.exit (1)
+        for summary in assemble_files (find_sources (args), processes, base,
+                                       memory_size, binary, cache_directory):
+            print (json.dumps (summary))
+        return
+
+    if link is not None:
+        if len (args) < 1:
+            print_help (program)
+            sys.exit (1)
+        input_files = args
+        output_file = link
+    else:
+        if len (args) < 1 or len (args) > 2:
+            print_help (program)
+            sys.exit (1)
+        input_files = args [:1]
+        if len (args) > 1:
+            output_file = args [1]
+        else:
+            output_file = os.path.splitext (args [0])[0]
+    if output_file in input_files:
+        sys.stderr.write ('Error: output file %s has the same name as the '
+                          'input file.\n' % output_file)
+        sys.exit (1)
+    if binary and output_file in ('', '-'):
+        sys.stderr.write ('Error: an image must be written to a file.\n')
         sys.exit (1)
 
-    output_file = None
-    if len (args) > 1:
-        output_file = args [1]
+    # The source files are read a line at a time.
+    if link is not None:
+        asm = Linker (base, memory_size)
+        for input_file in input_files:
+            asm.add_file (input_file)
+        ok = asm.link ()
+        write_messages = asm.write_messages
     else:
-        output_file = os.path.splitext (input_file)[0]
-    output_stream = sys.stdout
-    if output_file == input_file:
-        'Error: output file %s has the same name as the input file.'
-        sys.exit (1)
-    if output_file != '' and output_file != '-':
-        output_stream = open (output_file, 'w')
-
-    # Read the whole program into an array.
-    program = open (input_file, 'r').readlines ()
-    asm = Assembler ()
-    if asm.assemble (program):
-        asm.write_program (output_stream)
+        asm = Assembler (base, memory_size)
+        with open (input_files [0], 'r') as f:
+            ok = asm.assemble (f)
+        write_messages = asm.messages.write
+    if not ok:
+        write_messages ()
+    elif binary:
+        asm.write_image (output_file)
+    elif output_file == '' or output_file == '-':
+        asm.write_program (sys.stdout)
     else:
-        asm.messages.write ()
+        with open (output_file, 'w') as output_stream:
+            asm.write_program (output_stream)
 
 if __name__ == '__main__':
-    run (sys.argv)
-
+    run (sys.argv [0], sys.argv [1:])
@@ -19,7 +19,12 @@
 # You should have received a copy of the GNU General Public License along with
 # Little Village.  If not, see <http://www.gnu.org/licenses/>.
 
+from . import cache
 from . import lmc
+from . import profiler
+import multiprocessing
+import os
+import pickle
 import sys
 
 class Not_Enough_Inputs (Exception):
@@ -39,20 +44,77 @@ class Unused_Inputs (Exception):
 
 class Batch_Client (lmc.LMC_Client):
     '''A non-interactive LMC client.'''
-    def __init__ (self):
-        lmc.LMC_Client.__init__ (self)
+    def __init__ (self, base = 10, memory = 100, computer_type = None):
+        lmc.LMC_Client.__init__ (self, base, memory, computer_type)
         self.inputs = []
         self.outputs = []
+        # If not None, a cache.Result_Cache for the results of run().
+        self.cache = None
+
+    def reset (self):
+        '''Clear the inputs, outputs, and the computer for another run.'''
+        self.inputs = []
+        self.outputs = []
+        self.computer.reset ()
 
     def run (self, program, inputs):
-        '''Start execution of the program.'''
-        self.inputs = inputs
+        '''Start execution of the program.
+
+        If there's a cache, a run of the same program on the same inputs is
+        looked up instead of being executed.  The outputs and inputs are left
+        as the run left them and the same exception is raised, but the computer
+        is left as it was after loading.  The cache isn't used while profiling,
+        tracing, or recording history, or when there are breakpoints or
+        watchpoints, since they can pause the run or need it to execute.
+        '''
         self.computer.load (program)
+        self.run_loaded (inputs)
+
+    def run_loaded (self, inputs):
+        '''Start execution of the program that's already in the computer.
+
+        This is like run() for a program put into memory some other way, such
+        as by LMC.load_code().
+        '''
+        self.inputs = inputs
+        computer = self.computer
+        if (self.cache is None or computer.profile or computer.trace
+            or computer.history or computer.breakpoints
+            or computer.watched_cells or computer.watched_values):
+            self._run ()
+            return
+        key = self.cache.key (self.computer, inputs)
+        result = self.cache.get (key)
+        if result is not None:
+            (outputs, self.inputs, error) = result
+            self.outputs += outputs
+            if error is not None:
+                raise error
+            return
+        start = len (self.outputs)
+        try:
+            self._run ()
+        except Exception as error:
+            self._save (key, start, error)
+            raise
+        self._save (key, start, None)
+
+    def _run (self):
+        '''Internal: Run the loaded program.'''
         self.computer.run ()
         # Check for extra input.
         if len (self.inputs) > 0:
             raise Unused_Inputs (self.inputs)
 
+    def _save (self, key, start, error):
+        '''Internal: Cache the outputs from start on, the unused inputs, and
+        the exception raised, if any.'''
+        try:
+            self.cache.put (key, (self.outputs [start:], self.inputs, error))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Results that can't be pickled aren't cached.
+            pass
+
     def notify_input (self):
         '''Provide input when needed by the program during execution.
 
@@ -72,35 +134,184 @@ class Batch_Client (lmc.LMC_Client):
         self.outputs.append (out)
         return True
 
+def read_manifest (file):
+    '''Read a list of jobs from a file.
+
+    Each line of the file has a program name followed by the inputs for that
+    run, separated by whitespace.  Blank lines and lines that start with '#'
+    are ignored.  Program names are relative to the manifest's directory.
+    Return a list of (program, inputs) pairs.
+    '''
+    directory = os.path.dirname (file)
+    jobs = []
+    with open (file) as f:
+        for line in f:
+            tokens = line.split ()
+            if len (tokens) == 0 or tokens [0].startswith ('#'):
+                continue
+            jobs.append ((os.path.join (directory, tokens [0]), tokens [1:]))
+    return jobs
+
+# The client used by run_job().  Each worker process makes one and resets it
+# for each job.
+_worker_client = None
+
+def _start_worker (max_steps = None, loop_interval = None,
+                   cache_directory = None):
+    global _worker_client
+    _worker_client = Batch_Client ()
+    _worker_client.computer.max_steps = max_steps
+    _worker_client.computer.loop_interval = loop_interval
+    if cache_directory is not None:
+        _worker_client.cache = cache.Result_Cache (directory = cache_directory)
+
+def run_job (job):
+    '''Run one (program, inputs) job.
+
+    Return the outputs and the exception raised by Batch_Client.run(), or
+    None if there was no exception.
+    '''
+    if _worker_client is None:
+        _start_worker ()
+    client = _worker_client
+    client.reset ()
+    (program, inputs) = job
+    try:
+        client.run (program, list (inputs))
+    except Exception as error:
+        return (client.outputs, error)
+    return (client.outputs, None)
+
+def run_jobs (jobs, processes = None, max_steps = None, loop_interval = None,
+              cache_directory = None):
+    '''Run a list of (program, inputs) jobs in a pool of processes.
+
+    processes defaults to the number of CPUs.  Yield an (outputs, error) pair
+    for each job as returned by run_job().  The results come in the same
+    order as the jobs.  max_steps and loop_interval are set on each worker's
+    computer to stop programs that don't halt.  If cache_directory is given,
+    the workers share a cache.Result_Cache stored there.
+    '''
+    if processes is None:
+        processes = os.cpu_count () or 1
+    if processes < 2 or len (jobs) < 2:
+        _start_worker (max_steps, loop_interval, cache_directory)
+        for job in jobs:
+            yield run_job (job)
+        return
+    # Send the jobs in chunks to cut down on communication.
+    chunk = max (1, len (jobs) // (processes*16))
+    with multiprocessing.Pool (processes, _start_worker,
+                               (max_steps, loop_interval,
+                                cache_directory)) as pool:
+        for result in pool.imap (run_job, jobs, chunk):
+            yield result
+
 def print_help (app):
     print (
 '''Execute a Little Man Computer program
 
-Usage: %s <program-name> [<input>...]
+Usage: %s [--cache <directory>] [--profile] [--trace <file>]
+           <program-name> [<input>...]
+       %s [--cache <directory>] --jobs <manifest> [<processes>]
 
 where <program-name> is the name of a machine-code program file
 and <input>s are any integer inputs needed by the program.
-''' % app)
+
+With --profile, a report on where the program spent its time is
+printed after the output.  If the assembly source is found at
+<program-name>.asm the report shows the source lines.
+
+With --trace, a record of each instruction executed is written to
+<file> in a binary format.  See trace.Trace_Reader for reading it.
+
+With --jobs, each line of <manifest> has a program name followed by
+its inputs.  The jobs are run on <processes> processes, one per CPU
+by default.  The outputs of each job are printed on one line, in the
+same order as the manifest.
+
+With --cache, results are saved in <directory>.  A later run of the
+same program on the same inputs prints the saved results instead of
+running the program again.
+''' % (app, app))
 
 def print_message (prefix, exception):
     sys.stderr.write (prefix + ': ' + str (exception) + '\n')
 
+def print_job (number, outputs, error):
+    '''Print the results of a job from a manifest.'''
+    print ('%d: %s' % (number, ' '.join ([str (n) for n in outputs])))
+    if isinstance (error, Unused_Inputs):
+        print_message ('%d: Warning' % number, error)
+    elif error is not None:
+        print_message ('%d: Error' % number, error)
+
+def run_manifest (program, args, cache_directory = None):
+    if len (args) < 2 or len (args) > 3:
+        print_help (program)
+        return
+    try:
+        jobs = read_manifest (args [1])
+        processes = int (args [2]) if len (args) > 2 else None
+    except Exception as error:
+        print_message ('Error', error)
+        return
+    number = 0
+    for (outputs, error) in run_jobs (jobs, processes,
+                                      cache_directory = cache_directory):
+        number += 1
+        print_job (number, outputs, error)
+
 def run (program, args):
     if len (args) < 1:
         print_help (program)
         return;
+    cache_directory = None
+    if args [0] == '--cache' and len (args) > 1:
+        cache_directory = args [1]
+        args = args [2:]
+    if len (args) > 0 and args [0] == '--jobs':
+        run_manifest (program, args, cache_directory)
+        return
+    profile = False
+    trace = None
+    while len (args) > 0 and args [0] in ('--profile', '--trace'):
+        if args [0] == '--profile':
+            profile = True
+        elif len (args) > 1:
+            trace = args [1]
+            args = args [1:]
+        args = args [1:]
+    if len (args) < 1:
+        print_help (program)
+        return
 
     client = Batch_Client ()
+    if cache_directory is not None:
+        client.cache = cache.Result_Cache (directory = cache_directory)
+    if profile:
+        client.computer.start_profile ()
     try:
+        if trace:
+            client.computer.start_trace (trace)
         client.run (args [0], args [1:])
     except Unused_Inputs as warning:
         print_message ('Warning', warning)
     except Exception as error:
         print_message ('Error', error)
+    finally:
+        client.computer.stop_trace ()
 
     # Print the output.
     for n in client.outputs:
         print (n)
+
+    if profile:
+        print ('')
+        computer = client.computer
+        print (profiler.report (computer.profile, computer,
+                                profiler.find_source (args [0], computer.base,
+                                                      computer.memory_size)))
         
 
 if __name__ == '__main__':
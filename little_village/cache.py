@@ -0,0 +1,229 @@
+# cache.py - Remember loaded programs and the results of running them.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Change this when the meaning of a cached result changes so that old entries
+# on disk aren't used.
+version = 1
+
+class Result_Cache:
+    '''A cache of the results of whole runs.
+
+    A result is looked up by a key made from everything that determines it:
+    the memory image and registers of the computer before the run, its base,
+    memory size, and step limits, and the inputs.  Results are kept in memory
+    for the size most recently used keys.  If directory is given, results are
+    also written there so they can be shared between processes and runs.  The
+    files are evicted, least recently used first, when they take up more than
+    max_bytes.
+
+    hits and misses count the lookups.
+    '''
+    def __init__ (self, size = 1024, directory = None,
+                  max_bytes = 64*1024*1024):
+        self.size = size
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict ()
+        # The number of bytes in the directory.  It's counted when the cache
+        # is made and kept up to date as files are added or evicted.
+        self._bytes = 0
+        if directory is not None:
+            os.makedirs (directory, exist_ok = True)
+            self._bytes = sum ([f [1] for f in self._files ()])
+
+    def key (self, computer, inputs):
+        '''Return the key for running the program in computer on inputs.'''
+        h = hashlib.sha256 ()
+        h.update (repr ((version, computer.base, computer.memory_size,
+                         computer.max_steps, computer.loop_interval,
+                         computer.input, computer.accumulator,
+                         computer.overflow, computer.negative,
+                         list (inputs))).encode ())
+        h.update (computer.memory.tobytes ())
+        return h.hexdigest ()
+
+    def get (self, key):
+        '''Return the result stored for key, or None if there isn't one.'''
+        data = self._results.get (key)
+        if data is not None:
+            self._results.move_to_end (key)
+        elif self.directory is not None:
+            data = self._read (key)
+            if data is not None:
+                self._remember (key, data)
+        if data is not None:
+            # Unpickle a new copy each time so that callers can't change
+            # what's stored.
+            try:
+                result = pickle.loads (data)
+                self.hits += 1
+                return result
+            except Exception:
+                # A damaged file, or a result from an incompatible version.
+                del self._results [key]
+        self.misses += 1
+        return None
+
+    def put (self, key, result):
+        '''Store a result for key.  It must be picklable.'''
+        data = pickle.dumps (result)
+        self._remember (key, data)
+        if self.directory is not None:
+            self._write (key, data)
+
+    def clear (self):
+        '''Forget all results, including the ones on disk.'''
+        self._results.clear ()
+        if self.directory is not None:
+            for (name, size, time) in self._files ():
+                self._remove (name, size)
+
+    def _remember (self, key, data):
+        '''Internal: Keep a result in memory, dropping the oldest if the cache
+        is full.'''
+        self._results [key] = data
+        self._results.move_to_end (key)
+        while len (self._results) > self.size:
+            self._results.popitem (last = False)
+
+    def _path (self, key):
+        return os.path.join (self.directory, key + '.result')
+
+    def _read (self, key):
+        '''Internal: Return the data for key from the directory, or None.'''
+        path = self._path (key)
+        try:
+            with open (path, 'rb') as f:
+                data = f.read ()
+            # Mark it as recently used.
+            os.utime (path)
+        except OSError:
+            return None
+        return data
+
+    def _write (self, key, data):
+        '''Internal: Write the data for key to the directory.
+
+        The file is written under a temporary name and renamed so that other
+        processes never see part of it.
+        '''
+        (handle, temporary) = tempfile.mkstemp (dir = self.directory,
+                                                suffix = '.tmp')
+        with os.fdopen (handle, 'wb') as f:
+            f.write (data)
+        os.replace (temporary, self._path (key))
+        self._bytes += len (data)
+        if self._bytes > self.max_bytes:
+            self._evict ()
+
+    def _files (self):
+        '''Internal: Return the name, size, and modification time of each
+        result file.'''
+        files = []
+        for entry in os.scandir (self.directory):
+            if entry.name.endswith ('.result'):
+                try:
+                    stat = entry.stat ()
+                except OSError:
+                    # Removed by another process.
+                    continue
+                files.append ((entry.name, stat.st_size, stat.st_mtime))
+        return files
+
+    def _remove (self, name, size):
+        try:
+            os.remove (os.path.join (self.directory, name))
+        except OSError:
+            pass
+        self._bytes -= size
+
+    def _evict (self):
+        '''Internal: Remove the least recently used files until the directory
+        is down to three quarters of max_bytes.'''
+        files = self._files ()
+        # Other processes may have added or removed files.
+        self._bytes = sum ([f [1] for f in files])
+        for (name, size, time) in sorted (files, key = lambda f: f [2]):
+            if self._bytes <= 3*self.max_bytes // 4:
+                break
+            self._remove (name, size)
+
+class Program_Cache:
+    '''A cache of the programs loaded from files.
+
+    For a program file, key() makes a key from the file's resolved path,
+    modification time, and size, and the base and memory size of the computer
+    it's loaded into.  A changed file gets a new key, so it's read again.  Any
+    other hashable key may be used too.  A program is stored as a list of
+    start addresses and arrays of words that have already been checked.
+    Callers copy the words out and must not change them.  The least recently
+    used programs are dropped when the words take up more than max_bytes.
+
+    hits and misses count the lookups.
+    '''
+    def __init__ (self, max_bytes = 64*1024*1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._programs = collections.OrderedDict ()
+        self._bytes = 0
+
+    def key (self, file, base, memory_size):
+        '''Return the key for loading file into a computer.  Raise OSError if
+        the file can't be examined.'''
+        path = os.path.realpath (file)
+        stat = os.stat (path)
+        return (path, stat.st_mtime_ns, stat.st_size, base, memory_size)
+
+    def get (self, key):
+        '''Return the program stored for key, or None if there isn't one.'''
+        runs = self._programs.get (key)
+        if runs is None:
+            self.misses += 1
+        else:
+            self._programs.move_to_end (key)
+            self.hits += 1
+        return runs
+
+    def put (self, key, runs):
+        '''Store a program for key, dropping the oldest ones if the cache is
+        full.'''
+        if key in self._programs:
+            self._bytes -= self._size (self._programs.pop (key))
+        self._programs [key] = runs
+        self._bytes += self._size (runs)
+        while self._bytes > self.max_bytes and len (self._programs) > 1:
+            self._bytes -= self._size (self._programs.popitem (last = False) [1])
+
+    def clear (self):
+        '''Forget all programs.'''
+        self._programs.clear ()
+        self._bytes = 0
+
+    def _size (self, runs):
+        '''Internal: Return the number of bytes taken by a program's words.'''
+        return sum ([words.itemsize*len (words) for (start, words) in runs])
@@ -23,11 +23,17 @@ from . import assemble
 from . import batch
 from . import prompt
 from . import console
+from . import source
 
 import sys
 
-# The name of each imported module above must be in this list.
-commands = ['assemble', 'batch', 'prompt', 'console', 'help', 'version']
+# The name of each imported module above must be in this list, unless it's
+# given in modules.
+commands = ['assemble', 'batch', 'run', 'prompt', 'console', 'help', 'version']
+
+# The modules for commands with different names.  The run module would clash
+# with run() below.
+modules = { 'run': source }
 
 def find_command (name):
     matches = []
@@ -80,7 +86,8 @@ def run ():
         program = '%s %s' % (sys.argv [0], command)
         # Find the module that corresponds to the command.  This is why the
         # module names must be in the command list.
-        module = getattr (sys.modules[__name__], command)
+        module = modules.get (command) or getattr (sys.modules[__name__],
+                                                   command)
         if need_help:
             # Show the full command in the help message. 
             program = '%s %s' % (sys.argv [0], command)
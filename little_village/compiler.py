@@ -0,0 +1,321 @@
+# compiler.py - Run Little Man Computer programs as compiled Python code.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+from . import lmc
+
+# The functions compiled in this process, keyed by their source.  The source
+# determines the function, so computers running the same code share them.
+compiled = collections.OrderedDict ()
+
+class Compiled_LMC (lmc.LMC):
+    '''An LMC that runs basic blocks of the program as Python functions.
+
+    When the program runs without a step hook, each block is translated to
+    Python source the first time it's reached, compiled, and cached by its
+    start address.  A block is a run of ADD, SUB, STA, LDA, INP, OUT, BRZ, and
+    BRP instructions, leaving early when a branch is taken, with an optional
+    BRA at the end.  Blocks also end before branch targets.  A block that
+    branches to its own start loops without returning.  Input and output save
+    the registers and call the LMC handlers so the client is notified exactly
+    as it is by LMC.  Halt and unused opcodes are executed one at a time.
+
+    A store to an address that's covered by a compiled block throws the block
+    away.  It's compiled from the new code the next time it's reached.  If the
+    client changes the code during input or output, the block is left at the
+    next instruction.
+    '''
+    __slots__ = ('_blocks', '_owners', '_leaders')
+
+    # The maximum number of instructions in a block.
+    max_block = 64
+    # The maximum number of functions kept in compiled.
+    max_compiled = 1024
+
+    def reset (self):
+        lmc.LMC.reset (self)
+        # Compiled blocks and their lengths indexed by start address.  None
+        # marks an address where a block can't start.
+        self._blocks = {}
+        # The start addresses of the blocks that cover each address.
+        self._owners = {}
+        self._reset_blocks ()
+
+    def restore (self, snapshot = None):
+        lmc.LMC.restore (self, snapshot)
+        self._reset_blocks ()
+
+    def decode (self):
+        lmc.LMC.decode (self)
+        self._reset_blocks ()
+
+    def _reset_blocks (self):
+        '''Internal: Forget all compiled blocks.'''
+        # Clear in place, as LMC.decode() does, so that a run in progress
+        # sees the change.
+        self._blocks.clear ()
+        self._owners.clear ()
+        # The addresses that begin basic blocks.
+        self._leaders = self._find_leaders ()
+
+    def _find_leaders (self):
+        '''Internal: Return the set of addresses where basic blocks start.
+
+        These are the start of the program and branch targets.  Cells in pages
+        of paged memory that haven't been written are skipped.  They hold HLT,
+        which ends a block anyway.
+        '''
+        leaders = set ([0])
+        for (address, word) in self._words ():
+            op, arg = self._decode (word)
+            if op in (lmc.LMC.BRA, lmc.LMC.BRZ, lmc.LMC.BRP):
+                leaders.add (arg)
+        return leaders
+
+    def _run_fast (self):
+        '''Internal: Execute compiled blocks until the program halts or pauses.
+
+        The registers are kept in local variables and passed to the blocks,
+        which return them.  A block is only run if it ends before the next step
+        check.  Otherwise instructions are executed one at a time up to the
+        check.
+        '''
+        blocks = self._blocks
+        decoded = self._decoded
+        handlers = self._handlers
+        counter = self.counter
+        accumulator = self.accumulator
+        overflow = self.overflow
+        negative = self.negative
+        steps = self.steps
+        check = self._next_check
+        while True:
+            try:
+                block = blocks [counter]
+            except KeyError:
+                block = self._compile (counter)
+            if block and steps + block [1] <= check:
+                registers = block [0] (self, accumulator, overflow, negative,
+                                       steps, check)
+                if registers is None:
+                    # The block paused at I/O and saved the registers.
+                    return
+                counter, accumulator, overflow, negative, steps = registers
+            else:
+                self.counter = counter
+                self.accumulator = accumulator
+                self.overflow = overflow
+                self.negative = negative
+                self.steps = steps
+                if steps >= check:
+                    check = self._next_check = self._check_steps ()
+                self.steps = steps + 1
+                op, arg = decoded [counter]
+                self.counter = counter + 1
+                if not handlers [op] (arg):
+                    return
+                counter = self.counter
+                accumulator = self.accumulator
+                overflow = self.overflow
+                negative = self.negative
+                steps = self.steps
+
+    def _store (self, address, word):
+        lmc.LMC._store (self, address, word)
+        if address in self._owners:
+            self._invalidate (address)
+
+    def _invalidate (self, address):
+        '''Internal: Discard the blocks that cover an address.'''
+        for start in self._owners.pop (address, ()):
+            self._blocks.pop (start, None)
+
+    def _compile (self, start):
+        '''Internal: Translate and cache the block that starts at an address.
+
+        Return the compiled function and the number of instructions in the
+        block, or None if the instruction at the start address can't be part of
+        a block.
+        '''
+        branches = (lmc.LMC.BRA, lmc.LMC.BRZ, lmc.LMC.BRP)
+        translated = ((lmc.LMC.LDA, lmc.LMC.ADD, lmc.LMC.SUB, lmc.LMC.STA)
+                      + branches)
+
+        # Find the instructions in the block.
+        end = min (start + self.max_block, self.memory_size)
+        code = []
+        address = start
+        while address < end:
+            if address != start and address in self._leaders:
+                break
+            op, arg = self._decode (self.memory [address])
+            if not (op in translated or (op == lmc.LMC.IO and arg in (1, 2))):
+                break
+            code.append ((op, arg))
+            address += 1
+            if op == lmc.LMC.BRA:
+                break
+        # If the block overwrites one of its own later instructions, stop after
+        # the store so the stale code isn't run.  If it overwrites an earlier
+        # one it can't branch back to its start without being compiled again.
+        loops = True
+        for i in range (len (code)):
+            op, arg = code [i]
+            if op == lmc.LMC.STA and start <= arg < start + len (code):
+                loops = False
+                if arg > start + i:
+                    del code [i + 1:]
+                    break
+
+        if len (code) == 0:
+            block = None
+            # The cell is still watched in case an instruction that can start
+            # a block is stored there.
+            length = 1
+        else:
+            length = len (code)
+            body = []
+            for i in range (length):
+                body += self._translate (code [i][0], code [i][1], start, i,
+                                         length, loops)
+            if code [-1][0] != lmc.LMC.BRA:
+                body += self._exit (start + length, length)
+            source = '\n'.join (['def block (computer, accumulator, overflow, '
+                                 'negative, steps, check):',
+                                 '    memory = computer.memory',
+                                 '    decoded = computer._decoded',
+                                 '    owners = computer._owners',
+                                 '    blocks = computer._blocks',
+                                 '    while True:']
+                                + ['        ' + line for line in body]) + '\n'
+            block = (self._function (source, start), length)
+
+        self._blocks [start] = block
+        for covered in range (start, min (start + length, self.memory_size)):
+            self._owners.setdefault (covered, set ()).add (start)
+        return block
+
+    def _function (self, source, start):
+        '''Internal: Return the function defined by a block's source, dropping
+        the least recently used functions if compiled is full.'''
+        function = compiled.get (source)
+        if function is None:
+            namespace = {}
+            exec (compile (source, '<block %d>' % start, 'exec'), namespace)
+            function = compiled [source] = namespace ['block']
+            while len (compiled) > self.max_compiled:
+                compiled.popitem (last = False)
+        else:
+            compiled.move_to_end (source)
+        return function
+
+    def _translate (self, op, arg, start, i, length, loops):
+        '''Internal: Return the lines of Python code for the instruction at
+        index i of the block at start.
+
+        A branch to the start of the block loops within the block if loops is
+        True and there's room for another pass before the step check.
+        '''
+        address = start + i
+        code = ['# %d: %0*d' % (address, self.word_digits,
+                                op*self.memory_size + arg)]
+        if op == lmc.LMC.LDA:
+            code += ['accumulator = memory [%d]' % arg,
+                     'overflow = negative = False']
+        elif op == lmc.LMC.ADD:
+            code += ['value = accumulator + memory [%d]' % arg,
+                     'overflow = %s' % self._out_of_word ('value > %d'
+                                                          % self.word_max),
+                     'negative = False',
+                     'accumulator = %s' % self._wrap ()]
+        elif op == lmc.LMC.SUB:
+            code += ['value = accumulator - memory [%d]' % arg,
+                     'overflow = False',
+                     'negative = %s' % self._out_of_word ('value < 0'),
+                     'accumulator = %s' % self._wrap ()]
+        elif op == lmc.LMC.STA:
+            code += ['memory [%d] = accumulator' % arg,
+                     'decoded [%d] = %s' % (arg, self._decode_accumulator ()),
+                     'if %d in owners: computer._invalidate (%d)' % (arg, arg)]
+        elif op == lmc.LMC.IO:
+            # Save the registers for the client, as LMC._run_fast() does.
+            code += ['computer.counter = %d' % (address + 1),
+                     'computer.accumulator = accumulator',
+                     'computer.overflow = overflow',
+                     'computer.negative = negative',
+                     'computer.steps = steps + %d' % (i + 1)]
+            if arg == 1:
+                code += ['if not computer._do_input (): return',
+                         'accumulator = computer.accumulator',
+                         'overflow = computer.overflow',
+                         'negative = computer.negative']
+            else:
+                code += ['if not computer._do_output (): return']
+            # Go on only if the client didn't change the code.
+            code += ['if blocks.get (%d, (None,)) [0] is not block:' % start]
+            code += ['    ' + line for line in self._exit (address + 1, i + 1)]
+        elif op == lmc.LMC.BRA:
+            code += self._branch (arg, start, i, length, loops)
+        elif op == lmc.LMC.BRZ:
+            code += ['if accumulator == 0:']
+            code += ['    ' + line for line in self._branch (arg, start, i,
+                                                             length, loops)]
+        elif op == lmc.LMC.BRP:
+            code += ['if not negative:']
+            code += ['    ' + line for line in self._branch (arg, start, i,
+                                                             length, loops)]
+        return code
+
+    def _branch (self, target, start, i, length, loops):
+        '''Internal: Return the code for a taken branch at index i of the
+        block at start.'''
+        if target != start or not loops:
+            return self._exit (target, i + 1)
+        return ['steps += %d' % (i + 1),
+                'if steps + %d <= check: continue' % length,
+                'return (%d, accumulator, overflow, negative, steps)' % start]
+
+    # For power-of-2 geometry the generated code uses shifts and masks, as
+    # LMC._run_fast_bits() does.
+
+    def _out_of_word (self, comparison):
+        '''Internal: Return the test for a value outside of a word.'''
+        if self._word_bits is None:
+            return comparison
+        return 'value >> %d != 0' % self._word_bits
+
+    def _wrap (self):
+        '''Internal: Return the expression that wraps value into a word.'''
+        if self._word_bits is None:
+            return 'value %% %d' % self.word_range
+        return 'value & %d' % self.word_max
+
+    def _decode_accumulator (self):
+        '''Internal: Return the expression that decodes the accumulator.'''
+        if self._address_bits is None:
+            return 'divmod (accumulator, %d)' % self.memory_size
+        return ('(accumulator >> %d, accumulator & %d)'
+                % (self._address_bits, self.memory_size - 1))
+
+    def _exit (self, counter, executed):
+        '''Internal: Return the code that leaves the block at counter after
+        executing some of its instructions.'''
+        return ['return (%s, accumulator, overflow, negative, steps + %d)'
+                % (counter, executed)]
@@ -0,0 +1,260 @@
+# fusion.py - Run common LMC instruction sequences as single operations.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+from . import lmc
+from .memory import Paged_Memory
+
+# The kinds of fused operations.
+ADD_STORE = 1                   # LDA x, ADD y, STA z [, BRZ t or BRP t]
+SUB_STORE = 2                   # LDA x, SUB y, STA z [, BRZ t or BRP t]
+INPUT_STORE = 3                 # INP, STA x
+
+class Fused_LMC (lmc.LMC):
+    '''An LMC that executes common instruction sequences in one dispatch.
+
+    These sequences are fused:
+
+    - LDA x, ADD y, STA z
+    - LDA x, SUB y, STA z
+    - either of those followed by BRZ or BRP, as in a countdown loop
+    - INP, STA x
+
+    The first time the fast loop reaches an address it checks for a sequence
+    that starts there and caches what it finds.  A fused sequence is only used
+    when execution reaches its first instruction, so a branch into the middle
+    runs the instructions one at a time.  A store to an address that's covered
+    by a fused sequence throws it away.  A sequence isn't fused if it
+    overwrites the branch at its end.  The results, step counts and client
+    notifications are the same as for LMC.
+    '''
+    __slots__ = ('_fused', '_owners')
+
+    def reset (self):
+        lmc.LMC.reset (self)
+        self._reset_fusion ()
+
+    def restore (self, snapshot = None):
+        lmc.LMC.restore (self, snapshot)
+        self._reset_fusion ()
+
+    def decode (self):
+        lmc.LMC.decode (self)
+        self._reset_fusion ()
+
+    def _reset_fusion (self):
+        '''Internal: Forget all fused sequences.'''
+        # Fused operations indexed by start address.  None marks an address
+        # where no sequence starts and False one that hasn't been looked at.
+        # Large memories get a paged table like their memory.
+        if self.memory_size > self.paged_size:
+            self._fused = Paged_Memory (self.memory_size,
+                                        self.page_size*[False])
+        else:
+            self._fused = self.memory_size*[False]
+        # The start addresses of the sequences that cover each address.
+        self._owners = {}
+
+    def _store (self, address, word):
+        lmc.LMC._store (self, address, word)
+        if address in self._owners:
+            self._invalidate (address)
+
+    def _invalidate (self, address):
+        '''Internal: Discard the fused sequences that cover an address.'''
+        for start in self._owners.pop (address, ()):
+            self._fused [start] = False
+
+    def _fuse (self, start):
+        '''Internal: Find and cache the sequence that starts at an address.
+
+        Return a tuple of the kind of operation, the number of instructions,
+        and its operands, or None if no sequence starts there.
+        '''
+        decoded = self._decoded
+        end = self.memory_size
+        op, arg = decoded [start]
+        fused = None
+        if op == lmc.LMC.LDA:
+            # Cells up to a possible branch must be watched even if there's
+            # no sequence yet.
+            length = min (4, end - start)
+            if length >= 3:
+                op1, y = decoded [start + 1]
+                op2, z = decoded [start + 2]
+                kind = { lmc.LMC.ADD:ADD_STORE,
+                         lmc.LMC.SUB:SUB_STORE }.get (op1)
+                if kind and op2 == lmc.LMC.STA:
+                    fused = (kind, 3, arg, y, z, None, None)
+                    if length == 4 and z != start + 3:
+                        op3, target = decoded [start + 3]
+                        if op3 in (lmc.LMC.BRZ, lmc.LMC.BRP):
+                            fused = (kind, 4, arg, y, z, op3, target)
+        elif op == lmc.LMC.IO and arg == 1:
+            length = min (2, end - start)
+            if length == 2:
+                op1, x = decoded [start + 1]
+                if op1 == lmc.LMC.STA:
+                    fused = (INPUT_STORE, 2, x, None, None, None, None)
+        else:
+            length = 1
+
+        self._fused [start] = fused
+        for covered in range (start, start + length):
+            self._owners.setdefault (covered, set ()).add (start)
+        return fused
+
+    def _run_fast (self):
+        '''Internal: Execute until the program halts or pauses.
+
+        This is LMC._run_fast() with fused sequences run in one pass through
+        the loop.  A sequence is only run if it ends before the next step
+        check.  Otherwise its instructions are executed one at a time up to
+        the check.
+        '''
+        HLT, ADD, SUB, STA, LDA, BRA, BRZ, BRP, IO = (
+            lmc.LMC.HLT, lmc.LMC.ADD, lmc.LMC.SUB, lmc.LMC.STA, lmc.LMC.LDA,
+            lmc.LMC.BRA, lmc.LMC.BRZ, lmc.LMC.BRP, lmc.LMC.IO)
+        memory = self.memory
+        decoded = self._decoded
+        memory_size = self.memory_size
+        word_max = self.word_max
+        word_range = self.word_range
+        table = self._fused
+        owners = self._owners
+
+        counter = self.counter
+        accumulator = self.accumulator
+        overflow = self.overflow
+        negative = self.negative
+        steps = self.steps
+        check = self._next_check
+        try:
+            while True:
+                if steps >= check:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    check = self._check_steps ()
+                # Count the step before the lookup, as LMC._run_fast() does,
+                # so that running off the end of memory counts the same.
+                steps += 1
+                fused = table [counter]
+                if fused is False:
+                    fused = self._fuse (counter)
+                if fused is not None and steps - 1 + fused [1] <= check:
+                    kind, length, x, y, z, branch, target = fused
+                    if kind == INPUT_STORE:
+                        counter += 1
+                        self.counter = counter
+                        self.accumulator = accumulator
+                        self.overflow = overflow
+                        self.negative = negative
+                        self.steps = steps
+                        go_on = self._do_input ()
+                        accumulator = self.accumulator
+                        overflow = self.overflow
+                        negative = self.negative
+                        if not go_on:
+                            return
+                        # The STA is the rest of the sequence.  Its step is
+                        # counted here since only the INP's was counted above.
+                        length = 1
+                        steps += 1
+                        z = x
+                    elif kind == ADD_STORE:
+                        value = memory [x] + memory [y]
+                        overflow = value > word_max
+                        negative = False
+                        accumulator = value % word_range
+                    else:
+                        value = memory [x] - memory [y]
+                        overflow = False
+                        negative = value < 0
+                        accumulator = value % word_range
+                    memory [z] = accumulator
+                    decoded [z] = divmod (accumulator, memory_size)
+                    if z in owners:
+                        self._invalidate (z)
+                    steps += length - 1
+                    counter += length
+                    if branch == BRZ:
+                        if accumulator == 0:
+                            counter = target
+                    elif branch == BRP:
+                        if not negative:
+                            counter = target
+                    continue
+
+                op, arg = decoded [counter]
+                counter += 1
+                if op == LDA:
+                    accumulator = memory [arg]
+                    overflow = negative = False
+                elif op == ADD:
+                    value = accumulator + memory [arg]
+                    overflow = value > word_max
+                    negative = False
+                    accumulator = value % word_range
+                elif op == SUB:
+                    value = accumulator - memory [arg]
+                    overflow = False
+                    negative = value < 0
+                    accumulator = value % word_range
+                elif op == STA:
+                    memory [arg] = accumulator
+                    decoded [arg] = divmod (accumulator, memory_size)
+                    if arg in owners:
+                        self._invalidate (arg)
+                elif op == BRZ:
+                    if accumulator == 0:
+                        counter = arg
+                elif op == BRP:
+                    if not negative:
+                        counter = arg
+                elif op == BRA:
+                    counter = arg
+                elif op == IO or op == HLT:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    if op == HLT:
+                        if self.client: self.client.notify_halt ()
+                        # Don't step the counter past HLT.
+                        counter -= 1
+                        return
+                    if arg == 1:
+                        go_on = self._do_input ()
+                        accumulator = self.accumulator
+                        overflow = self.overflow
+                        negative = self.negative
+                        if not go_on:
+                            return
+                    elif arg == 2 and not self._do_output ():
+                        return
+        finally:
+            self.counter = counter
+            self.accumulator = accumulator
+            self.overflow = overflow
+            self.negative = negative
+            self.steps = steps
+            self._next_check = check
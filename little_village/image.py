@@ -0,0 +1,126 @@
+# image.py - Read and write binary program images.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import mmap
+import struct
+import sys
+import zlib
+
+from . import lmc
+
+# An image file starts with a header that identifies it and gives the geometry
+# of the computer it's for, the size and number of words, and the CRC-32 of the
+# words.  The words follow, little-endian, starting from address 0.
+magic = b'LMCI'
+version = 1
+header = struct.Struct ('<4sHHIIII')
+
+class Bad_Image_File (Exception):
+    '''Exception raised when an image file can't be loaded.'''
+    def __init__ (self, file, reason):
+        self.file = file
+        self.reason = reason
+    def __str__ (self):
+        return ('Bad LMC image file %s: %s' % (repr (self.file), self.reason))
+
+class Image:
+    '''The contents of an image file.
+
+    words is an array of the words in the image.  base and memory_size are
+    the geometry of the computer it was made for.
+    '''
+    __slots__ = ('base', 'memory_size', 'words')
+
+    def __init__ (self, base, memory_size, words):
+        self.base = base
+        self.memory_size = memory_size
+        self.words = words
+
+def _typecode (itemsize):
+    '''Internal: Return an array typecode for words of itemsize bytes.'''
+    for code in 'BHILQ':
+        if array.array (code).itemsize == itemsize:
+            return code
+    return None
+
+def is_image (file):
+    '''Return True if file starts like an image file.'''
+    with open (file, 'rb') as f:
+        return f.read (len (magic)) == magic
+
+def write_image (file, words, base = 10, memory_size = 100):
+    '''Write words to file as an image for a computer.'''
+    word_max = lmc.word_max (base, memory_size)
+    if len (words) > memory_size:
+        raise ValueError ('%d words do not fit in %d cells'
+                          % (len (words), memory_size))
+    if len (words) > 0 and (max (words) > word_max or min (words) < 0):
+        raise ValueError ('Words must be from 0 to %d' % word_max)
+    packed = array.array (lmc.word_type (word_max), words)
+    if sys.byteorder == 'big':
+        packed.byteswap ()
+    data = packed.tobytes ()
+    with open (file, 'wb') as f:
+        f.write (header.pack (magic, version, packed.itemsize, base,
+                              memory_size, len (packed), zlib.crc32 (data)))
+        f.write (data)
+
+def read_image (file, typecode = None):
+    '''Read an image file and return an Image.
+
+    The file is memory-mapped and the words are copied out of it in one
+    operation.  If typecode is given the words are returned in an array of
+    that type.  Raise Bad_Image_File if the file is damaged or its words don't
+    fit the geometry it gives.
+    '''
+    with open (file, 'rb') as f:
+        try:
+            data = mmap.mmap (f.fileno (), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file can't be mapped.
+            raise Bad_Image_File (file, 'not an image')
+    with data:
+        if len (data) < header.size:
+            raise Bad_Image_File (file, 'not an image')
+        (tag, file_version, itemsize, base, memory_size, count,
+         checksum) = header.unpack_from (data)
+        if tag != magic:
+            raise Bad_Image_File (file, 'not an image')
+        if file_version != version:
+            raise Bad_Image_File (file, 'version %d is not supported'
+                                  % file_version)
+        code = _typecode (itemsize)
+        if code is None or count > memory_size:
+            raise Bad_Image_File (file, 'bad header')
+        if len (data) != header.size + count*itemsize:
+            raise Bad_Image_File (file, 'wrong size')
+        with memoryview (data) as whole, whole [header.size:] as view:
+            if zlib.crc32 (view) != checksum:
+                raise Bad_Image_File (file, 'bad checksum')
+            words = array.array (code)
+            words.frombytes (view)
+    if sys.byteorder == 'big':
+        words.byteswap ()
+    word_max = lmc.word_max (base, memory_size)
+    if count > 0 and max (words) > word_max:
+        raise Bad_Image_File (file, 'word out of range')
+    if typecode is not None and typecode != code:
+        words = array.array (typecode, words)
+    return Image (base, memory_size, words)
@@ -17,7 +17,14 @@
 # You should have received a copy of the GNU General Public License along with
 # Little Village.  If not, see <http://www.gnu.org/licenses/>.
 
+import array
 import math
+import sys
+
+from . import image
+from .cache import Program_Cache
+from .memory import Paged_Memory
+from .trace import Trace_Writer
 
 class LMC_Client:
     '''A minimal client for an LMC object.
@@ -28,8 +35,15 @@ class LMC_Client:
 
     The methods below are called by the LMC object that was registered with.
     '''
-    def __init__ (self, base = 10, memory = 100):
-        self.computer = LMC (base, memory)
+    def __init__ (self, base = 10, memory = 100, computer_type = None):
+        '''Create the computer and connect to it.
+
+        computer_type is the class of the back end.  It defaults to LMC.  Other
+        execution engines, such as compiler.Compiled_LMC, may be given.
+        '''
+        if computer_type is None:
+            computer_type = LMC
+        self.computer = computer_type (base, memory)
         self.computer.connect (self)
 
     def notify_input (self):
@@ -45,7 +59,9 @@ class LMC_Client:
     def notify_output (self, output):
         '''Called when the computer has produced output.
 
-        The value of the computer's output register is passed.
+        The value of the computer's output register is passed.  Return False
+        to pause until LMC.resume() is called.  Any other value, including
+        None, continues.
         '''
         pass
 
@@ -61,6 +77,46 @@ class LMC_Client:
         '''Called when the program finishes.'''
         pass
 
+    def notify_break (self, kind, value):
+        '''Called when a breakpoint or watchpoint triggers.
+
+        kind is LMC.BREAKPOINT before the instruction at a breakpoint address
+        is executed.  value is the address.  kind is LMC.WATCH_CELL after a
+        watched memory cell is written, and value is the cell's address.  kind
+        is LMC.WATCH_ACCUMULATOR after an instruction sets the accumulator to a
+        watched value, and value is the accumulator.  Return True to continue
+        execution, False to pause until LMC.resume() is called.
+        '''
+        return False
+
+class _Stream_Client (LMC_Client):
+    '''Internal: The client used by LMC.execute().
+
+    Input is taken from an iterator.  Execution pauses after each output so
+    that it can be yielded, and when the iterator runs out.  Breaks are passed
+    on to the computer's usual client, if there is one.
+    '''
+    def __init__ (self, inputs, client):
+        self.inputs = inputs
+        self.client = client
+        self.output = None
+        self.has_output = False
+
+    def notify_input (self):
+        for value in self.inputs:
+            return value
+        return False
+
+    def notify_output (self, output):
+        self.output = output
+        self.has_output = True
+        return False
+
+    def notify_break (self, kind, value):
+        if self.client:
+            return self.client.notify_break (kind, value)
+        return True
+
 class Program_File_Not_Found (Exception):
     '''Exception raised when a program file that does not exist is specified.'''
     def __init__ (self, file):
@@ -109,13 +165,238 @@ class Bad_Input_Type (Exception):
                 'converted to an integer.'
                 % (self.input, type (self.input)))
 
+class Step_Limit_Exceeded (Exception):
+    '''Exception raised when a run goes past the maximum number of steps.'''
+    def __init__ (self, steps):
+        self.steps = steps
+    def __str__ (self):
+        return ('Step limit exceeded: the program did not halt after %d steps.'
+                % self.steps)
+
+class Infinite_Loop (Exception):
+    '''Exception raised when the computer returns to a state it has been in.'''
+    def __init__ (self, address, steps):
+        self.address = address
+        self.steps = steps
+    def __str__ (self):
+        return ('Infinite loop at address %d after %d steps.'
+                % (self.address, self.steps))
+
+class Step_Not_Recorded (Exception):
+    '''Exception raised when going to a step that isn't in the history.'''
+    def __init__ (self, step, first, last):
+        self.step = step
+        self.first = first
+        self.last = last
+    def __str__ (self):
+        return ('Step %d is not in the history.\n'
+                'Steps from %d to %d are available.'
+                % (self.step, self.first, self.last))
+
+class _End_Of_Slice (Exception):
+    '''Internal: Raised to stop resume() after the number of steps asked for.'''
+    pass
+
 def digits (n, base):
     '''Return the number of digits needed to provide n different values.'''
     return int (math.ceil (math.log (n, base)))
 
+def word_max (base, memory_size):
+    '''Return the largest word of a computer with a base and memory size.'''
+    return base**(digits (10, base) + digits (memory_size, base)) - 1
+
+def _is_power_of_two (n):
+    return n > 0 and n & (n - 1) == 0
+
+def word_type (n):
+    '''Return the smallest array typecode that can hold values up to n.'''
+    for code in 'BHILQ':
+        if n < 2**(8*array.array (code).itemsize):
+            return code
+    raise OverflowError ('No array type can hold %d' % n)
+
+def decode_all (memory, memory_size):
+    '''Return the opcode and argument for each word in memory.
+
+    The result is a list, or a Paged_Memory if memory is paged.
+    '''
+    if _is_power_of_two (memory_size):
+        bits = memory_size.bit_length () - 1
+        mask = memory_size - 1
+        decode = lambda word: (word >> bits, word & mask)
+    else:
+        decode = lambda word: divmod (word, memory_size)
+    if isinstance (memory, Paged_Memory):
+        return memory.map (decode, memory.page_size*[(0, 0)])
+    return [decode (word) for word in memory]
+
+# The programs loaded by all of the computers in this process.
+program_cache = Program_Cache ()
+
+class Snapshot:
+    '''A copy of the registers and memory of an LMC.
+
+    Made by LMC.snapshot() and used by LMC.restore().
+    '''
+    __slots__ = ('registers', 'memory', 'decoded')
+
+    def __init__ (self, registers, memory, decoded):
+        self.registers = registers
+        self.memory = memory
+        self.decoded = decoded
+
+class Profile:
+    '''Execution counts collected while an LMC runs.
+
+    addresses is the number of times the instruction at each address was
+    executed.  opcodes is the number of times each opcode was executed.  taken
+    and not_taken count the outcomes of the branches at each address.
+    '''
+    __slots__ = ('steps', 'addresses', 'opcodes', 'taken', 'not_taken')
+
+    def __init__ (self, memory_size, opcodes):
+        self.steps = 0
+        self.addresses = memory_size*[0]
+        self.opcodes = opcodes*[0]
+        self.taken = memory_size*[0]
+        self.not_taken = memory_size*[0]
+
+class History:
+    '''A record of execution that can rebuild earlier states.
+
+    A checkpoint is a Snapshot of the computer taken every interval steps.
+    After each step, the address of the instruction, the accumulator, the
+    flags, and the memory cell written, if any, are logged.  The state at any
+    recorded step is rebuilt by replaying the log from the checkpoint before
+    it.  Everything else about the step can be worked out from the memory at
+    the time.  If limit is not None, only that many checkpoints are kept.  The
+    log before the oldest one is discarded.
+    '''
+    __slots__ = ('interval', 'limit', 'memory_size', 'first', 'end',
+                 'checkpoints', 'logs')
+
+    # The number of entries in the log for each step.
+    fields = 4
+
+    def __init__ (self, snapshot, memory_size, interval = 1000, limit = None):
+        self.interval = interval
+        self.limit = limit
+        self.memory_size = memory_size
+        self.start (snapshot)
+
+    def start (self, snapshot):
+        '''Forget everything and start again from snapshot.'''
+        # The steps of the first and last recorded states.
+        self.first = self.end = snapshot.registers [-1]
+        self.checkpoints = [snapshot]
+        # The log of the steps that follow each checkpoint.
+        self.logs = [array.array ('q')]
+
+    def write (self, address, opcode, accumulator, overflow, negative,
+               written = None):
+        '''Log a step.  Takes the same arguments as Trace_Writer.write().'''
+        log = self.logs [-1]
+        log.extend ((address, accumulator,
+                     (1 if overflow else 0) | (2 if negative else 0),
+                     -1 if written is None else written))
+        self.end += 1
+        if len (log) == self.interval*History.fields:
+            self.checkpoints.append (self._replay (self.checkpoints [-1], log,
+                                                   self.interval))
+            self.logs.append (array.array ('q'))
+            if self.limit is not None and len (self.checkpoints) > self.limit:
+                del self.checkpoints [0]
+                del self.logs [0]
+                self.first += self.interval
+
+    def truncate (self, step):
+        '''Forget the steps after step.'''
+        if step >= self.end:
+            return
+        index = (step - self.first) // self.interval
+        del self.checkpoints [index + 1:]
+        del self.logs [index + 1:]
+        del self.logs [index][(step - self.first - index*self.interval)
+                              *History.fields:]
+        self.end = step
+
+    def rewind (self, computer):
+        '''Forget the steps after the computer's step count and make the last
+        recorded state match the computer.
+
+        The registers may have been changed between steps, for instance by
+        set_input() after the program paused for input.
+        '''
+        self.truncate (computer.steps)
+        log = self.logs [-1]
+        if log:
+            log [-3] = computer.accumulator
+            log [-2] = ((1 if computer.overflow else 0)
+                        | (2 if computer.negative else 0))
+        else:
+            self.checkpoints [-1] = computer.snapshot ()
+
+    def state (self, step):
+        '''Return a Snapshot of the computer after step steps.'''
+        if step < self.first or step > self.end:
+            raise Step_Not_Recorded (step, self.first, self.end)
+        index = (step - self.first) // self.interval
+        count = step - self.first - index*self.interval
+        return self._replay (self.checkpoints [index], self.logs [index],
+                             count)
+
+    def _replay (self, snapshot, log, count):
+        '''Internal: Return a Snapshot of the state count steps after
+        snapshot.'''
+        (input, output, counter, accumulator, overflow, negative,
+         waiting_for_input, waiting_for_step, steps) = snapshot.registers
+        memory = snapshot.memory [:]
+        memory_size = self.memory_size
+        for i in range (0, count*History.fields, History.fields):
+            address = log [i]
+            op, arg = divmod (memory [address], memory_size)
+            if op == LMC.BRA:
+                counter = arg
+            elif op == LMC.BRZ:
+                counter = arg if accumulator == 0 else address + 1
+            elif op == LMC.BRP:
+                counter = arg if not negative else address + 1
+            elif op == LMC.HLT:
+                counter = address
+            else:
+                counter = address + 1
+            accumulator = log [i + 1]
+            overflow = bool (log [i + 2] & 1)
+            negative = bool (log [i + 2] & 2)
+            if op == LMC.IO:
+                if arg == 1:
+                    input = accumulator
+                elif arg == 2:
+                    output = accumulator
+            written = log [i + 3]
+            if written >= 0:
+                memory [written] = accumulator
+        if count == 0:
+            return snapshot
+        return Snapshot ((input, output, counter, accumulator, overflow,
+                          negative, False, False, steps + count),
+                         memory, decode_all (memory, memory_size))
+
 class LMC:
     '''Implementation of the Little Man Computer.'''
 
+    # Instance attributes are fixed to keep the computer compact.  Subclasses
+    # that add attributes should declare __slots__ too.
+    __slots__ = ('base', 'memory_size', 'address_digits', 'word_digits',
+                 'word_range', 'word_max', 'client', '_handlers', 'memory',
+                 '_decoded', '_loaded', 'input', 'output', 'counter',
+                 'accumulator', 'overflow', 'negative', 'waiting_for_input',
+                 'waiting_for_step', 'steps', 'max_steps', 'loop_interval',
+                 '_next_check', '_seen', '_seen_count',
+                 '_seen_power', 'profile', 'trace', 'history',
+                 'breakpoints', 'watched_cells', 'watched_values',
+                 '_break_step', '_pause_at', '_address_bits', '_word_bits')
+
     # TODO: Use same mnemonic info as assemble?
     HLT = 0
     ADD = 1
@@ -127,6 +408,16 @@ class LMC:
     BRP = 8
     IO = 9
 
+    # Memories with more cells than this are paged.  Only the pages that have
+    # been written take up space.  See memory.Paged_Memory.
+    paged_size = 65536
+    page_size = 4096
+
+    # The kinds of breaks reported by LMC_Client.notify_break().
+    BREAKPOINT = 'breakpoint'
+    WATCH_CELL = 'cell'
+    WATCH_ACCUMULATOR = 'accumulator'
+
     def __init__ (self, base = 10, memory = 100):
         '''Initialize memory and registers.
 
@@ -145,12 +436,60 @@ class LMC:
         self.word_range = self.base**self.word_digits
         # The maximum value a word can have.
         self.word_max = self.word_range - 1
+        # If the base and memory size are powers of 2, the number of bits in
+        # an address and in a word.  Instructions are then decoded with shifts
+        # and masks instead of division.  Otherwise None.
+        self._address_bits = None
+        self._word_bits = None
+        if _is_power_of_two (self.base) and _is_power_of_two (self.memory_size):
+            self._address_bits = self.memory_size.bit_length () - 1
+            self._word_bits = self.word_range.bit_length () - 1
 
         self.client = None
+        self._handlers = self._make_handlers ()
 
-        # Make a memory cell for each possible argument.  Initialize to 0.
-        self.memory = memory*[0]
-        # Initialize all registers to zero.
+        # If not None, run() raises Step_Limit_Exceeded if the program executes
+        # more than this many instructions.
+        self.max_steps = None
+        # If not None, the state of the computer is recorded every
+        # loop_interval steps.  If a recorded state is repeated with no input
+        # in between, the program can never halt and Infinite_Loop is raised.
+        self.loop_interval = None
+        # Execution counts if profiling is on.  See start_profile().
+        self.profile = None
+        # The Trace_Writer if tracing is on.  See start_trace().
+        self.trace = None
+        # The History if it's being recorded.  See start_history().
+        self.history = None
+        # Execution stops before the instructions at these addresses, after
+        # writes to these memory cells, and after the accumulator is set to
+        # these values.  The client is told with notify_break().
+        self.breakpoints = set ()
+        self.watched_cells = set ()
+        self.watched_values = set ()
+
+        # Make a memory cell for each possible argument and initialize all
+        # registers to zero.  Memory is an array of the smallest type that
+        # holds a word, or pages of such arrays for large memories.  The
+        # opcode and argument of each memory cell are split up ahead of time
+        # in _decoded so that it's not done for every step.  It's kept up to
+        # date by load(), decode() and STA instructions.
+        self.reset ()
+
+    def reset (self):
+        '''Clear memory and all of the registers.'''
+        if self.memory_size > self.paged_size:
+            self.memory = Paged_Memory (
+                self.memory_size,
+                array.array (word_type (self.word_max), self.page_size*[0]))
+            self._decoded = Paged_Memory (self.memory_size,
+                                          self.page_size*[(0, 0)])
+        else:
+            self.memory = array.array (word_type (self.word_max),
+                                       self.memory_size*[0])
+            self._decoded = self.memory_size*[(0, 0)]
+        # The state after the last load().
+        self._loaded = None
         self.input = 0
         self.output = 0
         self.counter = 0
@@ -159,6 +498,100 @@ class LMC:
         self.negative = False
         self.waiting_for_input = False
         self.waiting_for_step = False
+        # The number of instructions executed since run().
+        self.steps = 0
+        # The step count at which to check the limit and look for loops.
+        # sys.maxsize if there's nothing to check.
+        self._next_check = sys.maxsize
+        # The step count at which resume() stops if it was given steps, or
+        # None.
+        self._pause_at = None
+        # The state saved for loop detection, the number of checks since it was
+        # saved, and the number of checks to wait before saving a new one.
+        self._forget_states ()
+        # The step count when execution last stopped at a breakpoint.  The
+        # breakpoint is passed over when execution resumes.
+        self._break_step = -1
+        self._restart_history ()
+
+    def start_profile (self):
+        '''Start counting executions by address, opcode, and branch outcome.
+
+        Return the Profile object that holds the counts.  The counts
+        accumulate over runs until stop_profile() is called.
+        '''
+        self.profile = Profile (self.memory_size, len (self._handlers))
+        return self.profile
+
+    def stop_profile (self):
+        '''Stop profiling and return the Profile object.'''
+        profile = self.profile
+        self.profile = None
+        return profile
+
+    def start_trace (self, file, buffer_size = 4096):
+        '''Start recording each instruction executed to a trace file.
+
+        The file is written in blocks of buffer_size records.  It's complete
+        once stop_trace() is called.  Read it with trace.Trace_Reader.  Return
+        the Trace_Writer.
+        '''
+        self.stop_trace ()
+        self.trace = Trace_Writer (file, self.base, self.memory_size,
+                                   buffer_size)
+        return self.trace
+
+    def stop_trace (self):
+        '''Stop tracing and close the trace file.'''
+        if self.trace:
+            self.trace.close ()
+            self.trace = None
+
+    def start_history (self, interval = 1000, limit = None):
+        '''Start recording history so that earlier states can be gone back to.
+
+        A checkpoint of the registers and memory is made every interval steps
+        and a small entry is logged for each step.  If limit is given, only
+        that many checkpoints are kept, which bounds the memory used at the
+        cost of forgetting older steps.  History starts again whenever a
+        program is loaded, run, or restored.  Return the History object.
+        '''
+        self.history = History (self.snapshot (), self.memory_size, interval,
+                                limit)
+        return self.history
+
+    def stop_history (self):
+        '''Stop recording history and forget it.'''
+        self.history = None
+
+    def goto (self, step):
+        '''Put the computer in the state it was in after a recorded step.
+
+        Steps after the current one can be gone to as long as execution hasn't
+        continued since going back.  Raise Step_Not_Recorded if the step isn't
+        in the history.
+        '''
+        history = self.history
+        if history is None:
+            raise Step_Not_Recorded (step, self.steps, self.steps)
+        snapshot = history.state (step)
+        # Keep the history through the restore so that it's still possible to
+        # go forward again.
+        self.history = None
+        try:
+            self.restore (snapshot)
+        finally:
+            self.history = history
+        self._forget_states ()
+
+    def step_back (self, n = 1):
+        '''Go back n steps.  See goto().'''
+        self.goto (self.steps - n)
+
+    def _restart_history (self):
+        '''Internal: Start the history again from the current state.'''
+        if self.history:
+            self.history.start (self.snapshot ())
 
     def connect (self, client):
         '''Specify the client to be notified when something happens.
@@ -169,41 +602,205 @@ class LMC:
         self.client = client
 
     def load (self, file):
-        '''Load a machine-language program from a file'''
+        '''Load a machine-language program from a file.
+
+        The file is either text with one word on each line, or a binary image
+        made by image.write_image() for a computer with the same base and
+        memory size.  Programs are kept in program_cache so that loading one
+        again doesn't read the file unless it has changed.
+        '''
         try:
-            with open (file) as f:
-                program = f.readlines ()
-                for i in range (len (program)):
-                    line = program [i].strip ()
-                    # Ignore blank lines.
-                    if len (line) > 0:
-                        try:
-                            code = int (line)
-                            if not self._is_in_word_range (code):
-                                raise Instruction_Out_Of_Range (code, i, self.word_max)
-                            self.memory [i] = code
-                        except ValueError:
-                            raise Bad_Instruction_Type (code, i);
+            key = program_cache.key (file, self.base, self.memory_size)
+            runs = program_cache.get (key)
+            if runs is None:
+                if image.is_image (file):
+                    runs = self._read_image (file)
+                else:
+                    runs = self._read_text (file)
+                program_cache.put (key, runs)
         except IOError:
             raise Program_File_Not_Found (file)
+        self._load_runs (runs)
+
+    def load_code (self, code):
+        '''Load a machine-language program from a sequence of words, such as
+        the code from assemble.Assembler.'''
+        if len (code) > self.memory_size:
+            raise IndexError ('Program does not fit in memory')
+        for i in range (len (code)):
+            if not self._is_in_word_range (code [i]):
+                raise Instruction_Out_Of_Range (code [i], i, self.word_max)
+        self._load_runs ([(0, array.array (word_type (self.word_max), code))])
+
+    def _load_runs (self, runs):
+        '''Internal: Copy a list of start addresses and arrays of words into
+        memory and get ready to run.'''
+        for (start, words) in runs:
+            self.memory [start:start + len (words)] = words
+        self.decode ()
+        self._loaded = self.snapshot ()
+        self._restart_history ()
+
+    def _read_text (self, file):
+        '''Internal: Read words from a text file.
+
+        Return a list of start addresses and arrays of words.  Blank lines
+        leave memory unchanged, so they separate the arrays.
+        '''
+        runs = []
+        words = None
+        with open (file) as f:
+            program = f.readlines ()
+        code = word_type (self.word_max)
+        for i in range (len (program)):
+            line = program [i].strip ()
+            # Ignore blank lines.
+            if len (line) == 0:
+                words = None
+                continue
+            # Only lines with words count, so trailing blank lines don't.
+            if i >= self.memory_size:
+                raise IndexError ('Program does not fit in memory')
+            try:
+                word = int (line)
+            except ValueError:
+                raise Bad_Instruction_Type (line, i)
+            if not self._is_in_word_range (word):
+                raise Instruction_Out_Of_Range (word, i, self.word_max)
+            if words is None:
+                words = array.array (code)
+                runs.append ((i, words))
+            words.append (word)
+        return runs
+
+    def _read_image (self, file):
+        '''Internal: Read the words of a binary image.  Return them as a
+        list of one start address and array.'''
+        loaded = image.read_image (file, word_type (self.word_max))
+        if (loaded.base != self.base
+            or loaded.memory_size != self.memory_size):
+            raise image.Bad_Image_File (
+                file, 'made for base %d with %d cells'
+                % (loaded.base, loaded.memory_size))
+        return [(0, loaded.words)]
+
+    def snapshot (self):
+        '''Return a copy of the registers and memory.'''
+        return Snapshot ((self.input, self.output, self.counter,
+                          self.accumulator, self.overflow, self.negative,
+                          self.waiting_for_input, self.waiting_for_step,
+                          self.steps),
+                         self.memory [:], self._decoded [:])
+
+    def restore (self, snapshot = None):
+        '''Put back the registers and memory from snapshot().
+
+        If no snapshot is given, restore the state right after the last call to
+        load().  This resets the computer for another run without reading the
+        program file again.  If nothing has been loaded, reset().
+        '''
+        if snapshot is None:
+            snapshot = self._loaded
+            if snapshot is None:
+                self.reset ()
+                return
+        (self.input, self.output, self.counter, self.accumulator,
+         self.overflow, self.negative, self.waiting_for_input,
+         self.waiting_for_step, self.steps) = snapshot.registers
+        # Copy in place so that references to memory stay valid.
+        self.memory [:] = snapshot.memory
+        self._decoded [:] = snapshot.decoded
+        self._restart_history ()
 
-    def run (self):
+    def decode (self):
+        '''Rebuild the table of decoded instructions from memory.
+
+        This is done by load().  It must be called after memory is changed by
+        anything other than load() or the execution of the program.
+        '''
+        self._decoded [:] = decode_all (self.memory, self.memory_size)
+
+    def run (self, fast = None, steps = None):
         '''Start the program from the beginning.
 
         We only reset the counter, the other registers retain their values.  It
         is the programmer's responsibility to make sure the code does not depend
-        on previous register values if it is to be re-run.
+        on previous register values if it is to be re-run.  See resume() for the
+        meaning of fast and steps, and the return value.
         '''
         self.counter = 0
-        self.resume ()
+        self.steps = 0
+        self._forget_states ()
+        self._break_step = -1
+        self._restart_history ()
+        return self.resume (fast, steps)
+
+    def execute (self, inputs = ()):
+        '''Run the program from the beginning and generate its outputs.
+
+        Inputs are taken from any iterable, one at a time as the program asks
+        for them, and each output is yielded as soon as it's produced.  Nothing
+        is buffered, so endless input streams run in constant memory.  The
+        generator finishes when the program halts or when it needs input and
+        the iterable is exhausted.  In that case waiting_for_input is True.
+        The client, if any, is only told about breaks.
+        '''
+        stream = _Stream_Client (iter (inputs), self.client)
+        start = self.run
+        while True:
+            client = self.client
+            self.client = stream
+            stream.has_output = False
+            try:
+                start ()
+            finally:
+                self.client = client
+            start = self.resume
+            if not stream.has_output:
+                return
+            yield stream.output
 
-    def resume (self):
+    def resume (self, fast = None, steps = None):
         '''Start or restart the program.
 
         Any initialization must be done beforehand.  This can be used to by a
         client to resume after returning False to a notification method.
+
+        If fast is None the fast run loop is used when the client does not
+        override notify_step().  The fast loop does not call notify_step(); it
+        only calls out to the client for input, output, and halt.  Pass True or
+        False to force the choice.
+
+        If steps is given, execution pauses after at most that many
+        instructions.  Return True if it paused for that reason, False if it
+        halted or a notification method asked to pause.
+
+        See max_steps and loop_interval for stopping programs that don't halt,
+        and breakpoints, watched_cells, and watched_values for stopping at
+        points of interest.
         '''
-        while self.step (): pass
+        if steps is not None:
+            self._pause_at = self.steps + steps
+        self._next_check = self._following_check (self.steps)
+        if self.history:
+            # Going on from an earlier step starts a new future.
+            self.history.rewind (self)
+        if fast is None:
+            fast = not self._has_step_hook ()
+        try:
+            if fast and (self.profile or self.trace or self.history
+                         or self.breakpoints or self.watched_cells
+                         or self.watched_values):
+                self._run_instrumented ()
+            elif fast:
+                self._run_fast ()
+            else:
+                while self.step (): pass
+        except _End_Of_Slice:
+            return True
+        finally:
+            self._pause_at = None
+        return False
 
     def set_input (self, value):
         '''Called by a client to fill the input register.'''
@@ -232,65 +829,597 @@ class LMC:
         '''
         if not self._can_do_step (): return False
 
-        opcode = self.memory [self.counter]
+        if (self.counter in self.breakpoints and self.steps != self._break_step
+            and not self._break (LMC.BREAKPOINT, self.counter)):
+            self._break_step = self.steps
+            return False
+        if self.history:
+            self.history.rewind (self)
+        if self.steps >= self._next_check:
+            self._next_check = self._check_steps ()
+        self.steps += 1
+        address = self.counter
+        op, arg = self._decoded [address]
+        if self.profile:
+            self._profile_step (op, arg)
         self.counter += 1
+        go_on = self._handlers [op] (arg)
+        if self.trace or self.history:
+            written = arg if op == LMC.STA else None
+            if self.trace:
+                self.trace.write (address, op, self.accumulator,
+                                  self.overflow, self.negative, written)
+            if self.history:
+                self.history.write (address, op, self.accumulator,
+                                    self.overflow, self.negative, written)
+        if go_on and (self.watched_cells or self.watched_values):
+            if op == LMC.STA and arg in self.watched_cells:
+                go_on = self._break (LMC.WATCH_CELL, arg)
+            elif (self.accumulator in self.watched_values
+                  and self._sets_accumulator (op, arg)):
+                go_on = self._break (LMC.WATCH_ACCUMULATOR, self.accumulator)
+        return go_on
+
+    def _sets_accumulator (self, op, arg):
+        '''Internal: Return True if an instruction loads the accumulator.'''
+        return (op == LMC.LDA or op == LMC.ADD or op == LMC.SUB
+                or (op == LMC.IO and arg == 1))
+
+    def _break (self, kind, value):
+        '''Internal: Tell the client that a breakpoint or watchpoint triggered.
 
-        op = opcode // self.memory_size
-        arg = opcode - self.memory_size * op
-
-        go_on = True;
-
-        if op == LMC.HLT:
-            if self.client: self.client.notify_halt ()
-            # Don't step the counter past HLT.
-            self.counter -= 1
-            go_on = False
-        if op == LMC.ADD:
-            self._set_accumulator (self.accumulator + self.memory [arg])
-        elif op == LMC.SUB:
-            self._set_accumulator (self.accumulator - self.memory [arg])
-        elif op == LMC.STA:
-            self.memory [arg] = self.accumulator
-        elif op == LMC.LDA:
-            self._set_accumulator (self.memory [arg])
+        Return False to pause.  With no client, always pause.
+        '''
+        if self.client:
+            return self.client.notify_break (kind, value)
+        return False
+
+    def _profile_step (self, op, arg):
+        '''Internal: Count the instruction about to be executed.'''
+        profile = self.profile
+        profile.steps += 1
+        profile.addresses [self.counter] += 1
+        profile.opcodes [op] += 1
+        if op == LMC.BRZ or op == LMC.BRP:
+            if (self.accumulator == 0 if op == LMC.BRZ else not self.negative):
+                profile.taken [self.counter] += 1
+            else:
+                profile.not_taken [self.counter] += 1
         elif op == LMC.BRA:
+            profile.taken [self.counter] += 1
+
+    def _following_check (self, steps):
+        '''Internal: Return the step count for the next check after steps.'''
+        check = sys.maxsize if self._pause_at is None else self._pause_at
+        if self.max_steps is not None:
+            check = min (check, self.max_steps)
+        if self.loop_interval:
+            check = min (check, (steps // self.loop_interval + 1)
+                         *self.loop_interval)
+        return check
+
+    def _forget_states (self):
+        '''Internal: Start loop detection again from the next check.'''
+        self._seen = None
+        self._seen_count = 0
+        self._seen_power = 1
+
+    def _check_steps (self):
+        '''Internal: Enforce the step limit, look for loops, and end slices.
+
+        Called before an instruction when steps reaches the planned check.
+        Return the step count for the next check.  Raise _End_Of_Slice if
+        resume() was asked to stop here.
+        '''
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            raise Step_Limit_Exceeded (self.max_steps)
+        if self.loop_interval and self.steps % self.loop_interval == 0:
+            state = (self.counter, self.accumulator, self.overflow,
+                     self.negative, self.memory.tobytes ())
+            if state == self._seen:
+                raise Infinite_Loop (self.counter, self.steps)
+            # Brent's method: save the state after twice as many checks each
+            # time.  Only one state is kept, but any cycle is found once the
+            # wait is longer than the cycle.
+            self._seen_count += 1
+            if self._seen is None or self._seen_count >= self._seen_power:
+                self._seen = state
+                self._seen_count = 0
+                self._seen_power *= 2
+        if self._pause_at is not None and self.steps >= self._pause_at:
+            raise _End_Of_Slice
+        return self._following_check (self.steps)
+
+    def _make_handlers (self):
+        '''Internal: Return a list of instruction handlers indexed by opcode.
+
+        Each handler takes the instruction's argument and returns True if the
+        program can continue.  Opcodes without an instruction do nothing.
+        '''
+        handlers = (self.word_max // self.memory_size + 1)*[self._do_nothing]
+        handlers [LMC.HLT] = self._do_halt
+        if self._word_bits is None:
+            handlers [LMC.ADD] = self._do_add
+            handlers [LMC.SUB] = self._do_subtract
+            handlers [LMC.LDA] = self._do_load
+        else:
+            handlers [LMC.ADD] = self._do_add_bits
+            handlers [LMC.SUB] = self._do_subtract_bits
+            handlers [LMC.LDA] = self._do_load_bits
+        handlers [LMC.STA] = self._do_store
+        handlers [LMC.BRA] = self._do_branch
+        handlers [LMC.BRZ] = self._do_branch_if_zero
+        handlers [LMC.BRP] = self._do_branch_if_positive
+        handlers [LMC.IO] = self._do_io
+        return handlers
+
+    def _do_nothing (self, arg):
+        return True
+
+    def _do_halt (self, arg):
+        if self.client: self.client.notify_halt ()
+        # Don't step the counter past HLT.
+        self.counter -= 1
+        return False
+
+    def _do_add (self, arg):
+        self._set_accumulator (self.accumulator + self.memory [arg])
+        return True
+
+    def _do_subtract (self, arg):
+        self._set_accumulator (self.accumulator - self.memory [arg])
+        return True
+
+    # Bitwise versions of the handlers for power-of-2 bases.  The word wraps
+    # around with a mask and any bits above the word give the flags.
+
+    def _do_add_bits (self, arg):
+        value = self.accumulator + self.memory [arg]
+        self.overflow = value >> self._word_bits != 0
+        self.negative = False
+        self.accumulator = value & self.word_max
+        return True
+
+    def _do_subtract_bits (self, arg):
+        value = self.accumulator - self.memory [arg]
+        self.overflow = False
+        self.negative = value >> self._word_bits != 0
+        self.accumulator = value & self.word_max
+        return True
+
+    def _do_load_bits (self, arg):
+        self.accumulator = self.memory [arg]
+        self.overflow = self.negative = False
+        return True
+
+    def _do_store (self, arg):
+        self._store (arg, self.accumulator)
+        return True
+
+    def _do_load (self, arg):
+        self._set_accumulator (self.memory [arg])
+        return True
+
+    def _do_branch (self, arg):
+        self.counter = arg
+        return True
+
+    def _do_branch_if_zero (self, arg):
+        if self.accumulator == 0:
+            self.counter = arg
+        return True
+
+    def _do_branch_if_positive (self, arg):
+        if not self.negative:
             self.counter = arg
-        elif op == LMC.BRZ:
-            if self.accumulator == 0:
-                self.counter = arg
-        elif op == LMC.BRP:
-            if not self.negative:
-                self.counter = arg
-        elif op == LMC.IO:
-            if arg == 1:
-                if self.client:
-                    response = self.client.notify_input ();
-                    # If an integer was returned use it as the input and
-                    # continue executing.  Note that a bool is also an int so
-                    # we check for bool first.
-                    if isinstance (response, bool):
-                        go_on = response
-                        self.waiting_for_input = not go_on
-                    else:
-                        try:
-                            self.set_input (int (response))
-                        except ValueError:
-                            raise Bad_Input_Type (response)
+        return True
+
+    def _do_io (self, arg):
+        if arg == 1:
+            return self._do_input ()
+        elif arg == 2:
+            return self._do_output ()
+        return True
+
+    def _decode (self, word):
+        '''Internal: Return the opcode and argument for a word.'''
+        if self._address_bits is not None:
+            return (word >> self._address_bits, word & (self.memory_size - 1))
+        return divmod (word, self.memory_size)
+
+    def _store (self, address, word):
+        '''Internal: Write a word to memory and decode it.'''
+        self.memory [address] = word
+        self._decoded [address] = self._decode (word)
+
+    def _do_input (self):
+        '''Internal: Get input from the client.
+
+        Return False if the client asked to pause.
+        '''
+        # Once there's input, earlier states can't be used to detect loops.
+        if self._seen is not None:
+            self._forget_states ()
+        if not self.client:
+            # If there's no client take what's in the input register.
+            self.set_input (self.input)
+            return True
+
+        response = self.client.notify_input ();
+        # If an integer was returned use it as the input and continue
+        # executing.  Note that a bool is also an int so we check for bool
+        # first.
+        if isinstance (response, bool):
+            self.waiting_for_input = not response
+            return response
+        try:
+            self.set_input (int (response))
+        except ValueError:
+            raise Bad_Input_Type (response)
+        return True
+
+    def _do_output (self):
+        '''Internal: Copy the accumulator to output and notify the client.
+
+        Return False if the client asked to pause.
+        '''
+        self.output = self.accumulator
+        if self.client:
+            return self.client.notify_output (self.output) is not False
+        return True
+
+    def _run_fast (self):
+        '''Internal: Execute until the program halts or pauses.
+
+        This does the same thing as calling step() in a loop but the client is
+        not asked before each instruction.  The registers and memory are cached
+        in local variables and written back before the client is notified of
+        input, output, or halt.  Computers with power-of-2 geometry use
+        _run_fast_bits().
+        '''
+        if self._word_bits is not None:
+            return self._run_fast_bits ()
+        HLT, ADD, SUB, STA, LDA, BRA, BRZ, BRP, IO = (
+            LMC.HLT, LMC.ADD, LMC.SUB, LMC.STA, LMC.LDA,
+            LMC.BRA, LMC.BRZ, LMC.BRP, LMC.IO)
+        memory = self.memory
+        decoded = self._decoded
+        memory_size = self.memory_size
+        word_max = self.word_max
+        word_range = self.word_range
+
+        counter = self.counter
+        accumulator = self.accumulator
+        overflow = self.overflow
+        negative = self.negative
+        steps = self.steps
+        check = self._next_check
+        try:
+            while True:
+                if steps >= check:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    check = self._check_steps ()
+                steps += 1
+                op, arg = decoded [counter]
+                counter += 1
+                if op == LDA:
+                    accumulator = memory [arg]
+                    overflow = negative = False
+                elif op == ADD:
+                    value = accumulator + memory [arg]
+                    overflow = value > word_max
+                    negative = False
+                    accumulator = value % word_range
+                elif op == SUB:
+                    value = accumulator - memory [arg]
+                    overflow = False
+                    negative = value < 0
+                    accumulator = value % word_range
+                elif op == STA:
+                    memory [arg] = accumulator
+                    decoded [arg] = divmod (accumulator, memory_size)
+                elif op == BRZ:
+                    if accumulator == 0:
+                        counter = arg
+                elif op == BRP:
+                    if not negative:
+                        counter = arg
+                elif op == BRA:
+                    counter = arg
+                elif op == IO or op == HLT:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    if op == HLT:
+                        if self.client: self.client.notify_halt ()
+                        # Don't step the counter past HLT.
+                        counter -= 1
+                        return
+                    if arg == 1:
+                        go_on = self._do_input ()
+                        accumulator = self.accumulator
+                        overflow = self.overflow
+                        negative = self.negative
+                        if not go_on:
+                            return
+                    elif arg == 2 and not self._do_output ():
+                        return
+        finally:
+            self.counter = counter
+            self.accumulator = accumulator
+            self.overflow = overflow
+            self.negative = negative
+            self.steps = steps
+            self._next_check = check
+
+    def _run_fast_bits (self):
+        '''Internal: Execute until the program halts or pauses, for a computer
+        whose base and memory size are powers of 2.
+
+        This is _run_fast() with division and comparisons replaced by shifts
+        and masks.
+        '''
+        HLT, ADD, SUB, STA, LDA, BRA, BRZ, BRP, IO = (
+            LMC.HLT, LMC.ADD, LMC.SUB, LMC.STA, LMC.LDA,
+            LMC.BRA, LMC.BRZ, LMC.BRP, LMC.IO)
+        memory = self.memory
+        decoded = self._decoded
+        address_bits = self._address_bits
+        address_mask = self.memory_size - 1
+        word_bits = self._word_bits
+        word_mask = self.word_max
+
+        counter = self.counter
+        accumulator = self.accumulator
+        overflow = self.overflow
+        negative = self.negative
+        steps = self.steps
+        check = self._next_check
+        try:
+            while True:
+                if steps >= check:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    check = self._check_steps ()
+                steps += 1
+                op, arg = decoded [counter]
+                counter += 1
+                if op == LDA:
+                    accumulator = memory [arg]
+                    overflow = negative = False
+                elif op == ADD:
+                    value = accumulator + memory [arg]
+                    overflow = value >> word_bits != 0
+                    negative = False
+                    accumulator = value & word_mask
+                elif op == SUB:
+                    value = accumulator - memory [arg]
+                    overflow = False
+                    negative = value >> word_bits != 0
+                    accumulator = value & word_mask
+                elif op == STA:
+                    memory [arg] = accumulator
+                    decoded [arg] = (accumulator >> address_bits,
+                                     accumulator & address_mask)
+                elif op == BRZ:
+                    if accumulator == 0:
+                        counter = arg
+                elif op == BRP:
+                    if not negative:
+                        counter = arg
+                elif op == BRA:
+                    counter = arg
+                elif op == IO or op == HLT:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    if op == HLT:
+                        if self.client: self.client.notify_halt ()
+                        # Don't step the counter past HLT.
+                        counter -= 1
+                        return
+                    if arg == 1:
+                        go_on = self._do_input ()
+                        accumulator = self.accumulator
+                        overflow = self.overflow
+                        negative = self.negative
+                        if not go_on:
+                            return
+                    elif arg == 2 and not self._do_output ():
+                        return
+        finally:
+            self.counter = counter
+            self.accumulator = accumulator
+            self.overflow = overflow
+            self.negative = negative
+            self.steps = steps
+            self._next_check = check
+
+    def _run_instrumented (self):
+        '''Internal: Execute until the program halts or pauses, with profiling,
+        tracing, history, breakpoints, or watchpoints.
+
+        This is _run_fast() with the counters of the profile updated and trace
+        and history records written in the loop.  Breakpoints and watched
+        cells are looked up in tables indexed by address.  Stores go through
+        _store() so that subclasses see them.
+        '''
+        HLT, ADD, SUB, STA, LDA, BRA, BRZ, BRP, IO = (
+            LMC.HLT, LMC.ADD, LMC.SUB, LMC.STA, LMC.LDA,
+            LMC.BRA, LMC.BRZ, LMC.BRP, LMC.IO)
+        memory = self.memory
+        decoded = self._decoded
+        word_max = self.word_max
+        word_range = self.word_range
+
+        profile = self.profile
+        if profile:
+            addresses = profile.addresses
+            opcodes = profile.opcodes
+            taken = profile.taken
+            not_taken = profile.not_taken
+        writers = [r.write for r in (self.trace, self.history) if r]
+        write = writers [0] if writers else None
+        if len (writers) > 1:
+            def write (*record):
+                for writer in writers:
+                    writer (*record)
+
+        # Tables of flags for breakpoints and watched cells, or None.
+        stop_at = self._address_table (self.breakpoints)
+        watch_at = self._address_table (self.watched_cells)
+        values = self.watched_values
+        skip = self._break_step
+
+        counter = self.counter
+        accumulator = self.accumulator
+        overflow = self.overflow
+        negative = self.negative
+        steps = self.steps
+        start_steps = steps
+        check = self._next_check
+        try:
+            while True:
+                # Breakpoints come before the step check, as in step().
+                if stop_at and stop_at [counter] and steps != skip:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    if not self._break (LMC.BREAKPOINT, counter):
+                        self._break_step = steps
+                        return
+                if steps >= check:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    check = self._check_steps ()
+                steps += 1
+                op, arg = decoded [counter]
+                address = counter
+                counter += 1
+                written = None
+                if profile:
+                    addresses [address] += 1
+                    opcodes [op] += 1
+                if op == LDA:
+                    accumulator = memory [arg]
+                    overflow = negative = False
+                elif op == ADD:
+                    value = accumulator + memory [arg]
+                    overflow = value > word_max
+                    negative = False
+                    accumulator = value % word_range
+                elif op == SUB:
+                    value = accumulator - memory [arg]
+                    overflow = False
+                    negative = value < 0
+                    accumulator = value % word_range
+                elif op == STA:
+                    self._store (arg, accumulator)
+                    written = arg
+                elif op == BRZ or op == BRP:
+                    if accumulator == 0 if op == BRZ else not negative:
+                        counter = arg
+                        if profile:
+                            taken [address] += 1
+                    elif profile:
+                        not_taken [address] += 1
+                elif op == BRA:
+                    counter = arg
+                    if profile:
+                        taken [address] += 1
+                elif op == IO or op == HLT:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    if op == HLT:
+                        if self.client: self.client.notify_halt ()
+                        # Don't step the counter past HLT.
+                        counter -= 1
+                        if write:
+                            write (address, op, accumulator, overflow,
+                                   negative)
+                        return
+                    go_on = True
+                    if arg == 1:
+                        go_on = self._do_input ()
+                        accumulator = self.accumulator
+                        overflow = self.overflow
+                        negative = self.negative
+                    elif arg == 2:
+                        go_on = self._do_output ()
+                    if not go_on:
+                        if write:
+                            write (address, op, accumulator, overflow,
+                                   negative)
+                        return
+                if write:
+                    write (address, op, accumulator, overflow, negative,
+                           written)
+                if watch_at and written is not None and watch_at [written]:
+                    kind, value = LMC.WATCH_CELL, written
+                elif (values and accumulator in values
+                      and self._sets_accumulator (op, arg)):
+                    kind, value = LMC.WATCH_ACCUMULATOR, accumulator
                 else:
-                    # If there's no client take what's in the input register.
-                    self.set_input (self.input)
+                    continue
+                self.counter = counter
+                self.accumulator = accumulator
+                self.overflow = overflow
+                self.negative = negative
+                self.steps = steps
+                if not self._break (kind, value):
+                    return
+        finally:
+            self.counter = counter
+            self.accumulator = accumulator
+            self.overflow = overflow
+            self.negative = negative
+            self.steps = steps
+            self._next_check = check
+            if profile:
+                profile.steps += steps - start_steps
 
-            elif arg == 2:
-                self.output = self.accumulator
-                if self.client:
-                    self.client.notify_output (self.output)
-        return go_on
+    def _address_table (self, addresses):
+        '''Internal: Return a table with a true value at each address in a set,
+        or None if the set is empty.'''
+        if not addresses:
+            return None
+        table = bytearray (self.memory_size)
+        for address in addresses:
+            table [address] = 1
+        return table
+
+    def _has_step_hook (self):
+        '''Internal: Return True if the client wants to be asked before each
+        step.'''
+        if not self.client:
+            return False
+        hook = getattr (type (self.client), 'notify_step', None)
+        return hook is not LMC_Client.notify_step
 
     def _can_do_step (self):
         '''Return False to pause execution.'''
         # Always step when resuming after a wait.
         if self.waiting_for_step:
-            self.waiting_for_setp = False
+            self.waiting_for_step = False
             return True
         # Ask the client what to do.
         if self.client: 
@@ -317,7 +1446,33 @@ class LMC:
                 % (self._format (self.output), self._format (self.counter, True)))
 
         width = 10 if self.base == 10 else 16
+        if isinstance (self.memory, Paged_Memory):
+            # Only show the rows that have something in them, with the
+            # address of the first cell.
+            rows = set ()
+            for (start, values) in self.memory.regions ():
+                rows.update (range (start // width,
+                                    (start + len (values) - 1) // width + 1))
+            for row in sorted (rows):
+                str += '\n%s:' % self._format (row*width, True)
+                for i in range (row*width,
+                                min ((row + 1)*width, self.memory_size)):
+                    str += ' %s' % self._format (self.memory [i])
+            return str
         for i in range (0, self.memory_size):
             if i % width == 0: str += '\n'
             str += ' %s' % self._format (self.memory [i])
         return str
+
+    def _words (self):
+        '''Internal: Generate the address and contents of the memory cells.
+
+        For paged memory, only cells in allocated pages are given.
+        '''
+        if isinstance (self.memory, Paged_Memory):
+            for (start, page) in self.memory.pages ():
+                for i in range (len (page)):
+                    yield (start + i, page [i])
+        else:
+            for address in range (self.memory_size):
+                yield (address, self.memory [address])
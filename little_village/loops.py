@@ -0,0 +1,398 @@
+# loops.py - Skip iterations of simple counted loops.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import sys
+
+from . import lmc
+from .memory import Paged_Memory
+
+# The symbol for the accumulator at the start of an iteration.  Other symbols
+# are the addresses of memory cells.
+ACC = -1
+
+def _combine (a, b, sign):
+    '''Return the sum of two linear forms, or the difference if sign is -1.'''
+    form = dict (a)
+    for (symbol, coefficient) in b.items ():
+        form [symbol] = form.get (symbol, 0) + sign*coefficient
+        if form [symbol] == 0:
+            del form [symbol]
+    return form
+
+def _first_zero (a, k, modulus):
+    '''Return the smallest i >= 0 where a + i*k is a multiple of modulus, or
+    None if there isn't one.'''
+    k %= modulus
+    g = math.gcd (k, modulus)
+    if a % g != 0:
+        return None
+    if k == 0:
+        return 0
+    modulus //= g
+    return (-a//g*pow (k//g, -1, modulus)) % modulus
+
+class Loop:
+    '''What one iteration of a loop does, in terms of its starting state.
+
+    Values are linear forms: dicts of coefficients indexed by symbol.  A
+    symbol is ACC or the address of a memory cell.  start is the address of
+    the first instruction and length is the number of instructions.  steps has
+    the amount added to each memory cell written by the loop, and accumulator
+    has the amount added to the accumulator, or None if the starting
+    accumulator isn't used.  These are forms in the cells that the loop doesn't
+    write.
+
+    branch is the opcode of the conditional branch and stay is True if taking
+    it stays in the loop.  For BRZ, value is the accumulator tested.  For BRP,
+    value and operand are the accumulator and the memory cell of the SUB that
+    sets the negative flag.  operand is None if the flag is set by LDA or ADD.
+    '''
+    __slots__ = ('start', 'length', 'steps', 'accumulator', 'branch', 'stay',
+                 'value', 'operand')
+
+class Accelerated_LMC (lmc.LMC):
+    '''An LMC that skips ahead through loops with a fixed step.
+
+    When the fast loop takes a branch back to an earlier address, the
+    instructions in between are checked.  The loop can be accelerated if it's
+    a run of LDA, ADD, SUB, and STA instructions with one BRZ or BRP that
+    leaves the loop, where each cell that's written, and the accumulator if
+    its value is carried from one iteration to the next, has the same amount
+    added on each iteration.  The loop must not write to its own code.
+
+    The number of iterations before the branch leaves the loop is worked out
+    from the starting values, and memory and the accumulator are set to what
+    they'd be all but one iteration later.  The last two iterations are
+    executed normally so the flags and the exit are exactly as they would be.
+    If the count can't be found, for instance when a value with a BRP test
+    wraps around, the loop runs normally until the count can be found.
+    Iterations aren't skipped past the next step check, so step limits, loop
+    detection and slices behave as they do for LMC.
+
+    A store to a cell in a loop throws away what was learned about it.
+    '''
+    __slots__ = ('_loops', '_owners')
+
+    def reset (self):
+        lmc.LMC.reset (self)
+        self._reset_loops ()
+
+    def restore (self, snapshot = None):
+        lmc.LMC.restore (self, snapshot)
+        self._reset_loops ()
+
+    def decode (self):
+        lmc.LMC.decode (self)
+        self._reset_loops ()
+
+    def _reset_loops (self):
+        '''Internal: Forget all loops.'''
+        # Loops indexed by the address of the branch back to the start.  None
+        # marks a loop that can't be accelerated and False a branch that
+        # hasn't been looked at.
+        if self.memory_size > self.paged_size:
+            self._loops = Paged_Memory (self.memory_size,
+                                        self.page_size*[False])
+        else:
+            self._loops = self.memory_size*[False]
+        # The branch addresses of the loops that cover each address.
+        self._owners = {}
+
+    def _store (self, address, word):
+        lmc.LMC._store (self, address, word)
+        if address in self._owners:
+            self._invalidate (address)
+
+    def _invalidate (self, address):
+        '''Internal: Forget the loops that cover an address.'''
+        for end in self._owners.pop (address, ()):
+            self._loops [end] = False
+
+    def _find_loop (self, end):
+        '''Internal: Analyze and cache the loop closed by the branch at an
+        address.
+
+        Return a Loop, or None if the loop can't be accelerated.
+        '''
+        start = self._decoded [end][1]
+        loop = self._analyze (start, end)
+        self._loops [end] = loop
+        for covered in range (start, end + 1):
+            self._owners.setdefault (covered, set ()).add (end)
+        return loop
+
+    def _analyze (self, start, end):
+        '''Internal: Return a Loop for the code from start to end, or None.'''
+        branches = (lmc.LMC.BRA, lmc.LMC.BRZ, lmc.LMC.BRP)
+        code = [self._decoded [a] for a in range (start, end + 1)]
+
+        # Find the conditional branch that leaves the loop.
+        tests = [i for i in range (len (code)) if code [i][0] in branches]
+        if code [-1][0] == lmc.LMC.BRA:
+            if len (tests) != 2:
+                return None
+            test = tests [0]
+            if code [test][0] == lmc.LMC.BRA or start <= code [test][1] <= end:
+                return None
+            stay = False
+        elif len (tests) == 1:
+            test = tests [0]
+            stay = True
+        else:
+            return None
+
+        loop = Loop ()
+        loop.start = start
+        loop.length = len (code)
+        loop.branch = code [test][0]
+        loop.stay = stay
+        loop.operand = None
+
+        # Run the loop on linear forms.
+        accumulator = { ACC:1 }
+        cells = {}
+        setter = None
+        for i in range (len (code)):
+            op, arg = code [i]
+            if op in (lmc.LMC.LDA, lmc.LMC.ADD, lmc.LMC.SUB):
+                operand = cells.get (arg, { arg:1 })
+                setter = (op, accumulator, operand)
+                if op == lmc.LMC.LDA:
+                    accumulator = operand
+                else:
+                    accumulator = _combine (accumulator, operand,
+                                            1 if op == lmc.LMC.ADD else -1)
+            elif op == lmc.LMC.STA:
+                if start <= arg <= end:
+                    return None
+                cells [arg] = accumulator
+            elif op not in branches:
+                return None
+            if i == test:
+                if op == lmc.LMC.BRZ:
+                    loop.value = accumulator
+                elif setter is None:
+                    # The flag comes from before the loop.
+                    return None
+                elif setter [0] == lmc.LMC.SUB:
+                    loop.value = setter [1]
+                    loop.operand = setter [2]
+                else:
+                    loop.value = {}
+
+        # Each written cell must change by an amount that doesn't depend on
+        # anything that's written.
+        def fixed (form):
+            return all ([s != ACC and s not in cells for s in form])
+        loop.steps = {}
+        for (cell, form) in cells.items ():
+            step = _combine (form, { cell:1 }, -1)
+            if not fixed (step):
+                return None
+            loop.steps [cell] = step
+        forms = list (cells.values ()) + [loop.value, accumulator]
+        if loop.operand is not None:
+            if not fixed (loop.operand):
+                return None
+            forms.append (loop.operand)
+        loop.accumulator = None
+        if any ([ACC in form for form in forms]):
+            step = _combine (accumulator, { ACC:1 }, -1)
+            if not fixed (step):
+                return None
+            loop.accumulator = step
+        return loop
+
+    def _skip (self, loop):
+        '''Internal: Skip iterations of a loop that's about to start.
+
+        Iterations are skipped up to the last one before the loop ends or the
+        next step check would be reached.
+        '''
+        memory = self.memory
+        word_range = self.word_range
+        accumulator = self.accumulator
+
+        def evaluate (form):
+            return sum ([c*(accumulator if s == ACC else memory [s])
+                         for (s, c) in form.items ()])
+        steps = dict ([(cell, evaluate (step))
+                       for (cell, step) in loop.steps.items ()])
+        if loop.accumulator is not None:
+            steps [ACC] = evaluate (loop.accumulator)
+        def slope (form):
+            return sum ([c*steps [s] for (s, c) in form.items () if s in steps])
+
+        # Find the number of iterations that stay in the loop.  None means it
+        # never leaves.
+        value = evaluate (loop.value) % word_range
+        k = slope (loop.value) % word_range
+        if loop.branch == lmc.LMC.BRZ:
+            if loop.stay:
+                count = 0 if value != 0 else (1 if k != 0 else None)
+            else:
+                count = _first_zero (value, k, word_range)
+        elif loop.operand is None:
+            # Never negative, so the branch is always taken.
+            count = None if loop.stay else 0
+        else:
+            count = self._count_positive (value, k,
+                                          evaluate (loop.operand) % word_range,
+                                          loop.stay)
+
+        if count is None and self._next_check == sys.maxsize:
+            # Nothing will ever stop the loop, so there's no end to skip to.
+            # It runs forever, as it would without acceleration.
+            return
+        # The last iteration before the loop ends or the step check is run
+        # normally to set the flags.
+        room = (self._next_check - self.steps) // loop.length
+        skip = (room if count is None else min (count, room)) - 1
+        if skip <= 0:
+            return
+        for (cell, step) in steps.items ():
+            if cell != ACC:
+                self._store (cell, (memory [cell] + skip*step) % word_range)
+        if loop.accumulator is not None:
+            self.accumulator = (accumulator + skip*steps [ACC]) % word_range
+        self.steps += skip*loop.length
+
+    def _count_positive (self, value, k, operand, stay):
+        '''Internal: Return how many iterations in a row the BRP of a loop
+        stays in the loop, or a smaller count if it's not known.
+
+        The SUB before the branch subtracts operand from value, which changes
+        by k on each iteration.  The count is only worked out up to where value
+        wraps around.
+        '''
+        word_range = self.word_range
+        if k == 0:
+            taken = value >= operand
+            return None if taken == stay else 0
+        if k <= word_range // 2:
+            # Rising: not taken, then taken.
+            span = (word_range - 1 - value)//k + 1
+            first = max (0, -(-(operand - value)//k))
+            if stay:
+                return 0 if first > 0 else span
+            return min (first, span)
+        # Falling: taken, then not taken.
+        k = word_range - k
+        span = value//k + 1
+        last = (value - operand)//k + 1 if value >= operand else 0
+        if stay:
+            return min (last, span)
+        return 0 if last > 0 else span
+
+    def _run_fast (self):
+        '''Internal: Execute until the program halts or pauses.
+
+        This is LMC._run_fast() with a check for a loop that can be skipped
+        whenever a branch to an earlier address is taken.
+        '''
+        HLT, ADD, SUB, STA, LDA, BRA, BRZ, BRP, IO = (
+            lmc.LMC.HLT, lmc.LMC.ADD, lmc.LMC.SUB, lmc.LMC.STA, lmc.LMC.LDA,
+            lmc.LMC.BRA, lmc.LMC.BRZ, lmc.LMC.BRP, lmc.LMC.IO)
+        memory = self.memory
+        decoded = self._decoded
+        memory_size = self.memory_size
+        word_max = self.word_max
+        word_range = self.word_range
+        loops = self._loops
+        owners = self._owners
+
+        counter = self.counter
+        accumulator = self.accumulator
+        overflow = self.overflow
+        negative = self.negative
+        steps = self.steps
+        check = self._next_check
+        try:
+            while True:
+                if steps >= check:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    check = self._check_steps ()
+                steps += 1
+                op, arg = decoded [counter]
+                counter += 1
+                if op == LDA:
+                    accumulator = memory [arg]
+                    overflow = negative = False
+                elif op == ADD:
+                    value = accumulator + memory [arg]
+                    overflow = value > word_max
+                    negative = False
+                    accumulator = value % word_range
+                elif op == SUB:
+                    value = accumulator - memory [arg]
+                    overflow = False
+                    negative = value < 0
+                    accumulator = value % word_range
+                elif op == STA:
+                    memory [arg] = accumulator
+                    decoded [arg] = divmod (accumulator, memory_size)
+                    if arg in owners:
+                        self._invalidate (arg)
+                elif op == BRA or op == BRZ or op == BRP:
+                    if (op == BRA or (op == BRZ and accumulator == 0)
+                        or (op == BRP and not negative)):
+                        if arg < counter:
+                            loop = loops [counter - 1]
+                            if loop is False:
+                                loop = self._find_loop (counter - 1)
+                            if loop is not None:
+                                self.accumulator = accumulator
+                                self.steps = steps
+                                self._next_check = check
+                                self._skip (loop)
+                                accumulator = self.accumulator
+                                steps = self.steps
+                        counter = arg
+                elif op == IO or op == HLT:
+                    self.counter = counter
+                    self.accumulator = accumulator
+                    self.overflow = overflow
+                    self.negative = negative
+                    self.steps = steps
+                    if op == HLT:
+                        if self.client: self.client.notify_halt ()
+                        # Don't step the counter past HLT.
+                        counter -= 1
+                        return
+                    if arg == 1:
+                        go_on = self._do_input ()
+                        accumulator = self.accumulator
+                        overflow = self.overflow
+                        negative = self.negative
+                        if not go_on:
+                            return
+                    elif arg == 2 and not self._do_output ():
+                        return
+        finally:
+            self.counter = counter
+            self.accumulator = accumulator
+            self.overflow = overflow
+            self.negative = negative
+            self.steps = steps
+            self._next_check = check
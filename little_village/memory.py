@@ -0,0 +1,162 @@
+# memory.py - Sparse memory for large Little Man Computers.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+
+class Paged_Memory:
+    '''A sequence of cells that only stores the pages that have been written.
+
+    Memory is divided into pages of a fixed size.  A page is allocated the
+    first time a cell in it is written with something other than the default
+    value.  Reading a cell in a page that hasn't been allocated gives the
+    default.  Indexing, iteration, len(), and slicing work as they do for a
+    list, except that negative indexes aren't allowed, and [:] gives a
+    Paged_Memory copy.
+    '''
+    __slots__ = ('_size', '_shift', '_mask', '_blank', '_default', '_pages')
+
+    def __init__ (self, size, blank):
+        '''Make a memory with size cells.
+
+        blank is an empty page: an array or list of the default value.  Its
+        length is the page size, which must be a power of 2.
+        '''
+        page_size = len (blank)
+        self._shift = page_size.bit_length () - 1
+        if page_size != 1 << self._shift:
+            raise ValueError ('Page size %d is not a power of 2' % page_size)
+        self._mask = page_size - 1
+        self._size = size
+        self._blank = blank
+        self._default = blank [0]
+        # Allocated pages indexed by page number.
+        self._pages = {}
+
+    @property
+    def page_size (self):
+        return self._mask + 1
+
+    def __len__ (self):
+        return self._size
+
+    def __getitem__ (self, index):
+        try:
+            page = self._pages [index >> self._shift]
+        except KeyError:
+            if index < 0 or index >= self._size:
+                raise IndexError ('memory index out of range')
+            return self._default
+        except TypeError:
+            if index == slice (None):
+                return self.copy ()
+            return [self [i] for i in range (*index.indices (self._size))]
+        return page [index & self._mask]
+
+    def __setitem__ (self, index, value):
+        try:
+            self._pages [index >> self._shift][index & self._mask] = value
+        except KeyError:
+            if index < 0 or index >= self._size:
+                raise IndexError ('memory index out of range')
+            if value != self._default:
+                self._new_page (index >> self._shift)[index & self._mask] = value
+        except TypeError:
+            if index == slice (None) and isinstance (value, Paged_Memory):
+                self._pages = dict ([(number, page [:]) for (number, page)
+                                     in value._pages.items ()])
+            else:
+                values = list (value)
+                indices = range (*index.indices (self._size))
+                if len (values) != len (indices):
+                    raise ValueError ('Slice assignment must not change the '
+                                      'size of memory')
+                for (i, v) in zip (indices, values):
+                    self [i] = v
+
+    def __iter__ (self):
+        for number in range ((self._size + self._mask) >> self._shift):
+            page = self._pages.get (number)
+            if page is None:
+                page = self._blank [:self._page_length (number)]
+            for value in page:
+                yield value
+
+    def _page_length (self, number):
+        '''Internal: Return the number of cells in a page.  Only the last one
+        may be short.'''
+        return min (self._mask + 1, self._size - (number << self._shift))
+
+    def _new_page (self, number):
+        '''Internal: Allocate a page and return it.'''
+        page = self._blank [:self._page_length (number)]
+        self._pages [number] = page
+        return page
+
+    def copy (self):
+        '''Return a copy of the memory.'''
+        memory = Paged_Memory (self._size, self._blank)
+        memory [:] = self
+        return memory
+
+    def map (self, function, blank):
+        '''Return a new memory with function applied to each cell.
+
+        blank is the empty page of the new memory.  Unallocated pages stay
+        unallocated, so function of the default should be the new default.
+        '''
+        memory = Paged_Memory (self._size, blank)
+        for (number, page) in self._pages.items ():
+            new = memory._new_page (number)
+            for i in range (len (page)):
+                new [i] = function (page [i])
+        return memory
+
+    def pages (self):
+        '''Generate the start address and contents of each allocated page in
+        order.'''
+        for number in sorted (self._pages):
+            yield (number << self._shift, self._pages [number])
+
+    def regions (self):
+        '''Generate the start address and values of each run of cells that
+        don't hold the default value.'''
+        start = None
+        values = []
+        for (address, page) in self.pages ():
+            for i in range (len (page)):
+                value = page [i]
+                if value == self._default:
+                    continue
+                if start is None or address + i != start + len (values):
+                    if start is not None:
+                        yield (start, values)
+                    start = address + i
+                    values = []
+                values.append (value)
+        if start is not None:
+            yield (start, values)
+
+    def tobytes (self):
+        '''Return the contents of the allocated pages as bytes.
+
+        Pages must be arrays.  Two memories with the same allocated pages give
+        the same bytes if and only if their contents are the same.
+        '''
+        return b''.join ([struct.pack ('<Q', address) + page.tobytes ()
+                          for (address, page) in self.pages ()])
@@ -0,0 +1,122 @@
+# profiler.py - Report where a Little Man Computer program spends its time.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from . import assemble
+from . import lmc
+
+mnemonics = { lmc.LMC.HLT:'HLT', lmc.LMC.ADD:'ADD', lmc.LMC.SUB:'SUB',
+              lmc.LMC.STA:'STA', lmc.LMC.LDA:'LDA', lmc.LMC.BRA:'BRA',
+              lmc.LMC.BRZ:'BRZ', lmc.LMC.BRP:'BRP', lmc.LMC.IO:'IO' }
+
+def disassemble (op, arg):
+    '''Return the mnemonic form of an instruction.'''
+    if op == lmc.LMC.IO:
+        return { 1:'INP', 2:'OUT' }.get (arg, 'IO %d' % arg)
+    if op == lmc.LMC.HLT:
+        return 'HLT'
+    if op in mnemonics:
+        return '%s %d' % (mnemonics [op], arg)
+    return '??? %d' % arg
+
+def find_source (program, base = 10, memory_size = 100):
+    '''Look for the assembly source of a machine-code file.
+
+    The source is expected to be the file name with '.asm' added.  If it's
+    found, return a list of the source lines for each address, as assembled
+    for a computer with the given base and memory size.  Otherwise return
+    None.  Assembler messages are ignored; only the line for each word of code
+    is needed.
+    '''
+    name = program + '.asm'
+    if not os.path.isfile (name):
+        return None
+    with open (name) as f:
+        text = f.readlines ()
+    asm = assemble.Assembler (base, memory_size)
+    asm.assemble (text)
+    if not asm.lines:
+        return None
+    return [text [n - 1].rstrip () for n in asm.lines]
+
+def _percent (n, total):
+    return 100.0*n/total if total > 0 else 0.0
+
+def report (profile, computer, source = None, top = 10):
+    '''Return the text of a report on a profile.
+
+    The report lists the most executed addresses, the loops that took the most
+    steps, the branch outcomes, and the opcode counts.  If source is given, it
+    has the assembly source line for each address, as from find_source().
+    '''
+    total = profile.steps
+    out = ['Profile: %d steps' % total]
+
+    def line (address):
+        text = '%*d  %-8s' % (computer.address_digits, address,
+                              disassemble (*computer._decode (
+                                  computer.memory [address])))
+        if source and address < len (source):
+            text += '  ' + source [address].strip ()
+        return text.rstrip ()
+
+    out += ['', 'Hot spots:']
+    hot = sorted ([a for a in range (computer.memory_size)
+                   if profile.addresses [a] > 0],
+                  key = lambda a: -profile.addresses [a])
+    for address in hot [:top]:
+        count = profile.addresses [address]
+        out.append ('  %10d %5.1f%%  %s'
+                    % (count, _percent (count, total), line (address)))
+
+    # A loop is a branch back to the same or an earlier address.
+    loops = []
+    for address in range (computer.memory_size):
+        if profile.taken [address] == 0:
+            continue
+        op, target = computer._decode (computer.memory [address])
+        if target <= address:
+            steps = sum (profile.addresses [target:address + 1])
+            loops.append ((steps, target, address, profile.taken [address]))
+    if loops:
+        out += ['', 'Loops:']
+        for (steps, start, end, count) in sorted (loops, reverse = True)[:top]:
+            out.append ('  %*d-%-*d %10d steps %5.1f%%  %d times back to %s'
+                        % (computer.address_digits, start,
+                           computer.address_digits, end, steps,
+                           _percent (steps, total), count, line (start)))
+
+    branches = [a for a in range (computer.memory_size)
+                if profile.taken [a] + profile.not_taken [a] > 0]
+    if branches:
+        out += ['', 'Branches:', '  %10s %10s' % ('taken', 'not taken')]
+        for address in branches:
+            out.append ('  %10d %10d  %s' % (profile.taken [address],
+                                            profile.not_taken [address],
+                                            line (address)))
+
+    out += ['', 'Opcodes:']
+    for op in range (len (profile.opcodes)):
+        count = profile.opcodes [op]
+        if count > 0:
+            out.append ('  %-4s %10d %5.1f%%'
+                        % (mnemonics.get (op, op), count,
+                           _percent (count, total)))
+    return '\n'.join (out)
@@ -20,20 +20,43 @@
 # Little Village.  If not, see <http://www.gnu.org/licenses/>.
 
 from . import lmc
+from . import profiler
+import sys
 
 class Prompt_Client (lmc.LMC_Client):
     prompt = 'LMC> '
+    # The number of history checkpoints kept.  With the default interval of
+    # 1000 steps, the last 100,000 or so steps can be gone back to, and a
+    # program that doesn't halt doesn't use up memory.
+    history_limit = 100
+
+    def __init__ (self):
+        lmc.LMC_Client.__init__ (self)
+        # The name of the loaded program.
+        self.program = None
+        # Record history so that the user can go back.
+        self.computer.start_history (limit = Prompt_Client.history_limit)
 
     def notify_input (self):
-        return int (raw_input ('  input: '))
+        return int (input ('  input: '))
 
     def notify_output (self, out):
         print (out)
         return True
 
+    def notify_break (self, kind, value):
+        if kind == lmc.LMC.BREAKPOINT:
+            print ('Breakpoint at %d' % value)
+        elif kind == lmc.LMC.WATCH_CELL:
+            print ('Wrote %d to %d' % (self.computer.memory [value], value))
+        else:
+            print ('Accumulator is %d' % value)
+        self.show_step ()
+        return False
+
     def run (self):
         try:
-            while self.parse (raw_input (Prompt_Client.prompt)):
+            while self.parse (input (Prompt_Client.prompt)):
                 pass
         except EOFError:
             # Quit on Ctrl+D
@@ -41,7 +64,7 @@ class Prompt_Client (lmc.LMC_Client):
         print ('bye')
 
     def read (self):
-        response = raw_input (Prompt_Client.prompt);
+        response = input (Prompt_Client.prompt);
 
     def parse (self, input):
         tokens = input.split ()
@@ -58,18 +81,90 @@ class Prompt_Client (lmc.LMC_Client):
             return False
         elif command == 'load':
             self.computer.load (argument)
+            self.program = argument
         elif command == 'run':
             self.computer.run ()
+        elif command == 'continue':
+            self.computer.resume ()
+        elif command == 'break':
+            self.toggle (self.computer.breakpoints, int (argument))
+        elif command == 'watch':
+            self.toggle (self.computer.watched_cells, int (argument))
         elif command == 'show':
             print (self.computer)
+        elif command == 'step':
+            self.computer.step ()
+            self.show_step ()
+        elif command == 'back':
+            self.go (self.computer.steps - (int (argument) if argument else 1))
+        elif command == 'goto':
+            self.go (int (argument))
+        elif command == 'profile':
+            self.do_profile (argument)
 
         return True
 
+    def toggle (self, addresses, address):
+        '''Add an address to a set of breakpoints or watched cells, or remove
+        it if it's already there.'''
+        if address in addresses:
+            addresses.remove (address)
+        else:
+            addresses.add (address)
+        print (' '.join ([str (a) for a in sorted (addresses)]))
+
+    def go (self, step):
+        '''Go to a step in the history.'''
+        try:
+            self.computer.goto (step)
+        except lmc.Step_Not_Recorded as error:
+            print (error)
+        else:
+            self.show_step ()
+
+    def show_step (self):
+        '''Show the step count and the next instruction.'''
+        print ('Step %d  counter: %d  accumulator: %d'
+               % (self.computer.steps, self.computer.counter,
+                  self.computer.accumulator))
+
+    def do_profile (self, argument):
+        '''Turn profiling on or off, or show the report.'''
+        if argument == 'off':
+            self.computer.stop_profile ()
+            print ('Profiling off')
+        elif self.computer.profile is None:
+            self.computer.start_profile ()
+            print ('Profiling on')
+        else:
+            source = None
+            if self.program:
+                source = profiler.find_source (self.program,
+                                               self.computer.base,
+                                               self.computer.memory_size)
+            print (profiler.report (self.computer.profile, self.computer,
+                                    source))
+
 def print_help (app):
     print (
 '''Command prompt for the Little Man Computer
 
 Usage: %s
+
+Commands:
+  load <program>  Load a machine-code program
+  run             Run the program from the beginning
+  continue        Continue from a breakpoint or watchpoint
+  break <address> Set or clear a breakpoint
+  watch <address> Stop after writes to a memory cell, or stop watching it
+  show            Show the registers and memory
+  step            Execute one instruction
+  back [<n>]      Go back one or <n> steps
+  goto <step>     Go to the state after <step> steps.  About the last
+                  100,000 steps are kept.
+  profile         Start profiling, or show the report if it's started
+  profile off     Stop profiling
+  quit            Leave the prompt
 ''' % app)
 
 def run (program, args):
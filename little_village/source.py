@@ -0,0 +1,107 @@
+# source.py - Run assembly-language programs without machine-code files.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import hashlib
+import io
+import sys
+
+from . import assemble
+from . import batch
+from . import cache
+
+# The code assembled in this process, keyed by the hash of the source.
+assembled = cache.Program_Cache ()
+
+class Assembly_Error (Exception):
+    '''Exception raised when a source file can't be assembled.'''
+    def __init__ (self, file, messages):
+        self.file = file
+        self.messages = messages
+    def __str__ (self):
+        return ('Could not assemble %s\n%s' % (repr (self.file), self.messages))
+
+def assemble_file (file, warnings = None, base = 10, memory_size = 100):
+    '''Return the machine code for an assembly-language file.
+
+    The code is made for a computer with the given base and memory size.  It's
+    looked up in assembled by the hash of the geometry and the file's
+    contents, so a source is only assembled again after it changes.  When
+    it's assembled, the assembler's messages are written to the stream
+    warnings, if given.  Raise Assembly_Error if there are errors.
+    '''
+    with open (file, 'rb') as f:
+        text = f.read ()
+    h = hashlib.sha256 ()
+    h.update (repr ((base, memory_size)).encode ())
+    h.update (text)
+    key = h.hexdigest ()
+    runs = assembled.get (key)
+    if runs is None:
+        asm = assemble.Assembler (base, memory_size)
+        if not asm.assemble (text.decode ().splitlines (True)):
+            messages = io.StringIO ()
+            asm.messages.write (messages)
+            raise Assembly_Error (file, messages.getvalue ())
+        if warnings is not None:
+            asm.messages.write (warnings)
+        runs = [(0, array.array ('q', asm.code))]
+        assembled.put (key, runs)
+    return runs [0][1]
+
+def load (computer, file, warnings = None):
+    '''Assemble a source file and load the code into computer.'''
+    computer.load_code (assemble_file (file, warnings, computer.base,
+                                       computer.memory_size))
+
+def run_file (client, file, inputs, warnings = None):
+    '''Assemble a source file and run it with client, a
+    batch.Batch_Client.'''
+    load (client.computer, file, warnings)
+    client.run_loaded (inputs)
+
+def print_help (app):
+    print (
+'''Assemble and execute a Little Man Computer program
+
+Usage: %s <source-file> [<input>...]
+
+where <source-file> is an LMC assembly language file and <input>s are
+any integer inputs needed by the program.  No machine-code file is
+written.
+''' % app)
+
+def run (program, args):
+    if len (args) < 1:
+        print_help (program)
+        return
+    client = batch.Batch_Client ()
+    try:
+        run_file (client, args [0], args [1:], sys.stderr)
+    except batch.Unused_Inputs as warning:
+        batch.print_message ('Warning', warning)
+    except Exception as error:
+        batch.print_message ('Error', error)
+
+    # Print the output.
+    for n in client.outputs:
+        print (n)
+
+if __name__ == '__main__':
+    run (sys.argv [0], sys.argv [1:])
@@ -0,0 +1,192 @@
+# trace.py - Record and read binary execution traces.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import mmap
+import struct
+
+# A trace file starts with a header that identifies it and gives the geometry of
+# the computer.  The rest of the file is one fixed-size record for each
+# instruction executed, in order.  Each record has the address of the
+# instruction, the address written by the instruction, the opcode, the flags,
+# and the accumulator after the instruction.  A store writes the accumulator so
+# the value written isn't stored separately.
+magic = b'LMCT'
+version = 1
+header = struct.Struct ('<4sHHII')
+record = struct.Struct ('<IIBBQ')
+
+# Bits in the flags field.
+OVERFLOW = 1
+NEGATIVE = 2
+WRITE = 4
+
+class Bad_Trace_File (Exception):
+    '''Exception raised when a file is not a trace.'''
+    def __init__ (self, file):
+        self.file = file
+    def __str__ (self):
+        return ('Not an LMC trace file: %s' % repr (self.file))
+
+class Step:
+    '''One instruction from a trace.
+
+    counter is the address of the instruction.  accumulator, overflow, and
+    negative are the registers after it was executed.  If the instruction wrote
+    to memory, address is the cell and value is the word written.  Otherwise
+    both are None.
+    '''
+    __slots__ = ('counter', 'opcode', 'accumulator', 'overflow', 'negative',
+                 'address', 'value')
+
+    def __init__ (self, counter, address, opcode, flags, accumulator):
+        self.counter = counter
+        self.opcode = opcode
+        self.accumulator = accumulator
+        self.overflow = bool (flags & OVERFLOW)
+        self.negative = bool (flags & NEGATIVE)
+        if flags & WRITE:
+            self.address = address
+            self.value = accumulator
+        else:
+            self.address = None
+            self.value = None
+
+class Trace_Writer:
+    '''Write trace records to a file.
+
+    Records are collected in a buffer and written when buffer_size records
+    have accumulated, and when flush() or close() is called.  The trace isn't
+    complete until the writer is closed.
+    '''
+    def __init__ (self, file, base, memory_size, buffer_size = 4096):
+        self.file = file
+        self._stream = open (file, 'wb')
+        self._stream.write (header.pack (magic, version, record.size, base,
+                                         memory_size))
+        self._buffer = bytearray (buffer_size*record.size)
+        self._size = len (self._buffer)
+        self._position = 0
+        # The number of records written.
+        self.steps = 0
+
+    def write (self, counter, opcode, accumulator, overflow, negative,
+               address = None):
+        '''Add a record for an instruction.
+
+        address is the memory cell written by the instruction, if any.
+        '''
+        flags = (OVERFLOW if overflow else 0) | (NEGATIVE if negative else 0)
+        if address is None:
+            address = 0
+        else:
+            flags |= WRITE
+        record.pack_into (self._buffer, self._position, counter, address,
+                          opcode, flags, accumulator)
+        self._position += record.size
+        self.steps += 1
+        if self._position == self._size:
+            self.flush ()
+
+    def flush (self):
+        '''Write the buffered records to the file.'''
+        if self._position > 0:
+            self._stream.write (memoryview (self._buffer)[:self._position])
+            self._position = 0
+        self._stream.flush ()
+
+    def close (self):
+        '''Flush and close the file.'''
+        if not self._stream.closed:
+            self.flush ()
+            self._stream.close ()
+
+class Trace_Reader:
+    '''Random access to the records of a trace file.
+
+    The file is memory-mapped so records are read from the page cache as
+    they're needed, not loaded up front.  Records are indexed by step, starting
+    from 0.  Indexing returns a Step; iterating returns a Step for each record.
+    find() scans the raw records without making Step objects.
+    '''
+    def __init__ (self, file):
+        self.file = file
+        with open (file, 'rb') as f:
+            try:
+                self._map = mmap.mmap (f.fileno (), 0, access = mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file can't be mapped.
+                raise Bad_Trace_File (file)
+        if len (self._map) < header.size:
+            self.close ()
+            raise Bad_Trace_File (file)
+        (tag, file_version, size,
+         self.base, self.memory_size) = header.unpack_from (self._map)
+        if tag != magic or file_version != version or size != record.size:
+            self.close ()
+            raise Bad_Trace_File (file)
+        self._length = (len (self._map) - header.size) // record.size
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, *exception):
+        self.close ()
+
+    def close (self):
+        self._map.close ()
+
+    def __len__ (self):
+        return self._length
+
+    def __getitem__ (self, step):
+        if step < 0:
+            step += self._length
+        if step < 0 or step >= self._length:
+            raise IndexError ('trace step out of range')
+        return Step (*record.unpack_from (self._map,
+                                          header.size + step*record.size))
+
+    def __iter__ (self):
+        for fields in self._records ():
+            yield Step (*fields)
+
+    def _records (self, start = 0):
+        '''Internal: Iterate over the raw record tuples from a step on.'''
+        end = header.size + self._length*record.size
+        view = memoryview (self._map)[header.size + start*record.size:end]
+        try:
+            for fields in record.iter_unpack (view):
+                yield fields
+        finally:
+            view.release ()
+
+    def find (self, counter = None, opcode = None, write = None, start = 0):
+        '''Generate the steps that match all of the given conditions.
+
+        counter is the address of the instruction, opcode is its opcode, and
+        write is the address of a memory cell it wrote.  The search begins at
+        the start step.
+        '''
+        step = start
+        for (at, address, op, flags, accumulator) in self._records (start):
+            if ((counter is None or at == counter)
+                and (opcode is None or op == opcode)
+                and (write is None or (flags & WRITE and address == write))):
+                yield step
+            step += 1
@@ -0,0 +1,234 @@
+# vector.py - Run one Little Man Computer program on many inputs at once.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+from . import batch
+from . import lmc
+
+class Vector_LMC:
+    '''Run a program on many sets of input in lockstep.
+
+    Each set of input gets its own lane: a copy of memory and the registers.
+    All of the lanes execute one instruction together on each step.  Lanes that
+    take different branches are handled by masking.  The result for each lane
+    is what a Batch_Client would give for the same program and input.  Inputs
+    must be integers or convertible to integers.  LMC treats bool input as a
+    request to continue or pause; here it's reported as Bad_Input_Type.
+
+    This class requires NumPy.
+    '''
+    def __init__ (self, base = 10, memory = 100):
+        # Use an LMC for loading and for the word size.
+        self.computer = lmc.LMC (base, memory)
+
+    def load (self, file):
+        '''Load a machine-language program from a file.'''
+        self.computer.load (file)
+
+    def run (self, inputs, max_steps = None):
+        '''Run the program once for each list of inputs.
+
+        Return a list with an (outputs, error) pair for each input list.
+        outputs is the list of output values.  error is None, or the
+        exception that Batch_Client.run() would have raised.  If max_steps is
+        given, lanes that are still running after that many steps stop with
+        Step_Limit_Exceeded.
+        '''
+        lanes = len (inputs)
+        self._start (lanes)
+        feed, valid, errors = self._prepare_inputs (inputs)
+
+        # Outputs are collected as arrays of lane numbers and values for each
+        # step.
+        out_lanes = []
+        out_values = []
+        position = numpy.zeros (lanes, numpy.int64)
+        failed = numpy.zeros (lanes, bool)
+        # Errors that come from running off the end of memory or running too
+        # long.
+        crashed = {}
+
+        memory_size = self.computer.memory_size
+        word_max = self.computer.word_max
+        word_range = self.computer.word_range
+
+        memory = self.memory
+        accumulator = self.accumulator
+        counter = self.counter
+        overflow = self.overflow
+        negative = self.negative
+
+        # Index memory as a flat array.  offset is the index of the first cell
+        # of each live lane.
+        cells = memory.reshape (-1)
+        live = numpy.arange (lanes)
+        offset = live * memory_size
+        steps = 0
+        while len (live) > 0:
+            if steps == max_steps:
+                for lane in live.tolist ():
+                    crashed [lane] = lmc.Step_Limit_Exceeded (max_steps)
+                break
+            steps += 1
+            count = counter [live]
+            overrun = count >= memory_size
+            if overrun.any ():
+                for lane in live [overrun].tolist ():
+                    crashed [lane] = IndexError ('list index out of range')
+                live = live [~overrun]
+                offset = live * memory_size
+                continue
+            op, arg = numpy.divmod (cells [offset + count], memory_size)
+            counter [live] = count + 1
+            acc = accumulator [live]
+
+            # Arithmetic and loads.
+            add = op == lmc.LMC.ADD
+            sub = op == lmc.LMC.SUB
+            lda = op == lmc.LMC.LDA
+            sets = add | sub | lda
+            if sets.any ():
+                rows = live [sets]
+                operand = cells [offset [sets] + arg [sets]]
+                value = acc [sets]
+                value = numpy.where (add [sets], value + operand,
+                                     numpy.where (sub [sets], value - operand,
+                                                  operand))
+                accumulator [rows] = value % word_range
+                overflow [rows] = value > word_max
+                negative [rows] = value < 0
+
+            sta = op == lmc.LMC.STA
+            if sta.any ():
+                cells [offset [sta] + arg [sta]] = acc [sta]
+
+            # Branches use the flags from before this step.
+            take = ((op == lmc.LMC.BRA)
+                    | ((op == lmc.LMC.BRZ) & (acc == 0))
+                    | ((op == lmc.LMC.BRP) & ~negative [live]))
+            if take.any ():
+                counter [live [take]] = arg [take]
+
+            out = (op == lmc.LMC.IO) & (arg == 2)
+            if out.any ():
+                rows = live [out]
+                self.output [rows] = acc [out]
+                out_lanes.append (rows)
+                out_values.append (acc [out])
+
+            stopped = op == lmc.LMC.HLT
+            if stopped.any ():
+                # Don't step the counter past HLT.
+                counter [live [stopped]] -= 1
+
+            inp = (op == lmc.LMC.IO) & (arg == 1)
+            if inp.any ():
+                rows = live [inp]
+                place = position [rows]
+                ok = place < valid [rows]
+                good = rows [ok]
+                value = feed [good, place [ok]]
+                self.input [good] = value
+                accumulator [good] = value
+                overflow [good] = False
+                negative [good] = False
+                position [good] += 1
+                bad = rows [~ok]
+                failed [bad] = True
+                stopped [inp] = ~ok
+
+            if stopped.any ():
+                live = live [~stopped]
+                offset = live * memory_size
+
+        outputs = self._split_outputs (lanes, out_lanes, out_values)
+        results = []
+        for lane in range (lanes):
+            error = None
+            used = position [lane]
+            if lane in crashed:
+                error = crashed [lane]
+            elif failed [lane]:
+                error = errors [lane]
+            elif used < len (inputs [lane]):
+                error = batch.Unused_Inputs (list (inputs [lane][used:]))
+            results.append ((outputs [lane], error))
+        return results
+
+    def _start (self, lanes):
+        '''Internal: Make the registers and a copy of memory for each lane.'''
+        image = numpy.array (self.computer.memory, numpy.int64)
+        self.memory = numpy.tile (image, (lanes, 1))
+        self.counter = numpy.zeros (lanes, numpy.int64)
+        self.input = numpy.full (lanes, self.computer.input, numpy.int64)
+        self.output = numpy.full (lanes, self.computer.output, numpy.int64)
+        self.accumulator = numpy.full (lanes, self.computer.accumulator,
+                                       numpy.int64)
+        self.overflow = numpy.full (lanes, self.computer.overflow)
+        self.negative = numpy.full (lanes, self.computer.negative)
+
+    def _prepare_inputs (self, inputs):
+        '''Internal: Convert the inputs to an array.
+
+        Return the array, the number of usable inputs for each lane, and the
+        exception to raise if a lane asks for more than that.
+        '''
+        lanes = len (inputs)
+        width = max ([len (i) for i in inputs] + [1])
+        feed = numpy.zeros ((lanes, width), numpy.int64)
+        valid = numpy.zeros (lanes, numpy.int64)
+        errors = []
+        for lane in range (lanes):
+            error = batch.Not_Enough_Inputs ()
+            values = []
+            for value in inputs [lane]:
+                try:
+                    if isinstance (value, bool):
+                        # A bool asks LMC to continue or pause without input.
+                        raise lmc.Bad_Input_Type (value)
+                    value = int (value)
+                    if not self.computer._is_in_word_range (value):
+                        raise lmc.Input_Out_Of_Range (value,
+                                                      self.computer.word_max)
+                except ValueError:
+                    error = lmc.Bad_Input_Type (value)
+                    break
+                except Exception as exception:
+                    error = exception
+                    break
+                values.append (value)
+            feed [lane, :len (values)] = values
+            valid [lane] = len (values)
+            errors.append (error)
+        return feed, valid, errors
+
+    def _split_outputs (self, lanes, out_lanes, out_values):
+        '''Internal: Return a list of outputs for each lane.'''
+        outputs = [[] for lane in range (lanes)]
+        if len (out_lanes) == 0:
+            return outputs
+        rows = numpy.concatenate (out_lanes)
+        values = numpy.concatenate (out_values)
+        # A stable sort keeps each lane's outputs in order.
+        order = numpy.argsort (rows, kind = 'stable')
+        for (lane, value) in zip (rows [order].tolist (),
+                                  values [order].tolist ()):
+            outputs [lane].append (value)
+        return outputs
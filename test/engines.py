@@ -0,0 +1,59 @@
+# engines.py - Helpers for tests that compare LMC back-ends with LMC.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+
+# A loop that rewrites the argument of the ADD at address 1 on its second pass.
+rewrite = [ 510, 111, 902, 513, 301, 514, 215, 314, 800, 0,
+            5, 1, 100, 112, 1, 1 ]
+
+def load (computer, program):
+    '''Load a program given as a file name or a list of words.'''
+    if isinstance (program, list):
+        for address in range (len (program)):
+            computer.memory [address] = program [address]
+        computer.decode ()
+    else:
+        computer.load (program)
+
+def state (computer):
+    return (computer.counter, computer.accumulator, computer.overflow,
+            computer.negative, computer.steps, list (computer.memory))
+
+def run (computer_type, program, inputs, base = 10, memory = 100,
+         max_steps = None, loop_interval = None):
+    '''Run a program and return the outputs, any error, and the final state.'''
+    client = batch.Batch_Client (base, memory, computer_type)
+    client.inputs = list (inputs)
+    computer = client.computer
+    load (computer, program)
+    computer.max_steps = max_steps
+    computer.loop_interval = loop_interval
+    error = None
+    try:
+        computer.run ()
+    except Exception as e:
+        error = type (e)
+    return (client.outputs, error, state (computer))
@@ -0,0 +1,103 @@
+# test-aio.py - Unit tests for running LMC programs with asyncio.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import os
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import aio
+from little_village import compiler
+from little_village import lmc
+
+class Test_Async (unittest.TestCase):
+    def test_queues (self):
+        async def session ():
+            client = aio.Async_Client ()
+            task = asyncio.ensure_future (client.run ('square'))
+            results = []
+            for n in (3, 12):
+                await client.inputs.put (n)
+                results.append (await client.outputs.get ())
+            await client.inputs.put (0)
+            await task
+            return results
+        self.assertEqual (asyncio.run (session ()), [9, 144])
+
+    def test_many (self):
+        async def square (n):
+            values = iter ([n, 0])
+            async def next_input ():
+                return next (values)
+            client = aio.Async_Client (inputs = next_input, slice = 7)
+            await client.run ('square')
+            return client.outputs.get_nowait ()
+        async def main ():
+            return await asyncio.gather (*[square (n) for n in range (1, 200)])
+        self.assertEqual (asyncio.run (main ()),
+                          [n*n % 1000 for n in range (1, 200)])
+
+    def test_fair (self):
+        # A program that never halts doesn't hold up the others.
+        async def main ():
+            spinner = aio.Async_Client (computer_type = compiler.Compiled_LMC,
+                                        slice = 50)
+            spinner.computer.memory [0] = 600
+            spinner.computer.decode ()
+            spin = asyncio.ensure_future (spinner.run ())
+            worker = aio.Async_Client (slice = 50)
+            for n in (300, 0):
+                worker.inputs.put_nowait (n)
+            await worker.run ('square')
+            self.assertFalse (spin.done ())
+            spin.cancel ()
+            self.assertTrue (spinner.computer.steps > 0)
+            return worker.outputs.get_nowait ()
+        self.assertEqual (asyncio.run (main ()), 90000 % 1000)
+
+    def test_bounded_output (self):
+        async def main ():
+            client = aio.Async_Client (outputs = asyncio.Queue (1))
+            for n in (1, 2, 3, 0):
+                client.inputs.put_nowait (n)
+            task = asyncio.ensure_future (client.run ('square'))
+            results = []
+            for i in range (3):
+                results.append (await client.outputs.get ())
+            await task
+            return results
+        self.assertEqual (asyncio.run (main ()), [1, 4, 9])
+
+    def test_slices (self):
+        computer = lmc.LMC ()
+        computer.load ('add')
+        computer.input = 4
+        self.assertTrue (computer.run (steps = 2))
+        self.assertEqual (computer.steps, 2)
+        self.assertTrue (computer.resume (False, 2))
+        self.assertEqual (computer.steps, 4)
+        self.assertFalse (computer.resume (steps = 1000))
+        self.assertEqual ((computer.steps, computer.output), (6, 8))
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -20,11 +20,13 @@
 import os
 import sys
 # Allow importing modules from the source directory
-sys.path.insert (0, os.path.abspath('../little_village'))
+sys.path.insert (0, os.path.abspath('..'))
 
-import assemble
+from little_village import assemble
 import unittest
 import io
+import json
+import tempfile
 
 class Test_Assemble (unittest.TestCase):
     def setUp (self):
@@ -68,6 +70,12 @@ class Test_Assemble (unittest.TestCase):
                           '\n'
                           '0 errors, 1 warning\n')
 
+    def test_data (self):
+        program = [ 'LDA ONE', 'HLT', 'ONE DAT 1', 'DAT' ]
+        self.assertTrue (self.asm.assemble (program))
+        self.assertEqual (self.asm.code, [ 502, 000, 1, 0 ])
+        self.assertFalse (self.asm.assemble ([ 'HLT', 'DAT 1 2' ]))
+
     def test_too_long (self):
         # Avoid the no-halt warning.
         program = [ 'HLT' ] + [ 'ADD 50' ] * 111
@@ -137,5 +145,240 @@ class Test_Assemble (unittest.TestCase):
         self.assertEqual (messages[14], '')
         self.assertEqual (messages[15], '7 errors, 0 warnings')
 
+class Test_Geometry (unittest.TestCase):
+    def test_opcodes (self):
+        asm = assemble.Assembler (10, 1000)
+        self.assertTrue (asm.assemble ([ 'INP', 'ADD 999', 'OUT', 'HLT' ]))
+        self.assertEqual (asm.code, [ 9001, 1999, 9002, 0 ])
+        output = io.StringIO ()
+        asm.write_program (output)
+        self.assertEqual (output.getvalue (), '9001\n1999\n9002\n0000\n')
+
+    def test_too_long (self):
+        asm = assemble.Assembler (10, 1000)
+        self.assertTrue (asm.assemble ([ 'HLT' ] + [ 'ADD 50' ]*999))
+        self.assertFalse (asm.assemble ([ 'HLT' ] + [ 'ADD 50' ]*1000))
+
+    def test_stream (self):
+        asm = assemble.Assembler ()
+        self.assertTrue (asm.assemble (io.StringIO ('X INP\nBRA X\nHLT\n')))
+        self.assertEqual (asm.code, [ 901, 600, 0 ])
+
+class Test_Linker (unittest.TestCase):
+    def setUp (self):
+        self.linker = assemble.Linker ()
+
+    def messages (self):
+        messages = io.StringIO ()
+        self.linker.write_messages (messages)
+        return messages.getvalue ()
+
+    def test_link (self):
+        self.assertTrue (self.linker.add ('main', [ 'INP', 'BRA PRINT', 'BACK HLT' ]))
+        self.assertTrue (self.linker.add ('sub', [ 'PRINT OUT', 'BRA BACK' ]))
+        self.assertTrue (self.linker.link ())
+        self.assertEqual (self.linker.code, [ 901, 603, 0, 902, 602 ])
+        self.assertEqual (self.linker.lines [3], ('sub', 1))
+        self.assertEqual (self.messages (), '')
+
+    def test_geometry (self):
+        self.linker = assemble.Linker (10, 1000)
+        self.linker.add ('main', [ 'LDA ONE', 'HLT' ])
+        self.linker.add ('data', [ 'ONE DAT 1' ])
+        self.assertTrue (self.linker.link ())
+        self.assertEqual (self.linker.code, [ 5002, 0, 1 ])
+
+    def test_duplicate (self):
+        self.linker.add ('main', [ 'X HLT', 'BRA X' ])
+        self.linker.add ('sub', [ 'X HLT' ])
+        self.assertFalse (self.linker.link ())
+        self.assertEqual (self.messages (),
+                          'sub:\n'
+                          'Error: Duplicate label\n'
+                          '  line 1  : X HLT\n'
+                          '\n'
+                          '1 error, 0 warnings\n')
+
+    def test_messages (self):
+        self.linker.add ('main', [ 'INP', 'BRA NOWHERE' ])
+        self.linker.add ('sub', [ 'X OUT' ])
+        self.assertFalse (self.linker.link ())
+        self.assertEqual (self.messages (),
+                          'main:\n'
+                          'Error: Undefined label\n'
+                          '  line 2  : BRA NOWHERE\n'
+                          '\n'
+                          '1 error, 0 warnings\n'
+                          'sub:\n'
+                          'Warning: Unused label\n'
+                          '  line 1  : X OUT\n'
+                          '\n'
+                          '0 errors, 1 warning\n'
+                          'Warning: No HLT instruction in input\n'
+                          '\n'
+                          '0 errors, 1 warning\n')
+
+    def test_too_long (self):
+        self.linker.add ('main', [ 'HLT' ]*60)
+        self.linker.add ('sub', [ 'HLT' ]*60)
+        self.assertFalse (self.linker.link ())
+        self.assertEqual (self.messages (),
+                          'Error: Program too long\n'
+                          '\n'
+                          '1 error, 0 warnings\n')
+
+class Test_Bulk (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.directory = os.path.join (self.temporary.name, 'sources')
+        self.cache = os.path.join (self.temporary.name, 'cache')
+        os.makedirs (os.path.join (self.directory, 'b'))
+        self.sources = [ os.path.join (self.directory, name)
+                         for name in ('a.asm', os.path.join ('b', 'c.asm'),
+                                      'd.asm') ]
+        for (source, text) in zip (self.sources,
+                                   ('INP\nOUT\nHLT\n', 'MOO\n', 'INP\n')):
+            with open (source, 'w') as f:
+                f.write (text)
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def test_find_sources (self):
+        with open (os.path.join (self.directory, 'notes.txt'), 'w') as f:
+            f.write ('not a source')
+        self.assertEqual (assemble.find_sources ([ self.directory, 'x.asm' ]),
+                          [ self.sources [0], self.sources [2],
+                            self.sources [1], 'x.asm' ])
+
+    def test_bulk (self):
+        for cached in (False, True):
+            summaries = list (assemble.assemble_files (
+                self.sources*4, 2, cache_directory = self.cache))
+            # The same sources are cached as soon as one is assembled.
+            self.assertEqual (summaries [0]['cached'], cached)
+            if cached:
+                self.assertTrue (all ([s ['cached'] for s in summaries]))
+            (a, c, d) = summaries [:3]
+            self.assertEqual ((a ['errors'], a ['warnings']), (0, 0))
+            self.assertEqual (a ['output'], self.sources [0][:-4])
+            self.assertEqual ((c ['errors'], c ['output']), (1, None))
+            self.assertEqual (c ['messages'][0],
+                              { 'severity': 'Error',
+                                'message': 'Unknown mnemonic',
+                                'line': 1, 'text': 'MOO' })
+            self.assertEqual (d ['messages'][0]['message'],
+                              'No HLT instruction in input')
+            self.assertEqual (d ['messages'][0]['line'], None)
+            with open (self.sources [0][:-4]) as f:
+                self.assertEqual (f.read (), '901\n902\n000\n')
+
+    def test_changed (self):
+        list (assemble.assemble_files (self.sources, 1,
+                                       cache_directory = self.cache))
+        with open (self.sources [0], 'w') as f:
+            f.write ('INP\nHLT\n')
+        summary = list (assemble.assemble_files (
+            self.sources, 1, cache_directory = self.cache)) [0]
+        self.assertFalse (summary ['cached'])
+        with open (self.sources [0][:-4]) as f:
+            self.assertEqual (f.read (), '901\n000\n')
+
+    def test_missing (self):
+        summary = assemble.assemble_job (('nothing.asm', 10, 100, False))
+        self.assertEqual ((summary ['errors'], summary ['output']), (1, None))
+
+    def test_command (self):
+        stdout = sys.stdout
+        try:
+            sys.stdout = io.StringIO ()
+            assemble.run ('test-assemble', [ '--processes', '1', '--bulk',
+                                             self.directory ])
+            lines = sys.stdout.getvalue ().splitlines ()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual ([json.loads (line)['errors'] for line in lines],
+                          [ 0, 0, 1 ])
+
+class Counting_Assembler (assemble.Incremental_Assembler):
+    '''An Incremental_Assembler that counts the lines it parses.'''
+    def __init__ (self):
+        assemble.Incremental_Assembler.__init__ (self)
+        self.parsed = 0
+
+    def _parse_line (self, text):
+        self.parsed += 1
+        return assemble.Incremental_Assembler._parse_line (self, text)
+
+class Test_Incremental (unittest.TestCase):
+    program = [ 'LOOP INP', 'BRZ END', 'ADD ONE', 'OUT', 'BRA LOOP',
+                'END HLT', 'ONE DAT 1' ]
+
+    def messages (self, asm):
+        messages = io.StringIO ()
+        asm.messages.write (messages)
+        return messages.getvalue ()
+
+    def check (self, asm, program):
+        fresh = assemble.Assembler ()
+        ok = fresh.assemble (program)
+        self.assertEqual (asm.assemble (program), ok)
+        self.assertEqual (self.messages (asm), self.messages (fresh))
+        if ok:
+            self.assertEqual (asm.code, fresh.code)
+        self.assertEqual (asm.lines, fresh.lines)
+
+    def test_edits (self):
+        asm = Counting_Assembler ()
+        program = list (self.program)
+        self.check (asm, program)
+        self.assertEqual (asm.parsed, 7)
+        # Change an instruction.
+        program [3] = 'OUT ; print it'
+        self.check (asm, program)
+        self.assertEqual (asm.parsed, 8)
+        # Insert a line.  END and ONE move.
+        program.insert (4, 'SUB ONE')
+        self.check (asm, program)
+        self.assertEqual (asm.parsed, 9)
+
+    def test_messages (self):
+        asm = assemble.Incremental_Assembler ()
+        program = list (self.program)
+        for (line, text) in ((2, 'ADD TWO'), (0, 'MOO'), (5, 'HLT'),
+                             (2, 'ADD ONE'), (0, 'LOOP INP'), (5, 'END HLT')):
+            program [line] = text
+            self.check (asm, program)
+        self.assertEqual (self.messages (asm), '')
+
+    def test_stream (self):
+        asm = assemble.Incremental_Assembler ()
+        self.assertFalse (asm.assemble (iter ([ 'LDA nowhere', 'HLT' ])))
+        self.assertEqual (self.messages (asm),
+                          'Error: Undefined label\n'
+                          '  line 1  : LDA nowhere\n'
+                          '\n'
+                          '1 error, 0 warnings\n')
+        self.assertTrue (asm.assemble (io.StringIO ('X INP\nBRA X\nHLT\n')))
+        self.assertEqual (asm.code, [ 901, 600, 0 ])
+
+    def test_too_long (self):
+        asm = assemble.Incremental_Assembler ()
+        self.check (asm, self.program)
+        self.check (asm, self.program*15)
+        self.check (asm, [ 'MOO' ]*11)
+        self.check (asm, self.program)
+
+    def test_moved_label (self):
+        asm = assemble.Incremental_Assembler ()
+        program = list (self.program)
+        self.check (asm, program)
+        self.assertEqual (asm.references ['END'], [1])
+        # END and ONE move.
+        program.insert (5, 'DAT 5')
+        self.check (asm, program)
+        self.assertEqual (asm.code [1:3], [706, 107])
+        self.assertEqual (asm.references ['ONE'], [2])
+
 if __name__ == '__main__':
     unittest.main ()
@@ -90,5 +90,48 @@ class Test_Batch (unittest.TestCase):
         self.assertEqual (sys.stderr.getvalue (),
                           "Warning: Unused inputs: 'waffles' -12 33 \n")
 
+    def test_jobs (self):
+        batch.run ('test-batch', ['--jobs', 'jobs', '2'])
+        self.assertEqual (sys.stdout.getvalue (), '1: 3\n2: \n3: 9\n4: \n')
+        self.assertEqual (sys.stderr.getvalue (),
+                          "2: Error: Not enough inputs.\n"
+                          "3: Warning: Unused inputs: '9' \n"
+                          "4: Error: Program file not found: 'moo'\n")
+
+    def test_jobs_no_manifest (self):
+        batch.run ('test-batch', ['--jobs'])
+        self.assertTrue ('Usage: test-batch' in sys.stdout.getvalue ())
+
+class Test_Jobs (unittest.TestCase):
+    def test_read_manifest (self):
+        self.assertEqual (batch.read_manifest ('jobs'),
+                          [('add', ['1', '2']), ('add', ['5']),
+                           ('square', ['3', '0', '9']), ('moo', ['1'])])
+
+    def check_results (self, results):
+        self.assertEqual ([r [0] for r in results], [[3], [], [9], []])
+        self.assertEqual ([type (r [1]) for r in results],
+                          [type (None), batch.Not_Enough_Inputs,
+                           batch.Unused_Inputs, lmc.Program_File_Not_Found])
+
+    def test_in_process (self):
+        jobs = batch.read_manifest ('jobs')
+        self.check_results (list (batch.run_jobs (jobs, 1)))
+
+    def test_pool (self):
+        jobs = batch.read_manifest ('jobs')*20
+        results = list (batch.run_jobs (jobs, 3))
+        self.assertEqual (len (results), 80)
+        self.check_results (results [-4:])
+
+    def test_reset (self):
+        # A warm client must not keep memory from the last program.
+        client = batch.Batch_Client ()
+        client.run ('square', [2, 0])
+        client.reset ()
+        client.run ('add', [1, 2])
+        self.assertEqual (client.outputs, [3])
+        self.assertEqual (list (client.computer.memory [10:]), 90*[0])
+
 if __name__ == '__main__':
     unittest.main ()
@@ -0,0 +1,301 @@
+# test-cache.py - Unit tests for the cache of run results.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import cache
+from little_village import lmc
+
+class Test_Result_Cache (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.directory = self.temporary.name
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def test_memory (self):
+        results = cache.Result_Cache (size = 2)
+        results.put ('a', ([1], [], None))
+        results.put ('b', ([2], [], None))
+        self.assertEqual (results.get ('a'), ([1], [], None))
+        # 'b' is the least recently used.
+        results.put ('c', ([3], [], None))
+        self.assertEqual (results.get ('b'), None)
+        self.assertEqual (results.get ('a'), ([1], [], None))
+        self.assertEqual ((results.hits, results.misses), (2, 1))
+
+    def test_copies (self):
+        results = cache.Result_Cache ()
+        results.put ('a', ([1], [], None))
+        results.get ('a') [0].append (2)
+        self.assertEqual (results.get ('a'), ([1], [], None))
+
+    def test_disk (self):
+        results = cache.Result_Cache (directory = self.directory)
+        results.put ('a', ([1], [], None))
+        # A new cache, as in another process, finds it on disk.
+        results = cache.Result_Cache (directory = self.directory)
+        self.assertEqual (results.get ('a'), ([1], [], None))
+        results.clear ()
+        self.assertEqual (os.listdir (self.directory), [])
+        self.assertEqual (results.get ('a'), None)
+
+    def test_evict (self):
+        results = cache.Result_Cache (size = 1, directory = self.directory,
+                                      max_bytes = 500)
+        for n in range (20):
+            results.put ('%d' % n, (list (range (n, n + 10)), [], None))
+            # Make sure the files have different times.
+            os.utime (results._path ('%d' % n), (n, n))
+        files = os.listdir (self.directory)
+        self.assertTrue (0 < len (files) < 20)
+        self.assertTrue (sum ([os.path.getsize (os.path.join (self.directory, f))
+                               for f in files]) <= 500)
+        # The newest one is kept.
+        self.assertTrue ('19.result' in files)
+        self.assertFalse ('0.result' in files)
+
+    def test_damaged (self):
+        results = cache.Result_Cache (directory = self.directory)
+        with open (results._path ('a'), 'wb') as f:
+            f.write (b'not a pickle')
+        self.assertEqual (results.get ('a'), None)
+        self.assertEqual (results.misses, 1)
+
+class Test_Key (unittest.TestCase):
+    def setUp (self):
+        self.results = cache.Result_Cache ()
+        self.computer = lmc.LMC ()
+        self.computer.load ('add')
+
+    def test_same (self):
+        key = self.results.key (self.computer, [1, 2])
+        computer = lmc.LMC ()
+        computer.load ('add')
+        self.assertEqual (self.results.key (computer, (1, 2)), key)
+
+    def test_differences (self):
+        key = self.results.key (self.computer, [1, 2])
+        self.assertNotEqual (self.results.key (self.computer, [2, 1]), key)
+        self.assertNotEqual (self.results.key (self.computer, ['1', 2]), key)
+        self.assertNotEqual (self.results.key (lmc.LMC (16, 256), [1, 2]), key)
+        self.computer.max_steps = 100
+        self.assertNotEqual (self.results.key (self.computer, [1, 2]), key)
+        self.computer.max_steps = None
+        self.computer.memory [50] = 1
+        self.assertNotEqual (self.results.key (self.computer, [1, 2]), key)
+
+class Test_Batch (unittest.TestCase):
+    def setUp (self):
+        self.client = batch.Batch_Client ()
+        self.client.cache = cache.Result_Cache ()
+
+    def run_twice (self, program, inputs):
+        results = []
+        for n in range (2):
+            self.client.reset ()
+            try:
+                self.client.run (program, inputs)
+                error = None
+            except Exception as e:
+                error = e
+            results.append ((self.client.outputs, self.client.inputs,
+                             type (error), str (error)))
+        self.assertEqual (results [0], results [1])
+        self.assertEqual ((self.client.cache.hits, self.client.cache.misses),
+                          (1, 1))
+        return results [0]
+
+    def test_outputs (self):
+        self.assertEqual (self.run_twice ('square', [3, 12, 0]),
+                          ([9, 144], [], type (None), 'None'))
+
+    def test_not_enough (self):
+        self.assertEqual (self.run_twice ('add', [1]) [2],
+                          batch.Not_Enough_Inputs)
+
+    def test_unused (self):
+        self.assertEqual (self.run_twice ('add', [1, 2, 3]),
+                          ([3], [3], batch.Unused_Inputs, 'Unused inputs: 3 '))
+
+    def test_step_limit (self):
+        self.client.computer.max_steps = 10
+        self.assertEqual (self.run_twice ('square', [3, 0]) [2],
+                          lmc.Step_Limit_Exceeded)
+
+    def test_programs (self):
+        self.client.run ('add', [1, 2])
+        self.client.reset ()
+        self.client.run ('square', [1, 2, 0])
+        self.assertEqual (self.client.outputs, [1, 4])
+        self.assertEqual (self.client.cache.hits, 0)
+
+    def test_profile (self):
+        self.client.computer.start_profile ()
+        self.client.run ('add', [1, 2])
+        self.client.run ('add', [1, 2])
+        self.assertEqual (self.client.outputs, [3, 3])
+        self.assertEqual (self.client.cache.misses, 0)
+        self.assertEqual (self.client.computer.profile.steps, 12)
+
+    def test_breakpoints (self):
+        # Each of these pauses the run before it's done.
+        program = [901, 309, 902, 901, 902, 0]
+        for (name, points) in (('breakpoints', {2}), ('watched_cells', {9}),
+                               ('watched_values', {3})):
+            self.client.cache = cache.Result_Cache ()
+            computer = self.client.computer
+            for watch in (True, False):
+                self.client.reset ()
+                computer.load_code (program)
+                setattr (computer, name, set (points) if watch else set ())
+                try:
+                    self.client.run_loaded ([3, 4])
+                except batch.Unused_Inputs:
+                    pass
+            self.assertEqual (self.client.outputs, [3, 4])
+            self.assertEqual (self.client.cache.hits, 0)
+
+class Test_Jobs (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.directory = self.temporary.name
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def test_pool (self):
+        jobs = batch.read_manifest ('jobs')*10
+        for n in range (2):
+            results = list (batch.run_jobs (jobs, 2, cache_directory =
+                                            self.directory))
+            self.assertEqual ([r [0] for r in results [-4:]],
+                              [[3], [], [9], []])
+            self.assertEqual ([type (r [1]) for r in results [-4:]],
+                              [type (None), batch.Not_Enough_Inputs,
+                               batch.Unused_Inputs,
+                               lmc.Program_File_Not_Found])
+        # The three programs that were found were cached.
+        self.assertEqual (len (os.listdir (self.directory)), 3)
+
+    def test_command (self):
+        stdout = sys.stdout
+        try:
+            for n in range (2):
+                sys.stdout = io.StringIO ()
+                batch.run ('test-cache', ['--cache', self.directory, 'add',
+                                          '1', '2'])
+                self.assertEqual (sys.stdout.getvalue (), '3\n')
+        finally:
+            sys.stdout = stdout
+        self.assertEqual (len (os.listdir (self.directory)), 1)
+
+class Test_Program_Cache (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.file = os.path.join (self.temporary.name, 'program')
+        self.programs = lmc.program_cache
+        self.programs.clear ()
+        self.start = (self.programs.hits, self.programs.misses)
+        self.computer = lmc.LMC ()
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def write (self, text, time):
+        with open (self.file, 'w') as f:
+            f.write (text)
+        os.utime (self.file, (time, time))
+
+    def hits (self):
+        return self.programs.hits - self.start [0]
+
+    def misses (self):
+        return self.programs.misses - self.start [1]
+
+    def test_hit (self):
+        self.computer.load ('add')
+        self.computer.memory [0] = 0
+        lmc.LMC ().load ('square')
+        self.computer.load ('add')
+        # The cached words are copied into memory, not changed by it.
+        self.assertEqual (self.computer.memory [0], 901)
+        self.assertEqual ((self.hits (), self.misses ()), (1, 2))
+
+    def test_changed (self):
+        self.write ('901\n902\n', 1)
+        self.computer.load (self.file)
+        self.write ('902\n901\n', 2)
+        self.computer.load (self.file)
+        self.assertEqual (list (self.computer.memory [:2]), [902, 901])
+        self.assertEqual (self.hits (), 0)
+
+    def test_geometry (self):
+        self.write ('901\n', 1)
+        self.computer.load (self.file)
+        lmc.LMC (10, 1000).load (self.file)
+        self.assertEqual (self.hits (), 0)
+
+    def test_blank_lines (self):
+        self.write ('901\n\n902\n', 1)
+        for n in range (2):
+            self.computer.memory [1] = 5
+            self.computer.load (self.file)
+            self.assertEqual (list (self.computer.memory [:3]), [901, 5, 902])
+        self.assertEqual (self.hits (), 1)
+
+    def test_full (self):
+        # A program that fills memory may end with blank lines.
+        self.write (100*'1\n' + '\n\n', 1)
+        self.computer.load (self.file)
+        self.assertEqual (list (self.computer.memory), 100*[1])
+        self.write (101*'1\n', 2)
+        self.assertRaises (IndexError, self.computer.load, self.file)
+
+    def test_errors (self):
+        self.write ('901\n1000\n', 1)
+        for n in range (2):
+            self.assertRaises (lmc.Instruction_Out_Of_Range,
+                               self.computer.load, self.file)
+        self.assertEqual (self.hits (), 0)
+        self.assertRaises (lmc.Program_File_Not_Found,
+                           self.computer.load, self.file + '.missing')
+
+    def test_evict (self):
+        programs = cache.Program_Cache (max_bytes = 10)
+        for name in ('a', 'b', 'c'):
+            programs.put (name, [(0, lmc.array.array ('H', [1, 2, 3]))])
+        self.assertEqual (programs.get ('a'), None)
+        self.assertNotEqual (programs.get ('c'), None)
+        programs.put ('d', [(0, lmc.array.array ('H', [1, 2]))])
+        # 'b' is the least recently used.
+        self.assertEqual (programs.get ('b'), None)
+        self.assertNotEqual (programs.get ('c'), None)
+
+if __name__ == '__main__':
+    unittest.main ()
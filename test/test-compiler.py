@@ -0,0 +1,179 @@
+# test-compiler.py - Unit tests for the compiling LMC back-end.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import compiler
+from little_village import lmc
+
+from engines import rewrite, run
+
+# A block that overwrites one of its own later instructions.
+overwrite = [ 505, 303, 506, 106, 0, 902, 42 ]
+
+class Test_Compiled (unittest.TestCase):
+    '''Check that compiled programs give the same results as LMC.'''
+    def check (self, program, inputs = []):
+        expected = run (lmc.LMC, program, inputs)
+        self.assertEqual (run (compiler.Compiled_LMC, program, inputs),
+                          expected)
+        return expected [0]
+
+    def test_add (self):
+        self.assertEqual (self.check ('add', [123, 45]), [168])
+
+    def test_square (self):
+        self.assertEqual (self.check ('square', [3, 12, 600, 0]), [9, 144, 0])
+
+    def test_countdown (self):
+        self.assertEqual (self.check ('../programs/countdown', [3]), [2, 1, 0])
+
+    def test_rewrite (self):
+        self.assertEqual (self.check (rewrite), [6, 105])
+
+    def test_overwrite (self):
+        self.assertEqual (self.check (overwrite), [42])
+
+class Test_Blocks (unittest.TestCase):
+    '''Check the block cache.'''
+    def setUp (self):
+        self.client = batch.Batch_Client (computer_type = compiler.Compiled_LMC)
+        self.computer = self.client.computer
+        self.computer.load ('square')
+
+    def test_leaders (self):
+        # The start and the branch targets.
+        leaders = [a for a in self.computer._leaders if a < 19]
+        self.assertEqual (sorted (leaders), [0, 6, 15, 18])
+
+    def test_cache (self):
+        self.client.inputs = [2, 0]
+        self.computer.run ()
+        # The first block runs through INP and BRZ up to LOOP.
+        self.assertEqual (self.computer._blocks [0][1], 6)
+        self.assertTrue (self.computer._blocks [6])
+        self.assertFalse (3 in self.computer._blocks)
+        # HLT can't start a block.
+        self.assertEqual (self.computer._blocks [18], None)
+
+    def test_shared (self):
+        self.client.inputs = [2, 0]
+        self.computer.run ()
+        other = batch.Batch_Client (computer_type = compiler.Compiled_LMC)
+        other.computer.load ('square')
+        other.inputs = [3, 0]
+        other.computer.run ()
+        self.assertEqual (other.outputs, [9])
+        self.assertIs (other.computer._blocks [6][0],
+                       self.computer._blocks [6][0])
+
+    def test_invalidate (self):
+        self.client.inputs = [2, 0]
+        self.computer.run ()
+        self.assertTrue (6 in self.computer._blocks)
+        self.computer._store (10, 521)
+        self.assertFalse (6 in self.computer._blocks)
+        self.assertTrue (0 in self.computer._blocks)
+
+    def test_load_resets (self):
+        self.client.inputs = [2, 0]
+        self.computer.run ()
+        self.computer.load ('add')
+        self.assertEqual (self.computer._blocks, {})
+
+class Test_Limits (unittest.TestCase):
+    '''Check that blocks don't run past the step limit.'''
+    def test_step_limit (self):
+        computer = compiler.Compiled_LMC ()
+        # Three instructions in a block that branches back to itself.
+        for (address, word) in enumerate ([500, 100, 600]):
+            computer.memory [address] = word
+        computer.decode ()
+        computer.max_steps = 1000
+        self.assertRaises (lmc.Step_Limit_Exceeded, computer.run)
+        self.assertEqual (computer.steps, 1000)
+        self.assertEqual (computer.counter, 1)
+
+class Pause_Client (batch.Batch_Client):
+    '''A client that pauses after each output.'''
+    def notify_output (self, output):
+        batch.Batch_Client.notify_output (self, output)
+        return False
+
+class Rewrite_Client (batch.Batch_Client):
+    '''A client that changes the instruction after the first output.'''
+    def notify_output (self, output):
+        batch.Batch_Client.notify_output (self, output)
+        if len (self.outputs) == 1:
+            self.computer.memory [2] = 509
+            self.computer.decode ()
+        return True
+
+class Step_Client (batch.Batch_Client):
+    '''A client that counts steps.'''
+    def __init__ (self):
+        batch.Batch_Client.__init__ (self, computer_type = compiler.Compiled_LMC)
+        self.steps = 0
+
+    def notify_step (self):
+        self.steps += 1
+        return True
+
+class Test_Notify (unittest.TestCase):
+    '''Check that clients are notified as they are by LMC.'''
+    def test_step_hook (self):
+        client = Step_Client ()
+        client.run ('add', [1, 2])
+        self.assertEqual (client.steps, 6)
+        self.assertEqual (client.outputs, [3])
+        self.assertEqual (client.computer._blocks, {})
+
+    def test_pause (self):
+        for computer_type in (lmc.LMC, compiler.Compiled_LMC):
+            client = Pause_Client (computer_type = computer_type)
+            client.inputs = [4]
+            client.computer.load ('../programs/countdown')
+            states = []
+            while not client.computer.resume (True) and client.outputs [-1]:
+                states.append ((client.outputs [-1], client.computer.counter,
+                                client.computer.steps))
+            if computer_type is lmc.LMC:
+                expected = states
+        self.assertEqual (states, expected)
+        self.assertEqual (states [0], (3, 3, 3))
+
+    def test_rewrite (self):
+        # LDA 9, OUT, LDA 8, OUT, HLT.  The client changes the second LDA.
+        program = [509, 902, 508, 902, 0, 0, 0, 0, 7, 5]
+        for computer_type in (lmc.LMC, compiler.Compiled_LMC):
+            client = Rewrite_Client (computer_type = computer_type)
+            for (address, word) in enumerate (program):
+                client.computer.memory [address] = word
+            client.computer.decode ()
+            client.computer.run (True)
+            self.assertEqual (client.outputs, [5, 5])
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,200 @@
+# test-fusion.py - Unit tests for the LMC back-end that fuses instructions.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import fusion
+from little_village import lmc
+
+from engines import load, rewrite, run, state
+
+# Count down from the input with LDA, SUB, STA, BRZ.
+countdown = [ 901, 310, 510, 211, 310, 708, 902, 602, 0, 0,
+              0, 1 ]
+
+# Run LDA, ADD, STA from the start, then branch to the ADD.
+middle = [ 510, 111, 312, 902, 513, 709, 214, 313, 601, 0,
+           7, 3, 0, 1, 1 ]
+
+# LDA, ADD, STA that overwrites the BRZ after it.
+overwrite = [ 510, 111, 303, 700, 902, 0, 512, 902, 0, 0,
+              0, 606, 42 ]
+
+# Read and store inputs until a 0 is read.
+store = [ 901, 320, 707, 520, 121, 321, 600, 521, 902, 0 ]
+
+class Test_Fused (unittest.TestCase):
+    '''Check that fused programs give the same results as LMC.'''
+    def check (self, program, inputs = []):
+        expected = run (lmc.LMC, program, inputs)
+        self.assertEqual (run (fusion.Fused_LMC, program, inputs), expected)
+        return expected [0]
+
+    def check_error (self, program):
+        '''Like check() but return the error and final state too.'''
+        expected = run (lmc.LMC, program, [])
+        self.assertEqual (run (fusion.Fused_LMC, program, []), expected)
+        return expected
+
+    def test_add (self):
+        self.assertEqual (self.check ('add', [123, 45]), [168])
+
+    def test_square (self):
+        self.assertEqual (self.check ('square', [3, 12, 600, 0]), [9, 144, 0])
+
+    def test_countdown (self):
+        self.assertEqual (self.check (countdown, [4]), [3, 2, 1])
+
+    def test_branch_to_middle (self):
+        self.assertEqual (self.check (middle), [10, 3])
+
+    def test_rewrite (self):
+        self.assertEqual (self.check (rewrite), [6, 105])
+
+    def test_overwrite (self):
+        self.assertEqual (self.check (overwrite), [42])
+
+    def test_input_store (self):
+        self.assertEqual (self.check (store, [5, 7, 0]), [12])
+
+    def test_flags (self):
+        # 999 + 1 overflows and 0 - 1 is negative.
+        self.assertEqual (self.check ([505, 106, 307, 902, 0, 999, 1, 0]),
+                          [0])
+        self.assertEqual (self.check ([505, 206, 307, 902, 0, 0, 1, 0]),
+                          [999])
+
+    def test_off_the_end (self):
+        # BRA to LDA, ADD, STA in the last cells, then run off the end.
+        program = [697] + 96*[0] + [501, 102, 303]
+        outputs, error, final = self.check_error (program)
+        self.assertEqual (error, IndexError)
+        self.assertEqual (final [4], 5)
+        # Also when the last instruction isn't part of a fused sequence.
+        self.check_error ([699] + 98*[0] + [501])
+
+    def test_paged (self):
+        # The countdown with addresses for a memory of a million cells.
+        program = [9000001, 3000010, 5000010, 2000011, 3000010, 7000008,
+                   9000002, 6000002, 0, 0, 0, 1]
+        results = []
+        for computer_type in (lmc.LMC, fusion.Fused_LMC):
+            client = batch.Batch_Client (10, 1000000, computer_type)
+            client.inputs = [4]
+            load (client.computer, program)
+            client.computer.run ()
+            results.append ((client.outputs, client.computer.steps))
+        self.assertEqual (results [0], ([3, 2, 1], 25))
+        self.assertEqual (results [1], results [0])
+
+class Test_Table (unittest.TestCase):
+    '''Check the table of fused sequences.'''
+    def setUp (self):
+        self.client = batch.Batch_Client (computer_type = fusion.Fused_LMC)
+        self.computer = self.client.computer
+
+    def test_kinds (self):
+        load (self.computer, countdown)
+        self.client.inputs = [2]
+        self.computer.run ()
+        fused = self.computer._fused
+        self.assertEqual (fused [0], (fusion.INPUT_STORE, 2, 10,
+                                      None, None, None, None))
+        self.assertEqual (fused [2], (fusion.SUB_STORE, 4, 10, 11, 10,
+                                      lmc.LMC.BRZ, 8))
+        self.assertEqual (fused [6], None)
+
+    def test_no_branch_overwrite (self):
+        load (self.computer, overwrite)
+        self.assertEqual (self.computer._fuse (0) [:2], (fusion.ADD_STORE, 3))
+
+    def test_invalidate (self):
+        load (self.computer, countdown)
+        self.client.inputs = [2]
+        self.computer.run ()
+        self.assertTrue (self.computer._fused [2])
+        self.computer._store (5, 608)
+        self.assertEqual (self.computer._fused [2], False)
+        self.assertTrue (self.computer._fused [0])
+
+    def test_load_resets (self):
+        load (self.computer, countdown)
+        self.client.inputs = [2]
+        self.computer.run ()
+        self.computer.load ('add')
+        self.assertEqual (set (self.computer._fused), set ([False]))
+
+class Test_Limits (unittest.TestCase):
+    '''Check that fused sequences don't run past step checks.'''
+    def test_step_limit (self):
+        for limit in range (1, 12):
+            results = []
+            for computer_type in (lmc.LMC, fusion.Fused_LMC):
+                client = batch.Batch_Client (computer_type = computer_type)
+                client.inputs = [5]
+                load (client.computer, countdown)
+                client.computer.max_steps = limit
+                self.assertRaises (lmc.Step_Limit_Exceeded, client.computer.run)
+                results.append (state (client.computer))
+            self.assertEqual (results [0], results [1])
+
+    def test_slices (self):
+        for size in range (1, 6):
+            results = []
+            for computer_type in (lmc.LMC, fusion.Fused_LMC):
+                client = batch.Batch_Client (computer_type = computer_type)
+                client.inputs = [5]
+                load (client.computer, countdown)
+                states = []
+                start = client.computer.run
+                while start (steps = size):
+                    states.append (state (client.computer))
+                    start = client.computer.resume
+                results.append ((states, client.outputs))
+            self.assertEqual (results [0], results [1])
+
+class Pause_Client (lmc.LMC_Client):
+    '''A client that pauses at each input.'''
+    def notify_input (self):
+        return False
+
+class Test_Pause (unittest.TestCase):
+    def test_input (self):
+        results = []
+        for computer_type in (lmc.LMC, fusion.Fused_LMC):
+            client = Pause_Client (computer_type = computer_type)
+            computer = client.computer
+            load (computer, store)
+            computer.run ()
+            states = [state (computer)]
+            for value in (5, 7, 0):
+                computer.set_input (value)
+                computer.resume ()
+                states.append (state (computer))
+            results.append (states)
+        self.assertEqual (results [0], results [1])
+
+if __name__ == '__main__':
+    unittest.main ()
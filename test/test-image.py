@@ -0,0 +1,161 @@
+# test-image.py - Unit tests for binary program images.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import tempfile
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import assemble
+from little_village import batch
+from little_village import image
+from little_village import lmc
+
+class Test_Image (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.file = os.path.join (self.temporary.name, 'program')
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def test_round_trip (self):
+        image.write_image (self.file, [901, 902, 0, 999])
+        self.assertTrue (image.is_image (self.file))
+        loaded = image.read_image (self.file)
+        self.assertEqual ((loaded.base, loaded.memory_size), (10, 100))
+        self.assertEqual (list (loaded.words), [901, 902, 0, 999])
+
+    def test_geometry (self):
+        image.write_image (self.file, [0xfff, 1], 16, 256)
+        loaded = image.read_image (self.file, 'L')
+        self.assertEqual ((loaded.base, loaded.memory_size), (16, 256))
+        self.assertEqual (loaded.words.typecode, 'L')
+        self.assertEqual (list (loaded.words), [0xfff, 1])
+
+    def test_empty (self):
+        image.write_image (self.file, [])
+        self.assertEqual (list (image.read_image (self.file).words), [])
+
+    def test_write_errors (self):
+        self.assertRaises (ValueError, image.write_image, self.file, [1000])
+        self.assertRaises (ValueError, image.write_image, self.file, [-1])
+        self.assertRaises (ValueError, image.write_image, self.file, 101*[0])
+
+    def bad (self, data):
+        with open (self.file, 'wb') as f:
+            f.write (data)
+        self.assertRaises (image.Bad_Image_File, image.read_image, self.file)
+
+    def test_bad_files (self):
+        self.bad (b'')
+        self.bad (b'LMCI')
+        self.bad (b'901\n902\n000\n')
+        image.write_image (self.file, [901, 902, 0])
+        with open (self.file, 'rb') as f:
+            data = f.read ()
+        # Truncated
+        self.bad (data [:-1])
+        # Damaged
+        self.bad (data [:-1] + bytes ([data [-1] ^ 1]))
+        # Another version
+        self.bad (data [:4] + bytes ([9]) + data [5:])
+
+    def test_out_of_range (self):
+        # Write a 999 for base 10 but claim it's for base 2.
+        image.write_image (self.file, [999])
+        with open (self.file, 'rb') as f:
+            data = bytearray (f.read ())
+        image.header.pack_into (data, 0, *((image.header.unpack_from (data) [:3])
+                                           + (2, 16)
+                                           + image.header.unpack_from (data) [5:]))
+        with open (self.file, 'wb') as f:
+            f.write (data)
+        self.assertRaises (image.Bad_Image_File, image.read_image, self.file)
+
+class Test_Load (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.file = os.path.join (self.temporary.name, 'square')
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def image_of (self, program, base = 10, memory_size = 100):
+        computer = lmc.LMC (base, memory_size)
+        computer.load (program)
+        image.write_image (self.file, computer.memory, base, memory_size)
+        return computer
+
+    def test_load (self):
+        text = self.image_of ('square')
+        computer = lmc.LMC ()
+        computer.memory [99] = 5
+        computer.load (self.file)
+        self.assertEqual (computer.memory, text.memory)
+
+    def test_run (self):
+        self.image_of ('square')
+        client = batch.Batch_Client ()
+        client.run (self.file, [3, 12, 0])
+        self.assertEqual (client.outputs, [9, 144])
+
+    def test_text (self):
+        computer = lmc.LMC ()
+        computer.load ('add')
+        self.assertEqual (list (computer.memory [:3]), [901, 306, 901])
+
+    def test_wrong_geometry (self):
+        self.image_of ('add')
+        computer = lmc.LMC (16, 256)
+        self.assertRaises (image.Bad_Image_File, computer.load, self.file)
+
+    def test_paged (self):
+        memory_size = 2*lmc.LMC.paged_size
+        image.write_image (self.file, [901, 902, 0], 10, memory_size)
+        computer = lmc.LMC (10, memory_size)
+        computer.load (self.file)
+        self.assertEqual (list (computer.memory [:4]), [901, 902, 0, 0])
+
+class Test_Assemble (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.file = os.path.join (self.temporary.name, 'add')
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def test_write_image (self):
+        asm = assemble.Assembler ()
+        with open ('../programs/add.asm') as f:
+            self.assertTrue (asm.assemble (f.readlines ()))
+        asm.write_image (self.file)
+        self.assertEqual (list (image.read_image (self.file).words), asm.code)
+
+    def test_command (self):
+        assemble.run ('test-image', ['--image', '../programs/add.asm', self.file])
+        client = batch.Batch_Client ()
+        client.run (self.file, [1, 2])
+        self.assertEqual (client.outputs, [3])
+
+if __name__ == '__main__':
+    unittest.main ()
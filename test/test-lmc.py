@@ -17,7 +17,9 @@
 # You should have received a copy of the GNU General Public License along with
 # Little Village.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
 import os
+import random
 import sys
 import unittest
 
@@ -26,6 +28,7 @@ sys.path.insert (0, os.path.abspath ('..'))
 
 from little_village import lmc
 from little_village import batch
+from little_village import compiler
 
 class Test_Initial (unittest.TestCase):
     '''Check the initial state of the computer.'''
@@ -82,6 +85,164 @@ class Test_Run (unittest.TestCase):
         # Should get the same answer the 2nd time.
         self.assertEqual (self.computer.output, 246)
 
+class Test_Decode (unittest.TestCase):
+    '''Check that the decoded instructions follow changes to memory.'''
+    def setUp (self):
+        self.computer = lmc.LMC ()
+        self.computer.load ('modify')
+
+    def test_load (self):
+        self.assertEqual (self.computer._decoded [0], (5, 5))
+        self.assertEqual (self.computer._decoded [3], (0, 0))
+        self.assertEqual (self.computer._decoded [5], (9, 2))
+
+    def test_store (self):
+        self.computer.run ()
+        self.assertEqual (self.computer.memory [3], 902)
+        self.assertEqual (self.computer._decoded [3], (9, 2))
+
+    def test_decode (self):
+        self.computer.memory [0] = 902
+        self.computer.decode ()
+        self.assertEqual (self.computer._decoded [0], (9, 2))
+
+class Test_Handlers (unittest.TestCase):
+    '''Check dispatch of opcodes that have no instruction.'''
+    def test_unused_opcode (self):
+        computer = lmc.LMC ()
+        computer.memory [0] = 450
+        computer.decode ()
+        self.assertTrue (computer.step ())
+        self.assertEqual (computer.counter, 1)
+
+    def test_small_memory (self):
+        # With 50 cells a 3-digit word can hold opcodes up to 19.
+        computer = lmc.LMC (10, 50)
+        self.assertEqual (len (computer._handlers), 20)
+        computer.memory [0] = 999
+        computer.decode ()
+        self.assertTrue (computer.step ())
+        self.assertEqual (computer.counter, 1)
+
+class Test_Snapshot (unittest.TestCase):
+    '''Test saving and restoring the state of the computer.'''
+    def setUp (self):
+        self.client = batch.Batch_Client ()
+        self.computer = self.client.computer
+        self.computer.load ('modify')
+
+    def test_compact (self):
+        self.assertEqual (self.computer.memory.typecode, 'H')
+        self.assertEqual (lmc.LMC (2, 16).memory.typecode, 'B')
+        self.assertRaises (AttributeError, setattr, self.computer, 'moo', 1)
+
+    def test_restore_loaded (self):
+        memory = self.computer.memory
+        self.computer.run ()
+        self.assertEqual (self.computer.memory [3], 902)
+        self.computer.restore ()
+        self.assertTrue (self.computer.memory is memory)
+        self.assertEqual (self.computer.memory [3], 0)
+        self.assertEqual (self.computer._decoded [3], (0, 0))
+        self.assertEqual (self.computer.counter, 0)
+        self.assertEqual (self.computer.accumulator, 0)
+        # The restored program runs the same way again.
+        self.computer.run ()
+        self.assertEqual (self.client.outputs, [42, 42])
+
+    def test_snapshot (self):
+        self.computer.step ()
+        self.computer.step ()
+        snapshot = self.computer.snapshot ()
+        self.computer.run ()
+        self.computer.restore (snapshot)
+        self.assertEqual (self.computer.counter, 2)
+        self.assertEqual (self.computer.accumulator, 902)
+        self.assertEqual (self.computer.memory [3], 902)
+        self.computer.resume ()
+        self.assertEqual (self.client.outputs, [42, 42])
+
+    def test_restore_unloaded (self):
+        computer = lmc.LMC ()
+        computer.memory [0] = 5
+        computer.restore ()
+        self.assertEqual (computer.memory [0], 0)
+
+class Test_Limits (unittest.TestCase):
+    '''Test the step limit and loop detection.'''
+    def setUp (self):
+        self.client = batch.Batch_Client ()
+        self.computer = self.client.computer
+
+    def spin (self, computer_type = lmc.LMC):
+        # A program that branches to itself forever.
+        computer = computer_type ()
+        computer.memory [0] = 600
+        computer.decode ()
+        return computer
+
+    def test_step_limit (self):
+        for fast in (False, True):
+            computer = self.spin ()
+            computer.max_steps = 1000
+            self.assertRaises (lmc.Step_Limit_Exceeded, computer.run, fast)
+            self.assertEqual (computer.steps, 1000)
+
+    def test_exact_limit (self):
+        # add takes 6 steps including HLT.
+        self.computer.max_steps = 6
+        self.client.run ('add', [1, 2])
+        self.assertEqual (self.computer.steps, 6)
+        self.computer.max_steps = 5
+        self.client.reset ()
+        self.assertRaises (lmc.Step_Limit_Exceeded,
+                           self.client.run, 'add', [1, 2])
+        self.assertEqual (self.client.outputs, [3])
+
+    def test_loop (self):
+        for fast in (False, True):
+            computer = self.spin ()
+            computer.loop_interval = 10
+            self.assertRaises (lmc.Infinite_Loop, computer.run, fast)
+            # The state is recorded at step 10 and seen again at step 20.
+            self.assertEqual (computer.steps, 20)
+
+    def test_no_false_loop (self):
+        self.computer.loop_interval = 1
+        self.client.run ('square', [5, 7, 0])
+        self.assertEqual (self.client.outputs, [25, 49])
+
+    def test_input_resets_loop (self):
+        # INP then BRA 0 repeats the same state except for the input.
+        self.computer.memory [0] = 901
+        self.computer.memory [1] = 600
+        self.computer.decode ()
+        self.computer.loop_interval = 2
+        self.client.inputs = [0, 0, 0]
+        self.assertRaises (batch.Not_Enough_Inputs, self.computer.run)
+        self.assertEqual (self.computer.steps, 7)
+
+    def test_long_loop (self):
+        # Add 1 to a cell forever.  The cell wraps after 1000 passes, so the
+        # states repeat every 4000 steps.
+        for fast in (False, True):
+            computer = lmc.LMC ()
+            for address, word in enumerate ([505, 106, 305, 600, 0, 0, 1]):
+                computer.memory [address] = word
+            computer.decode ()
+            computer.loop_interval = 1
+            self.assertRaises (lmc.Infinite_Loop, computer.run, fast)
+            self.assertGreater (computer.steps, 4000)
+            # Only one state is kept however long the loop is.
+            self.assertEqual (computer._seen [0], 3)
+
+    def test_message (self):
+        self.assertEqual (str (lmc.Step_Limit_Exceeded (10)),
+                          'Step limit exceeded: the program did not halt '
+                          'after 10 steps.')
+        self.assertEqual (str (lmc.Infinite_Loop (3, 10)),
+                          'Infinite loop at address 3 after 10 steps.')
+
 class Break_Client (batch.Batch_Client):
     '''A client that breaks execution at a specific line.'''
     def __init__ (self, line):
@@ -135,5 +296,340 @@ class Test_Break (unittest.TestCase):
         self.client.computer.step ()
         self.assertEqual (self.client.computer.counter, 5)
 
+class Pause_Client (batch.Batch_Client):
+    '''A client that pauses when input is needed.'''
+    def notify_input (self):
+        if len (self.inputs) == 0:
+            return False
+        return batch.Batch_Client.notify_input (self)
+
+class Test_Fast (unittest.TestCase):
+    '''Check that the fast run loop gives the same results as stepping.'''
+    def run_both (self, program, inputs):
+        results = []
+        for fast in (False, True):
+            client = batch.Batch_Client ()
+            client.inputs = list (inputs)
+            client.computer.load (program)
+            client.computer.run (fast)
+            computer = client.computer
+            results.append ((client.outputs, computer.counter,
+                             computer.accumulator, computer.overflow,
+                             computer.negative, computer.memory))
+        self.assertEqual (results [0], results [1])
+        return results [1]
+
+    def test_add (self):
+        self.assertEqual (self.run_both ('add', [123, 45])[0], [168])
+
+    def test_square (self):
+        self.assertEqual (self.run_both ('square', [3, 12, 0])[0], [9, 144])
+
+    def test_countdown (self):
+        outputs = self.run_both ('../programs/countdown', [3])[0]
+        self.assertEqual (outputs, [2, 1, 0])
+
+    def test_overflow (self):
+        # 600 * 600 wraps around.
+        self.assertEqual (self.run_both ('square', [600, 0])[0], [0])
+
+    def test_self_modifying (self):
+        # The program overwrites the HLT at address 3 with OUT.
+        outputs = self.run_both ('modify', [])[0]
+        self.assertEqual (outputs, [42])
+
+    def test_detect_hook (self):
+        # Break_Client overrides notify_step() so it must not run fast.
+        client = Break_Client (2)
+        client.run ('add', [1, 2])
+        self.assertEqual (client.computer.counter, 2)
+        self.assertTrue (lmc.LMC ()._has_step_hook () is False)
+        self.assertFalse (batch.Batch_Client ().computer._has_step_hook ())
+
+    def test_pause_for_input (self):
+        client = Pause_Client ()
+        client.inputs = [5]
+        client.computer.load ('add')
+        client.computer.run (True)
+        self.assertTrue (client.computer.waiting_for_input)
+        self.assertEqual (client.computer.counter, 3)
+        client.computer.set_input (6)
+        client.computer.resume (True)
+        self.assertEqual (client.outputs, [11])
+        self.assertEqual (client.computer.counter, 5)
+
+class Log_Break_Client (batch.Batch_Client):
+    '''A client that records breaks and continues.'''
+    def __init__ (self, computer_type = None):
+        batch.Batch_Client.__init__ (self, computer_type = computer_type)
+        self.breaks = []
+
+    def notify_break (self, kind, value):
+        self.breaks.append ((kind, value, self.computer.steps))
+        return True
+
+class Test_Breakpoints (unittest.TestCase):
+    '''Test stopping at breakpoints and watchpoints.'''
+    def start (self, client = None):
+        self.client = client or batch.Batch_Client ()
+        self.computer = self.client.computer
+        self.client.inputs = [3, 0]
+        self.computer.load ('square')
+
+    def test_breakpoint (self):
+        for fast in (True, False):
+            self.start ()
+            self.computer.breakpoints.add (6)
+            self.computer.run (fast)
+            self.assertEqual ((self.computer.counter, self.computer.steps),
+                              (6, 6))
+            # Resuming goes past the breakpoint to the next time around.
+            self.computer.resume (fast)
+            self.assertEqual ((self.computer.counter, self.computer.steps),
+                              (6, 15))
+            self.computer.breakpoints.clear ()
+            self.computer.resume (fast)
+            self.assertEqual (self.client.outputs, [9])
+
+    def test_breakpoint_at_limit (self):
+        # Reaching a breakpoint at the step limit reports the breakpoint first.
+        for fast in (True, False):
+            self.start ()
+            self.computer.breakpoints.add (6)
+            self.computer.max_steps = 6
+            self.computer.run (fast)
+            self.assertEqual ((self.computer.counter, self.computer.steps),
+                              (6, 6))
+            self.assertRaises (lmc.Step_Limit_Exceeded, self.computer.resume,
+                               fast)
+            self.assertEqual (self.computer.steps, 6)
+
+    def test_watch_cell (self):
+        for fast in (True, False):
+            self.start ()
+            self.computer.watched_cells.add (22)
+            self.computer.run (fast)
+            # Stopped after STA VALUE.
+            self.assertEqual ((self.computer.counter, self.computer.memory [22]),
+                              (6, 3))
+            self.computer.resume (fast)
+            self.assertEqual (self.client.outputs, [9])
+
+    def test_watch_value (self):
+        for fast in (True, False):
+            self.start ()
+            self.computer.watched_values.add (9)
+            self.computer.run (fast)
+            # Stopped after ADD VALUE makes the result 9.
+            self.assertEqual ((self.computer.counter,
+                               self.computer.accumulator), (8, 9))
+            self.assertEqual (self.client.outputs, [])
+            self.computer.resume (fast)
+            # And again after LDA RESULT.
+            self.assertEqual ((self.computer.counter,
+                               self.computer.accumulator), (16, 9))
+
+    def test_notify (self):
+        results = []
+        for (fast, computer_type) in ((True, None), (False, None),
+                                      (True, compiler.Compiled_LMC)):
+            self.start (Log_Break_Client (computer_type))
+            self.computer.breakpoints.update ([6, 17])
+            self.computer.watched_cells.add (20)
+            self.computer.watched_values.add (3)
+            self.computer.run (fast)
+            self.assertEqual (self.client.outputs, [9])
+            results.append (self.client.breaks)
+        self.assertEqual (results [0], results [1])
+        self.assertEqual (results [0], results [2])
+        self.assertEqual (results [0][:4],
+                          [(lmc.LMC.WATCH_CELL, 20, 3),
+                           (lmc.LMC.WATCH_ACCUMULATOR, 3, 4),
+                           (lmc.LMC.BREAKPOINT, 6, 6),
+                           (lmc.LMC.WATCH_ACCUMULATOR, 3, 8)])
+
+class Test_Execute (unittest.TestCase):
+    '''Test generating outputs from a stream of inputs.'''
+    def test_square (self):
+        computer = lmc.LMC ()
+        computer.load ('square')
+        self.assertEqual (list (computer.execute ([3, 12, 0])), [9, 144])
+        self.assertFalse (computer.waiting_for_input)
+
+    def test_lazy (self):
+        taken = []
+        def numbers ():
+            n = 1
+            while True:
+                taken.append (n)
+                yield n
+                n += 1
+        computer = compiler.Compiled_LMC ()
+        computer.load ('square')
+        outputs = computer.execute (numbers ())
+        self.assertEqual (next (outputs), 1)
+        self.assertEqual (taken, [1])
+        self.assertEqual (next (outputs), 4)
+        self.assertEqual (taken, [1, 2])
+        # An endless stream.
+        squares = itertools.islice (outputs, 20)
+        self.assertEqual (list (squares), [n*n for n in range (3, 23)])
+        self.assertEqual (len (taken), 22)
+
+    def test_out_of_input (self):
+        computer = lmc.LMC ()
+        computer.load ('square')
+        self.assertEqual (list (computer.execute (iter ([2, 5]))), [4, 25])
+        self.assertTrue (computer.waiting_for_input)
+
+    def test_client (self):
+        client = Log_Break_Client ()
+        computer = client.computer
+        computer.load ('square')
+        computer.breakpoints.add (17)
+        self.assertEqual (list (computer.execute ([4, 0])), [16])
+        self.assertTrue (computer.client is client)
+        self.assertEqual (client.outputs, [])
+        self.assertEqual ([b [:2] for b in client.breaks],
+                          [(lmc.LMC.BREAKPOINT, 17)])
+
+class Generic_LMC (lmc.LMC):
+    '''An LMC that doesn't use the bitwise path.'''
+    __slots__ = ()
+
+    def __init__ (self, base = 10, memory = 100):
+        lmc.LMC.__init__ (self, base, memory)
+        self._address_bits = self._word_bits = None
+        self._handlers = self._make_handlers ()
+
+class Test_Bitwise (unittest.TestCase):
+    '''Check that power-of-2 computers give the same results with bit
+    operations.'''
+    def run_random (self, computer_type, base, memory, seed, fast):
+        generator = random.Random (seed)
+        client = batch.Batch_Client (base, memory, computer_type)
+        computer = client.computer
+        computer.max_steps = 500
+        for address in range (memory):
+            computer.memory [address] = generator.randrange (computer.word_range)
+        computer.decode ()
+        client.inputs = [generator.randrange (computer.word_range)
+                         for i in range (20)]
+        error = None
+        try:
+            computer.run (fast)
+        except Exception as exception:
+            error = type (exception)
+        return (error, client.outputs, computer.counter, computer.accumulator,
+                computer.overflow, computer.negative, computer.steps,
+                list (computer.memory), list (computer._decoded))
+
+    def test_selected (self):
+        self.assertEqual (lmc.LMC (2, 16)._word_bits, 8)
+        self.assertEqual (lmc.LMC (16, 256)._address_bits, 8)
+        self.assertEqual (lmc.LMC (16, 100)._word_bits, None)
+        self.assertEqual (lmc.LMC ()._word_bits, None)
+
+    def test_same_results (self):
+        for (base, memory) in ((2, 16), (16, 256), (4, 64)):
+            for seed in range (100):
+                expected = self.run_random (Generic_LMC, base, memory, seed,
+                                            True)
+                for (computer_type, fast) in ((lmc.LMC, True),
+                                              (lmc.LMC, False),
+                                              (compiler.Compiled_LMC, True)):
+                    self.assertEqual (self.run_random (computer_type, base,
+                                                       memory, seed, fast),
+                                      expected)
+
+class Test_History (unittest.TestCase):
+    '''Test going back to earlier states.'''
+    def states (self, program, inputs):
+        '''Return the state after each step of a program.'''
+        client = batch.Batch_Client ()
+        client.inputs = list (inputs)
+        client.computer.load (program)
+        states = [self.state (client.computer)]
+        while client.computer.step ():
+            states.append (self.state (client.computer))
+        states.append (self.state (client.computer))
+        return states
+
+    def state (self, computer):
+        return ((computer.input, computer.output, computer.counter,
+                 computer.accumulator, computer.overflow, computer.negative,
+                 computer.steps), list (computer.memory),
+                list (computer._decoded))
+
+    def run_with_history (self, program, inputs, fast, interval, limit = None):
+        client = batch.Batch_Client ()
+        client.computer.start_history (interval, limit)
+        client.inputs = list (inputs)
+        client.computer.load (program)
+        client.computer.run (fast)
+        return client.computer
+
+    def test_goto (self):
+        states = self.states ('square', [3, 4, 0])
+        for fast in (False, True):
+            computer = self.run_with_history ('square', [3, 4, 0], fast, 7)
+            self.assertEqual (computer.steps, states [-1][0][-1])
+            for step in range (computer.steps, -1, -1):
+                computer.goto (step)
+                self.assertEqual (self.state (computer), states [step])
+
+    def test_step_back (self):
+        computer = self.run_with_history ('modify', [], True, 2)
+        self.assertEqual (computer.memory [3], 902)
+        computer.step_back (4)
+        self.assertEqual (computer.steps, 1)
+        self.assertEqual (computer.memory [3], 0)
+        self.assertEqual (computer._decoded [3], (0, 0))
+        # Going forward in the history is allowed too.
+        computer.goto (5)
+        self.assertEqual (computer.memory [3], 902)
+
+    def test_new_future (self):
+        client = batch.Batch_Client ()
+        computer = client.computer
+        computer.start_history (4)
+        client.run ('square', [3, 0])
+        end = computer.steps
+        # Go to just after the first input and square 5 instead of 3.
+        computer.goto (4)
+        computer.set_input (5)
+        client.inputs = [0]
+        computer.resume ()
+        self.assertEqual (client.outputs, [9, 25])
+        self.assertEqual (computer.history.end, computer.steps)
+        self.assertTrue (computer.steps > end)
+        computer.goto (4)
+        self.assertEqual (computer.accumulator, 5)
+
+    def test_compiled (self):
+        client = batch.Batch_Client (computer_type = compiler.Compiled_LMC)
+        computer = client.computer
+        computer.start_history (5)
+        client.run ('modify', [])
+        computer.goto (0)
+        client.outputs = []
+        computer.resume ()
+        self.assertEqual (client.outputs, [42])
+
+    def test_limit (self):
+        computer = self.run_with_history ('square', [3, 4, 0], True, 5, 2)
+        self.assertEqual (len (computer.history.checkpoints), 2)
+        first = computer.history.first
+        self.assertTrue (first > 0)
+        computer.goto (first)
+        self.assertEqual (computer.steps, first)
+        self.assertRaises (lmc.Step_Not_Recorded, computer.goto, first - 1)
+        self.assertRaises (lmc.Step_Not_Recorded, computer.goto,
+                           computer.history.end + 1)
+
+    def test_no_history (self):
+        computer = lmc.LMC ()
+        self.assertRaises (lmc.Step_Not_Recorded, computer.step_back)
+
 if __name__ == '__main__':
     unittest.main ()
@@ -0,0 +1,211 @@
+# test-loops.py - Unit tests for the LMC back-end that accelerates loops.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import random
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import lmc
+from little_village import loops
+
+from engines import load, run, state
+
+# Count down past zero with LDA, SUB, STA, BRP, then output the counter.
+countdown = [ 901, 310, 510, 211, 310, 802, 510, 902, 0, 0,
+              0, 1 ]
+
+# Add 3 to the accumulator until it's 0.
+carry = [ 510, 111, 704, 601, 902, 0, 0, 0, 0, 0,
+          7, 3 ]
+
+# Like countdown, but the loop writes to its own code.
+modify = [ 901, 310, 510, 211, 303, 802, 510, 902, 0, 0,
+           0, 1 ]
+
+# Add 2 to an odd number until it's 0, which never happens.
+forever = [ 510, 111, 310, 705, 600, 0, 0, 0, 0, 0,
+            1, 2 ]
+
+class Test_Accelerated (unittest.TestCase):
+    '''Check that accelerated programs give the same results as LMC.'''
+    def check (self, program, inputs = [], **options):
+        expected = run (lmc.LMC, program, inputs, **options)
+        self.assertEqual (run (loops.Accelerated_LMC, program, inputs,
+                               **options), expected)
+        return expected
+
+    def test_square (self):
+        self.assertEqual (self.check ('square', [3, 12, 600, 0]) [0],
+                          [9, 144, 0])
+        self.assertEqual (self.check ('square', [999, 0]) [0], [1])
+
+    def test_countdown (self):
+        outputs, error, (counter, accumulator, overflow, negative,
+                         steps, memory) = self.check (countdown, [500])
+        self.assertEqual (outputs, [999])
+        self.assertEqual (steps, 2 + 4*501 + 3)
+
+    def test_carry (self):
+        # 7 + 3*331 is 1000.
+        self.assertEqual (self.check (carry) [2][4], 1 + 3*330 + 4)
+
+    def test_modify (self):
+        self.check (modify, [5])
+
+    def test_step_limit (self):
+        for limit in (1, 5, 100, 1001, 2005):
+            self.assertEqual (self.check (countdown, [500],
+                                          max_steps = limit) [1],
+                              lmc.Step_Limit_Exceeded)
+
+    def test_infinite_loop (self):
+        # The accumulator goes through every even value and never gets to 0.
+        program = [ 510, 111, 704, 601, 902, 0, 0, 0, 0, 0,
+                    7, 2 ]
+        self.assertEqual (self.check (program, loop_interval = 100) [1],
+                          lmc.Infinite_Loop)
+
+    def test_forever (self):
+        self.assertEqual (self.check (forever, max_steps = 10**6) [1],
+                          lmc.Step_Limit_Exceeded)
+        self.assertEqual (self.check (forever, loop_interval = 100) [1],
+                          lmc.Infinite_Loop)
+
+    def test_slices (self):
+        for size in (1, 7, 100, 1000):
+            results = []
+            for computer_type in (lmc.LMC, loops.Accelerated_LMC):
+                client = batch.Batch_Client (computer_type = computer_type)
+                client.inputs = [500]
+                load (client.computer, countdown)
+                states = []
+                start = client.computer.run
+                while start (steps = size):
+                    states.append (state (client.computer))
+                    start = client.computer.resume
+                results.append ((states, client.outputs))
+            self.assertEqual (results [0], results [1])
+
+    def test_random (self):
+        # Loops of random LDA, ADD, SUB and STA instructions on random data
+        # with a test in the middle or at the end.
+        for (base, memory) in ((10, 100), (2, 16), (16, 256)):
+            for seed in range (100):
+                r = random.Random (seed)
+                data = list (range (memory - 6, memory))
+                body = [r.choice ([lmc.LMC.LDA, lmc.LMC.ADD, lmc.LMC.SUB,
+                                   lmc.LMC.STA])*memory + r.choice (data)
+                        for i in range (r.randint (2, 7))]
+                branch = r.choice ([lmc.LMC.BRZ, lmc.LMC.BRP])
+                if r.randint (0, 1):
+                    test = r.randint (0, len (body))
+                    body = (body [:test] + [branch*memory + len (body) + 3]
+                            + body [test:] + [lmc.LMC.BRA*memory + 1])
+                else:
+                    body += [branch*memory + 1]
+                program = [lmc.LMC.LDA*memory + data [0]] + body
+                program += (memory - len (program))*[0]
+                word_range = lmc.LMC (base, memory).word_range
+                for address in data:
+                    program [address] = r.randrange (word_range)
+                self.check (program, base = base, memory = memory,
+                            max_steps = r.choice ([50, 1000, 100000]))
+
+class Test_Analysis (unittest.TestCase):
+    '''Check which loops are accelerated.'''
+    def setUp (self):
+        self.client = batch.Batch_Client (computer_type = loops.Accelerated_LMC)
+        self.computer = self.client.computer
+
+    def test_square (self):
+        load (self.computer, 'square')
+        loop = self.computer._find_loop (14)
+        self.assertEqual ((loop.start, loop.length, loop.branch, loop.stay),
+                          (6, 9, lmc.LMC.BRZ, False))
+        # RESULT goes up by VALUE and COUNT by ONE.
+        self.assertEqual (loop.steps, { 19:{ 22:1 }, 20:{ 21:1 } })
+        self.assertEqual (loop.accumulator, None)
+        self.assertEqual (loop.value, { 20:1, 21:1, 22:-1 })
+
+    def test_countdown (self):
+        load (self.computer, countdown)
+        loop = self.computer._find_loop (5)
+        self.assertEqual ((loop.branch, loop.stay, loop.value, loop.operand),
+                          (lmc.LMC.BRP, True, { 10:1 }, { 11:1 }))
+
+    def test_carry (self):
+        load (self.computer, carry)
+        self.assertEqual (self.computer._find_loop (3).accumulator, { 11:1 })
+
+    def test_rejected (self):
+        load (self.computer, modify)
+        self.assertEqual (self.computer._find_loop (5), None)
+        # Loops with I/O aren't accelerated.
+        load (self.computer, '../programs/countdown')
+        self.assertEqual (self.computer._find_loop (4), None)
+
+    def test_invalidate (self):
+        load (self.computer, countdown)
+        self.client.inputs = [5]
+        self.computer.run ()
+        self.assertTrue (self.computer._loops [5])
+        self.computer._store (3, 111)
+        self.assertEqual (self.computer._loops [5], False)
+
+class Skip_LMC (loops.Accelerated_LMC):
+    '''An Accelerated_LMC that records the steps it skips.'''
+    __slots__ = ('skipped',)
+
+    def _skip (self, loop):
+        steps = self.steps
+        loops.Accelerated_LMC._skip (self, loop)
+        self.skipped.append (self.steps - steps)
+
+class Test_Skip (unittest.TestCase):
+    def test_skip (self):
+        client = batch.Batch_Client (computer_type = Skip_LMC)
+        client.computer.skipped = []
+        load (client.computer, countdown)
+        client.inputs = [500]
+        client.computer.run ()
+        # The branch back after the first pass skips all but the last two
+        # passes.
+        self.assertEqual (client.computer.skipped, [4*498, 0])
+        self.assertEqual (client.outputs, [999])
+
+    def test_no_limit (self):
+        # With no step limit and no slice there's nothing to skip to.
+        client = batch.Batch_Client (computer_type = Skip_LMC)
+        computer = client.computer
+        computer.skipped = []
+        load (computer, forever)
+        computer._next_check = computer._following_check (0)
+        computer._skip (computer._find_loop (4))
+        self.assertEqual (computer.skipped, [0])
+        # A slice ends where it was asked to.
+        self.assertTrue (computer.run (steps = 10**6))
+        self.assertEqual (computer.steps, 10**6)
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,161 @@
+# test-memory.py - Unit tests for paged memory.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import array
+import os
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import compiler
+from little_village import lmc
+from little_village.memory import Paged_Memory
+
+class Test_Paged_Memory (unittest.TestCase):
+    def setUp (self):
+        self.memory = Paged_Memory (20, array.array ('H', 8*[0]))
+
+    def test_lazy (self):
+        self.assertEqual (len (self.memory), 20)
+        self.assertEqual (self.memory [13], 0)
+        self.memory [13] = 0
+        self.assertEqual (list (self.memory.pages ()), [])
+        self.memory [13] = 7
+        self.assertEqual (self.memory [13], 7)
+        self.assertEqual ([start for (start, page) in self.memory.pages ()],
+                          [8])
+        self.assertEqual (list (self.memory), 13*[0] + [7] + 6*[0])
+
+    def test_range (self):
+        for index in (-1, 20, 23, 100):
+            self.assertRaises (IndexError, self.memory.__getitem__, index)
+            self.assertRaises (IndexError, self.memory.__setitem__, index, 1)
+        # The last page is short.
+        self.memory [19] = 1
+        self.assertRaises (IndexError, self.memory.__getitem__, 20)
+        self.assertRaises (IndexError, self.memory.__setitem__, 20, 1)
+
+    def test_copy (self):
+        self.memory [3] = 5
+        copy = self.memory [:]
+        self.assertTrue (isinstance (copy, Paged_Memory))
+        copy [3] = 6
+        self.assertEqual (self.memory [3], 5)
+        self.memory [:] = copy
+        self.assertEqual (self.memory [3], 6)
+        self.memory [2:4] = [1, 2]
+        self.assertEqual (self.memory [1:5], [0, 1, 2, 0])
+        self.assertRaises (ValueError, self.memory.__setitem__,
+                           slice (2, 4), [1])
+
+    def test_regions (self):
+        for address in (1, 2, 7, 8, 9, 19):
+            self.memory [address] = address
+        self.memory [8] = 0
+        self.assertEqual (list (self.memory.regions ()),
+                          [(1, [1, 2]), (7, [7]), (9, [9]), (19, [19])])
+
+    def test_tobytes (self):
+        other = self.memory [:]
+        self.memory [9] = 4
+        other [9] = 4
+        self.assertEqual (self.memory.tobytes (), other.tobytes ())
+        other [10] = 1
+        self.assertNotEqual (self.memory.tobytes (), other.tobytes ())
+
+    def test_page_size (self):
+        self.assertRaises (ValueError, Paged_Memory, 20, 6*[0])
+
+class Dense_LMC (lmc.LMC):
+    '''An LMC that never pages its memory.'''
+    __slots__ = ()
+    paged_size = 10**9
+
+class Test_Large (unittest.TestCase):
+    '''Test a computer with a large memory.'''
+    size = 200000
+
+    def load (self, computer):
+        '''Load a program that sums its inputs in far-apart cells.'''
+        size = self.size
+        code = [9*size + 1,          # 0: INP
+                3*size + 150000,     # 1: STA 150000
+                9*size + 1,          # 2: INP
+                7*size + 8,          # 3: BRZ 8
+                1*size + 150000,     # 4: ADD 150000
+                3*size + 150000,     # 5: STA 150000
+                6*size + 2,          # 6: BRA 2
+                0,
+                5*size + 150000,     # 8: LDA 150000
+                3*size + 199999,     # 9: STA 199999
+                9*size + 2,          # 10: OUT
+                0]                   # 11: HLT
+        for (address, word) in enumerate (code):
+            computer.memory [address] = word
+        computer.decode ()
+
+    def run_program (self, computer_type, inputs):
+        client = batch.Batch_Client (10, self.size, computer_type)
+        self.load (client.computer)
+        client.inputs = list (inputs)
+        client.computer.run ()
+        return client
+
+    def test_paged (self):
+        computer = lmc.LMC (10, self.size)
+        self.assertTrue (isinstance (computer.memory, Paged_Memory))
+        self.assertTrue (isinstance (computer._decoded, Paged_Memory))
+        self.assertFalse (isinstance (lmc.LMC ().memory, Paged_Memory))
+
+    def test_same_as_dense (self):
+        dense = self.run_program (Dense_LMC, [5, 6, 7, 0])
+        self.assertEqual (dense.outputs, [18])
+        for computer_type in (lmc.LMC, compiler.Compiled_LMC):
+            client = self.run_program (computer_type, [5, 6, 7, 0])
+            self.assertEqual (client.outputs, dense.outputs)
+            self.assertEqual (list (client.computer.memory),
+                              list (dense.computer.memory))
+            self.assertEqual (client.computer.counter, dense.computer.counter)
+        self.assertEqual (len (list (client.computer.memory.pages ())), 3)
+
+    def test_history (self):
+        client = batch.Batch_Client (10, self.size)
+        client.computer.start_history (3)
+        self.load (client.computer)
+        client.inputs = [5, 6, 0]
+        client.computer.run ()
+        client.computer.goto (4)
+        self.assertEqual (client.computer.memory [150000], 5)
+        self.assertEqual (client.computer.memory [199999], 0)
+        self.assertEqual (client.computer._decoded [150000], (0, 5))
+
+    def test_str (self):
+        client = self.run_program (lmc.LMC, [4, 0])
+        rows = str (client.computer).split ('\n')[4:]
+        self.assertEqual (len (rows), 4)
+        self.assertTrue (rows [0].startswith ('000000: 1800001 0750000'))
+        self.assertEqual (rows [2], '150000: 0000004' + 9*' 0000000')
+        self.assertEqual (rows [3], '199990:' + 9*' 0000000' + ' 0000004')
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,146 @@
+# test-profiler.py - Unit tests for LMC profiling and its reports.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import compiler
+from little_village import lmc
+from little_village import profiler
+from little_village import prompt
+
+def profile_run (program, inputs, fast, computer_type = None):
+    client = batch.Batch_Client (computer_type = computer_type)
+    client.computer.start_profile ()
+    client.run (program, inputs)
+    return client.computer.profile, client.computer
+
+class Test_Profile (unittest.TestCase):
+    def test_counts (self):
+        # square with input 3 goes around the loop 3 times.
+        profile, computer = profile_run ('square', [3, 0], True)
+        self.assertEqual (profile.steps, computer.steps)
+        self.assertEqual (profile.addresses [6], 3)
+        self.assertEqual (profile.addresses [0], 2)
+        self.assertEqual (profile.opcodes [lmc.LMC.IO], 3)
+        # BRZ ENDLOOP is taken once, BRA LOOP twice.
+        self.assertEqual (profile.taken [13], 1)
+        self.assertEqual (profile.not_taken [13], 2)
+        self.assertEqual (profile.taken [14], 2)
+        # BRZ END is taken on the last input.
+        self.assertEqual (profile.taken [4], 1)
+        self.assertEqual (profile.not_taken [4], 1)
+
+    def test_step_matches_fast (self):
+        fast = profile_run ('square', [3, 4, 0], True)[0]
+        client = batch.Batch_Client ()
+        client.computer.start_profile ()
+        client.inputs = [3, 4, 0]
+        client.computer.load ('square')
+        client.computer.run (False)
+        slow = client.computer.profile
+        for field in ('steps', 'addresses', 'opcodes', 'taken', 'not_taken'):
+            self.assertEqual (getattr (fast, field), getattr (slow, field))
+
+    def test_compiled (self):
+        profile = profile_run ('square', [3, 0], True,
+                               compiler.Compiled_LMC)[0]
+        self.assertEqual (profile.addresses [6], 3)
+
+    def test_stop (self):
+        computer = lmc.LMC ()
+        profile = computer.start_profile ()
+        self.assertTrue (computer.stop_profile () is profile)
+        self.assertEqual (computer.profile, None)
+
+class Test_Report (unittest.TestCase):
+    def test_report (self):
+        profile, computer = profile_run ('square', [3, 0], True)
+        text = profiler.report (profile, computer)
+        lines = text.split ('\n')
+        self.assertEqual (lines [0], 'Profile: %d steps' % profile.steps)
+        self.assertTrue ('Loops:' in lines)
+        # The outer loop goes back to START; the inner one to LOOP.
+        start = lines.index ('Loops:')
+        self.assertTrue (lines [start + 1].startswith ('   0-17 '))
+        self.assertTrue (lines [start + 2].startswith ('   6-14 '))
+        self.assertTrue (lines [start + 2].endswith (
+            '2 times back to  6  LDA 19'))
+
+    def test_source (self):
+        source = profiler.find_source ('../programs/square')
+        self.assertEqual (source [6].split (), ['LOOP', 'LDA', 'RESULT', ';',
+                                                'Load', 'the', 'RESULT'])
+        self.assertEqual (profiler.find_source ('square'), None)
+
+    def test_source_geometry (self):
+        # A program that only fits in a memory of more than 100 cells.
+        with tempfile.TemporaryDirectory () as directory:
+            program = os.path.join (directory, 'long')
+            with open (program + '.asm', 'w') as f:
+                f.write (120*'        LDA X\n' + 'X       DAT 5\n')
+            source = profiler.find_source (program, 10, 1000)
+        self.assertEqual (len (source), 121)
+        self.assertEqual (source [120], 'X       DAT 5')
+
+    def test_disassemble (self):
+        self.assertEqual (profiler.disassemble (5, 19), 'LDA 19')
+        self.assertEqual (profiler.disassemble (9, 1), 'INP')
+        self.assertEqual (profiler.disassemble (0, 0), 'HLT')
+
+class Test_Front_Ends (unittest.TestCase):
+    def setUp (self):
+        self.stdout = sys.stdout
+        sys.stdout = io.StringIO ()
+
+    def tearDown (self):
+        sys.stdout.close ()
+        sys.stdout = self.stdout
+
+    def test_batch (self):
+        batch.run ('test-profiler', ['--profile', '../programs/square', 2, 0])
+        lines = sys.stdout.getvalue ().split ('\n')
+        self.assertEqual (lines [0], '4')
+        self.assertTrue (lines [2].startswith ('Profile: '))
+        self.assertTrue ('LOOP    LDA RESULT' in sys.stdout.getvalue ())
+
+    def test_prompt (self):
+        client = prompt.Prompt_Client ()
+        client.parse ('load ../programs/add')
+        client.parse ('profile')
+        client.computer.input = 4
+        client.computer.connect (None)
+        client.parse ('run')
+        client.parse ('profile')
+        client.parse ('profile off')
+        lines = sys.stdout.getvalue ().split ('\n')
+        self.assertEqual (lines [0], 'Profiling on')
+        self.assertEqual (lines [1], 'Profile: 6 steps')
+        self.assertEqual (lines [-2], 'Profiling off')
+        self.assertEqual (client.computer.profile, None)
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,105 @@
+# test-prompt.py - Unit tests for the command prompt.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import lmc
+from little_village import prompt
+
+class Test_History (unittest.TestCase):
+    def setUp (self):
+        self.stdout = sys.stdout
+        sys.stdout = io.StringIO ()
+        self.client = prompt.Prompt_Client ()
+        self.client.parse ('load add')
+        # Take input from the input register.
+        self.client.computer.input = 4
+        self.client.computer.connect (None)
+
+    def tearDown (self):
+        sys.stdout.close ()
+        sys.stdout = self.stdout
+
+    def lines (self):
+        return sys.stdout.getvalue ().split ('\n')[:-1]
+
+    def test_back (self):
+        self.client.parse ('run')
+        self.assertEqual (self.client.computer.steps, 6)
+        self.client.parse ('back')
+        self.client.parse ('back 3')
+        self.assertEqual (self.lines (),
+                          ['Step 5  counter: 5  accumulator: 8',
+                           'Step 2  counter: 2  accumulator: 4'])
+
+    def test_goto (self):
+        self.client.parse ('step')
+        self.client.parse ('step')
+        self.client.parse ('goto 0')
+        self.client.parse ('goto 2')
+        self.client.parse ('goto 3')
+        self.assertEqual (self.lines (),
+                          ['Step 1  counter: 1  accumulator: 4',
+                           'Step 2  counter: 2  accumulator: 4',
+                           'Step 0  counter: 0  accumulator: 0',
+                           'Step 2  counter: 2  accumulator: 4',
+                           'Step 3 is not in the history.',
+                           'Steps from 0 to 2 are available.'])
+
+    def test_break (self):
+        self.client.computer.connect (self.client)
+        self.client.notify_input = lambda: 4
+        self.client.parse ('break 3')
+        self.client.parse ('watch 6')
+        self.client.parse ('run')
+        self.client.parse ('continue')
+        self.client.parse ('watch 6')
+        self.client.parse ('continue')
+        self.assertEqual (self.lines (),
+                          ['3', '6',
+                           'Wrote 4 to 6',
+                           'Step 2  counter: 2  accumulator: 4',
+                           'Breakpoint at 3',
+                           'Step 3  counter: 3  accumulator: 4',
+                           '',
+                           '8'])
+
+    def test_limit (self):
+        # A program that branches to itself forever.
+        computer = self.client.computer
+        computer.memory [0] = 600
+        computer.decode ()
+        history = computer.history
+        computer.max_steps = (prompt.Prompt_Client.history_limit + 5)*1000
+        self.client.parse ('step')
+        self.assertRaises (lmc.Step_Limit_Exceeded, computer.resume)
+        self.assertEqual (len (history.checkpoints),
+                          prompt.Prompt_Client.history_limit)
+        self.client.parse ('goto 0')
+        self.assertEqual (self.lines () [-2], 'Step 0 is not in the history.')
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,128 @@
+# test-source.py - Unit tests for running assembly-language programs.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import lmc
+from little_village import source
+
+class Test_Source (unittest.TestCase):
+    def setUp (self):
+        self.temporary = tempfile.TemporaryDirectory ()
+        self.file = os.path.join (self.temporary.name, 'program.asm')
+        source.assembled.clear ()
+        self.start = (source.assembled.hits, source.assembled.misses)
+
+    def tearDown (self):
+        self.temporary.cleanup ()
+
+    def write (self, text):
+        with open (self.file, 'w') as f:
+            f.write (text)
+
+    def counts (self):
+        return (source.assembled.hits - self.start [0],
+                source.assembled.misses - self.start [1])
+
+    def test_same_code (self):
+        for program in ('add', 'square'):
+            computer = lmc.LMC ()
+            computer.load ('../programs/' + program)
+            machine = list (computer.memory)
+            source.load (computer, '../programs/%s.asm' % program)
+            self.assertEqual (list (computer.memory), machine)
+
+    def test_run (self):
+        client = batch.Batch_Client ()
+        source.run_file (client, '../programs/square.asm', [3, 12, 0])
+        self.assertEqual (client.outputs, [9, 144])
+
+    def test_geometry (self):
+        client = batch.Batch_Client (10, 1000)
+        source.run_file (client, '../programs/add.asm', [3, 4])
+        self.assertEqual (client.outputs, [7])
+        self.assertEqual (client.computer.memory [0], 9001)
+        # The same source for the default geometry is assembled again.
+        client = batch.Batch_Client ()
+        source.run_file (client, '../programs/add.asm', [3, 4])
+        self.assertEqual (client.computer.memory [0], 901)
+        self.assertEqual (self.counts (), (0, 2))
+
+    def test_cached (self):
+        self.write ('INP\nOUT\nHLT\n')
+        for n in range (2):
+            self.assertEqual (list (source.assemble_file (self.file)),
+                              [901, 902, 0])
+        self.assertEqual (self.counts (), (1, 1))
+        # A changed source is assembled again.
+        self.write ('INP\nOUT\nOUT\nHLT\n')
+        self.assertEqual (list (source.assemble_file (self.file)),
+                          [901, 902, 902, 0])
+        self.assertEqual (self.counts (), (1, 2))
+
+    def test_warnings (self):
+        self.write ('INP\nOUT\n')
+        warnings = io.StringIO ()
+        source.assemble_file (self.file, warnings)
+        self.assertTrue ('No HLT' in warnings.getvalue ())
+
+    def test_errors (self):
+        self.write ('INP\nMOO\nHLT\n')
+        self.assertRaises (source.Assembly_Error, source.assemble_file,
+                           self.file)
+        self.write ('BRA NOWHERE\n')
+        self.assertRaises (source.Assembly_Error, source.assemble_file,
+                           self.file)
+        self.assertEqual (self.counts (), (0, 2))
+
+    def test_command (self):
+        stdout = sys.stdout
+        try:
+            sys.stdout = io.StringIO ()
+            source.run ('test-source', ['../programs/add.asm', '1', '2'])
+            self.assertEqual (sys.stdout.getvalue (), '3\n')
+        finally:
+            sys.stdout = stdout
+
+class Test_Load_Code (unittest.TestCase):
+    def test_load_code (self):
+        computer = lmc.LMC ()
+        computer.memory [5] = 7
+        computer.load_code ([901, 902, 0])
+        self.assertEqual (list (computer.memory [:6]), [901, 902, 0, 0, 0, 7])
+        computer.memory [0] = 0
+        computer.restore ()
+        self.assertEqual (computer.memory [0], 901)
+
+    def test_errors (self):
+        computer = lmc.LMC ()
+        self.assertRaises (lmc.Instruction_Out_Of_Range, computer.load_code,
+                           [1000])
+        self.assertRaises (IndexError, computer.load_code, 101*[0])
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,135 @@
+# test-trace.py - Unit tests for binary execution traces.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import compiler
+from little_village import lmc
+from little_village import trace
+
+def read (file):
+    with open (file, 'rb') as f:
+        return f.read ()
+
+class Test_Trace (unittest.TestCase):
+    def setUp (self):
+        self.directory = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.directory)
+
+    def record (self, name, inputs, fast = None, computer_type = None,
+                buffer_size = 4096):
+        '''Run square with tracing and return the trace file and computer.'''
+        file = os.path.join (self.directory, name)
+        client = batch.Batch_Client (computer_type = computer_type)
+        client.computer.start_trace (file, buffer_size)
+        client.inputs = inputs
+        client.computer.load ('square')
+        client.computer.run (fast)
+        client.computer.stop_trace ()
+        return file, client.computer
+
+    def test_records (self):
+        file, computer = self.record ('fast', [3, 0])
+        with trace.Trace_Reader (file) as steps:
+            self.assertEqual (len (steps), computer.steps)
+            self.assertEqual ((steps.base, steps.memory_size), (10, 100))
+            # LDA ZERO
+            first = steps [0]
+            self.assertEqual ((first.counter, first.opcode, first.accumulator),
+                              (0, lmc.LMC.LDA, 0))
+            self.assertEqual (first.address, None)
+            # STA RESULT
+            self.assertEqual ((steps [1].address, steps [1].value), (19, 0))
+            # INP
+            self.assertEqual ((steps [3].opcode, steps [3].accumulator),
+                              (lmc.LMC.IO, 3))
+            # The last step is the HLT.
+            self.assertEqual ((steps [-1].counter, steps [-1].opcode), (18, 0))
+            # COUNT - VALUE is negative until the last time around.
+            self.assertEqual ([s.negative for s in steps
+                               if s.counter == 12], [True, True, False])
+            self.assertEqual (len (list (steps)), len (steps))
+            self.assertRaises (IndexError, lambda: steps [len (steps)])
+
+    def test_find (self):
+        file, computer = self.record ('fast', [3, 0])
+        with trace.Trace_Reader (file) as steps:
+            # Stores to RESULT from START, the loop, and START again.
+            writes = list (steps.find (write = 19))
+            self.assertEqual ([steps [s].value for s in writes],
+                              [0, 3, 6, 9, 0])
+            self.assertEqual (list (steps.find (counter = 6)), [6, 15, 24])
+            self.assertEqual (list (steps.find (counter = 6, start = 7)),
+                              [15, 24])
+            self.assertEqual (list (steps.find (opcode = lmc.LMC.IO)),
+                              [3, 33, 38])
+
+    def test_same_on_all_paths (self):
+        fast = read (self.record ('fast', [3, 4, 0])[0])
+        self.assertEqual (read (self.record ('step', [3, 4, 0], False)[0]),
+                          fast)
+        self.assertEqual (read (self.record ('compiled', [3, 4, 0], None,
+                                             compiler.Compiled_LMC)[0]), fast)
+        # Flushing in small blocks gives the same file.
+        self.assertEqual (read (self.record ('small', [3, 4, 0],
+                                             buffer_size = 3)[0]), fast)
+
+    def test_profile_and_trace (self):
+        file = os.path.join (self.directory, 'both')
+        client = batch.Batch_Client ()
+        profile = client.computer.start_profile ()
+        client.computer.start_trace (file)
+        client.run ('square', [3, 0])
+        client.computer.stop_trace ()
+        with trace.Trace_Reader (file) as steps:
+            self.assertEqual (len (steps), profile.steps)
+
+    def test_bad_file (self):
+        file = os.path.join (self.directory, 'bad')
+        for contents in (b'', b'LMCT', b'not a trace file'):
+            with open (file, 'wb') as f:
+                f.write (contents)
+            self.assertRaises (trace.Bad_Trace_File, trace.Trace_Reader, file)
+
+    def test_batch (self):
+        file = os.path.join (self.directory, 'batch')
+        stdout = sys.stdout
+        sys.stdout = io.StringIO ()
+        try:
+            batch.run ('test-trace', ['--trace', file, 'square', 2, 0])
+            self.assertEqual (sys.stdout.getvalue (), '4\n')
+        finally:
+            sys.stdout = stdout
+        with trace.Trace_Reader (file) as steps:
+            self.assertEqual (list (steps.find (opcode = lmc.LMC.IO)),
+                              [3, 24, 29])
+
+if __name__ == '__main__':
+    unittest.main ()
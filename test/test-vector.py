@@ -0,0 +1,95 @@
+# test-vector.py - Unit tests for the lockstep LMC back-end.
+#
+# Copyright 2013 Sam Varner
+#
+# This file is part of Little Village
+#
+# Little Village is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# Little Village is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Little Village.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import random
+import sys
+import unittest
+
+# Allow importing modules from the source directory
+sys.path.insert (0, os.path.abspath ('..'))
+
+from little_village import batch
+from little_village import lmc
+
+try:
+    import numpy
+    from little_village import vector
+except ImportError:
+    numpy = None
+
+def run_batch (program, inputs):
+    '''Return the outputs and error from a Batch_Client.'''
+    client = batch.Batch_Client ()
+    try:
+        client.run (program, list (inputs))
+    except Exception as error:
+        return client.outputs, error
+    return client.outputs, None
+
+@unittest.skipIf (numpy is None, 'NumPy is not installed')
+class Test_Vector (unittest.TestCase):
+    def check (self, program, inputs):
+        computer = vector.Vector_LMC ()
+        computer.load (program)
+        results = computer.run (inputs)
+        self.assertEqual (len (results), len (inputs))
+        for (lane, result) in zip (inputs, results):
+            (outputs, error) = run_batch (program, lane)
+            self.assertEqual (result [0], outputs)
+            self.assertEqual (type (result [1]), type (error))
+            self.assertEqual (str (result [1]), str (error))
+        return results
+
+    def test_add (self):
+        results = self.check ('add', [[1, 2], [123, 45], [999, 999]])
+        self.assertEqual ([r [0] for r in results], [[3], [168], [998]])
+
+    def test_square (self):
+        # Lanes loop different numbers of times.
+        random.seed (1)
+        inputs = [[random.randint (0, 40) for i in range (3)] + [0]
+                  for lane in range (50)]
+        self.check ('square', inputs)
+
+    def test_countdown (self):
+        self.check ('../programs/countdown', [[n] for n in range (12)])
+
+    def test_errors (self):
+        results = self.check ('add', [[1], [], [1, 2, 3], [5, 'x'], [5, 1000],
+                                      ['7', '8']])
+        self.assertEqual (results [5][0], [15])
+
+    def test_self_modifying (self):
+        self.check ('modify', [[], [1]])
+
+    def test_step_limit (self):
+        computer = vector.Vector_LMC ()
+        computer.load ('square')
+        results = computer.run ([[1, 0], [50, 0]], 100)
+        self.assertEqual (results [0], ([1], None))
+        self.assertEqual (type (results [1][1]), lmc.Step_Limit_Exceeded)
+
+    def test_no_lanes (self):
+        computer = vector.Vector_LMC ()
+        computer.load ('add')
+        self.assertEqual (computer.run ([]), [])
+
+if __name__ == '__main__':
+    unittest.main ()